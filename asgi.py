@@ -0,0 +1,189 @@
+"""
+ASGI entry point: one process holds many in-flight cartoonize calls without a thread per request.
+
+    pip install -r requirements.txt   # includes uvicorn and httpx
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+POST /api/cartoonize runs as a coroutine (main.api_cartoonize_async): the upstream edit call is
+awaited on the event loop, async jobs are tasks, CPU stages go to the thread/process pools. The
+job long-poll and SSE stream are coroutines too, so waiting guests hold no thread. Every other
+route is the regular Flask view, called through a small WSGI bridge on a worker thread.
+"""
+import io
+import os
+import sys
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.exceptions import HTTPException
+from main import app as flask_app, api_cartoonize_async, api_job_status_async, api_job_events_async
+from utils import gpt_async, logsink, warmup
+
+ASGI_THREADS = int(os.getenv("ASGI_THREADS", "32"))  # blocking work: Flask views, cache I/O, PIL stages
+
+# Flask endpoint -> coroutine serving it in ASGI mode (same URL rules, methods and responses)
+ASYNC_VIEWS = {
+    "api_cartoonize": api_cartoonize_async,
+    "api_job_status": api_job_status_async,
+    "api_job_events": api_job_events_async,
+}
+
+_urls = flask_app.url_map.bind("localhost")
+
+
+def _async_view(scope):
+    """(coroutine view, URL arguments) when ASYNC_VIEWS serves this request, else (None, None)."""
+    try:
+        endpoint, args = _urls.match(scope["path"], scope["method"])
+    except HTTPException:  # 404 / 405 / redirects: leave them to Flask
+        return None, None
+    view = ASYNC_VIEWS.get(endpoint)
+    return (view, args) if view else (None, None)
+
+
+def _environ(scope, body: bytes) -> dict:
+    """WSGI environ for an ASGI http scope with the request body already read."""
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        key = name.decode("latin-1").upper().replace("-", "_")
+        if key in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            if key == "CONTENT_TYPE":
+                environ[key] = value.decode("latin-1")
+            continue
+        key = "HTTP_" + key
+        value = value.decode("latin-1")
+        environ[key] = environ[key] + "," + value if key in environ else value
+    return environ
+
+
+def _messages(wsgi_app, environ):
+    """Run a WSGI app and yield its response as ASGI messages (start, body chunks, end)."""
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        started[:] = [int(status.split(" ", 1)[0]),
+                      [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]]
+
+    body = wsgi_app(environ, start_response)
+    try:
+        head_sent = False
+        for chunk in body:
+            if not head_sent:
+                yield {"type": "http.response.start", "status": started[0], "headers": started[1]}
+                head_sent = True
+            if chunk:
+                yield {"type": "http.response.body", "body": chunk, "more_body": True}
+        if not head_sent:
+            yield {"type": "http.response.start", "status": started[0], "headers": started[1]}
+        yield {"type": "http.response.body", "body": b"", "more_body": False}
+    finally:
+        if hasattr(body, "close"):
+            body.close()
+
+
+async def _send_threaded(wsgi_app, environ, send) -> None:
+    """Call a (blocking) WSGI app on one worker thread; chunks are sent as they are produced."""
+    loop = asyncio.get_running_loop()
+
+    def drain():
+        for message in _messages(wsgi_app, environ):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    await asyncio.to_thread(drain)
+
+
+async def _call_async_view(view, environ, args):
+    """Dispatch like Flask does (before/after_request hooks, error handling) around an async view."""
+    with flask_app.request_context(environ):
+        try:
+            try:
+                rv = flask_app.preprocess_request()
+                if rv is None:
+                    rv = await view(**args)
+            except Exception as e:
+                rv = flask_app.handle_user_exception(e)
+            return flask_app.process_response(flask_app.make_response(rv))
+        except Exception as e:
+            return flask_app.handle_exception(e)
+
+
+async def _read_body(receive, limit: int):
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if limit and size > limit:
+            return False
+        chunks.append(chunk)
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+async def _lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            asyncio.get_running_loop().set_default_executor(
+                ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix="asgi"))
+            warmup.start()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await gpt_async.close()
+            await asyncio.to_thread(logsink.close)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def _send_async_body(resp, send) -> None:
+    """Send a response whose body is an async generator (the SSE stream) chunk by chunk."""
+    await send({"type": "http.response.start", "status": resp.status_code,
+                "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in resp.headers.to_wsgi_list()]})
+    async for chunk in resp.response:
+        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    body = await _read_body(receive, flask_app.config.get("MAX_CONTENT_LENGTH") or 0)
+    if body is None:
+        return  # client went away
+    if body is False:
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"text/plain")]})
+        await send({"type": "http.response.body", "body": b"Request Entity Too Large"})
+        return
+
+    environ = _environ(scope, body)
+    view, args = _async_view(scope)
+    if view is None:
+        return await _send_threaded(flask_app, environ, send)
+    resp = await _call_async_view(view, environ, args)
+    if hasattr(resp.response, "__aiter__"):
+        return await _send_async_body(resp, send)
+    for message in _messages(resp, environ):
+        await send(message)
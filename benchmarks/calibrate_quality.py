@@ -0,0 +1,140 @@
+"""
+Derive the per-scale decision bands used by utils.quality's reduced-resolution gate.
+
+The corpus mixes scene types, so that one picture's statistics don't set the bands:
+the captures (default: static/captures), synthetic webcam portraits (benchmarks.suite)
+and procedural textures with detail at every scale (standing in for foliage or fabric), each rendered
+at the camera resolutions the gate actually reduces: JPEG only, and each size scored at
+the scale _pick_scale chooses for it (1/2 from 1280 px, 1/4 from 2560, 1/8 from 5120).
+Every scene is varied by defocus blur, sensor noise and exposure gain (JPEG quality 85).
+Each variant is scored at full resolution (the reference verdict) and at its reduced scale.
+The band for a scale is the range of reduced scores where both verdicts occur (for blur),
+or the threshold widened by the largest full-vs-reduced difference (for brightness, a
+plain mean); outside it the reduced score alone reproduces the full-resolution verdict.
+
+    python -m benchmarks.calibrate_quality [capture_dir ...]    # ~25 min on one core
+"""
+import os
+import sys
+import glob
+import math
+import itertools
+
+import cv2
+import numpy as np
+
+from benchmarks.suite import synthetic_photo
+from utils.quality import BLUR_THRESHOLD, DARK_THRESHOLD, QUALITY_MIN_SIDE, _REDUCED_FLAGS, _metrics, _pick_scale
+
+# Long sides per scale: webcams (1/2), phones at 5 and 12 MP (1/4), a 24 MP DSLR (1/8)
+SIZES = [(1280, 720), (1920, 1080), (2592, 1944), (4032, 3024), (6000, 4000)]
+BLUR_SIGMAS = [0, 0.7, 1.2, 1.8, 2.5, 3.5, 5.0]
+NOISE = [0, 3, 6]
+GAINS = [0.6, 1.0, 1.3]
+JPEG_QUALITY = 85
+
+
+def _synthetic(seed):
+    def render(size):
+        return cv2.imdecode(np.frombuffer(synthetic_photo(size, seed=seed), np.uint8), cv2.IMREAD_COLOR)
+    return render
+
+
+def _textured(seed, detail):
+    """Value noise summed over octaves (a 1/f-like spectrum, as in natural scenes), with a colour cast."""
+    def render(size):
+        w, h = size
+        rng = np.random.default_rng(seed)
+        out = np.zeros((h, w), np.float32)
+        cells, amp = 4, 1.0
+        while cells < max(w, h) // 2:
+            grid = rng.random((max(2, cells * h // w), cells), dtype=np.float32)
+            out += amp * cv2.resize(grid, (w, h), interpolation=cv2.INTER_CUBIC)
+            cells, amp = cells * 2, amp * detail
+        out = (out - out.min()) / (out.max() - out.min() + 1e-6) * 200 + 25
+        return np.clip(np.dstack([out * 0.9, out, out * 1.05]), 0, 255).astype(np.uint8)
+    return render
+
+
+def _capture(path):
+    src = cv2.imread(path)
+
+    def render(size):
+        return cv2.resize(src, size, interpolation=cv2.INTER_CUBIC)
+    return render
+
+
+def scenes(dirs):
+    paths = [p for d in dirs for p in sorted(glob.glob(os.path.join(d, "*"))) if cv2.imread(p) is not None]
+    out = {os.path.basename(p): _capture(p) for p in paths}
+    out.update({f"portrait{s}": _synthetic(s) for s in (0,)})
+    out.update({f"texture{s}": _textured(s, detail) for s, detail in ((0, 0.55), (1, 0.7), (2, 0.85))})
+    return out
+
+
+def variants(src):
+    rng = np.random.default_rng(0)
+    base = src.astype(np.float32)
+    for sigma, noise, gain in itertools.product(BLUR_SIGMAS, NOISE, GAINS):
+        im = base * gain
+        if sigma:
+            im = cv2.GaussianBlur(im, (0, 0), sigma)
+        if noise:
+            im = im + rng.normal(0, noise, im.shape).astype(np.float32)
+        ok, buf = cv2.imencode(".jpg", np.clip(im, 0, 255).astype(np.uint8), [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+        yield buf.tobytes()
+
+
+def band(pairs, threshold):
+    """pairs: (full-res score, reduced score). Returns (lo, hi) of the ambiguous reduced range."""
+    below = [r for f, r in pairs if f < threshold]
+    above = [r for f, r in pairs if f >= threshold]
+    lo = min(above) if above else float("inf")
+    hi = max(below) if below else float("-inf")
+    return (lo, hi) if lo <= hi else ((lo + hi) / 2, (lo + hi) / 2)
+
+
+def deviation_band(pairs, threshold, margin=0.05):
+    """Band of +/- the largest full-vs-reduced difference seen (for scale-invariant scores)."""
+    dev = max(abs(f - r) for f, r in pairs) if pairs else 0.0
+    return threshold - dev - margin, threshold + dev + margin
+
+
+def main(argv=None):
+    dirs = (argv if argv is not None else sys.argv[1:]) or [os.path.join("static", "captures")]
+    by_scale = {s: [] for s in _REDUCED_FLAGS}  # (full blur, full brightness, reduced blur, reduced brightness)
+    for name, render in scenes(dirs).items():
+        for size in SIZES:
+            s = _pick_scale(size, "JPEG")
+            if s not in _REDUCED_FLAGS:
+                continue
+            for data in variants(render(size)):
+                arr = np.frombuffer(data, np.uint8)
+                full = _metrics(cv2.cvtColor(cv2.imdecode(arr, cv2.IMREAD_COLOR), cv2.COLOR_BGR2GRAY))
+                by_scale[s].append(full + _metrics(cv2.imdecode(arr, _REDUCED_FLAGS[s])))
+        print(f"  {name}: done", file=sys.stderr)
+
+    total = sum(len(rows) for rows in by_scale.values())
+    decided_total = 0
+    print(f"{len(scenes(dirs))} scenes, {total} variants (JPEG q{JPEG_QUALITY}, QUALITY_MIN_SIDE={QUALITY_MIN_SIDE})")
+    for s, rows in by_scale.items():
+        if not rows:
+            continue
+        b_lo, b_hi = band([(fb, rb) for fb, _, rb, _ in rows], BLUR_THRESHOLD)
+        # brightness only decides once the blur check passed
+        d_lo, d_hi = deviation_band([(fm, rm) for fb, fm, _, rm in rows if fb >= BLUR_THRESHOLD], DARK_THRESHOLD)
+        # Decided at reduced resolution: outside the blur band, and (when it passes) outside the dark band
+        decided = sum(1 for _, _, rb, rm in rows
+                      if rb < b_lo or (rb > b_hi and not d_lo <= rm <= d_hi))
+        decided_total += decided
+        # rounded outward, so the printed band still covers every ambiguous score
+        print(f"scale {s}: {len(rows)} variants"
+              f"  BLUR_BANDS ({math.floor(b_lo * 10) / 10:.1f}, {math.ceil(b_hi * 10) / 10:.1f})"
+              f"  DARK_BANDS ({math.floor(d_lo * 100) / 100:.2f}, {math.ceil(d_hi * 100) / 100:.2f})"
+              f"  decided without full decode: {decided / len(rows):.0%}")
+    print(f"all scales: decided without full decode: {decided_total / total:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Cold start: how long a restarted server takes to answer, and how slow its first real requests are.
+
+Each run starts the app in a fresh process (fresh cache directory, no API key, local fallback on)
+and measures, from the moment the process is launched:
+  first_response_s  first 200 from GET / (what the kiosk browser waits for after a restart)
+  info_s            first 200 from GET /api/info (the page's settings check)
+  then, right away, the latency of the first POST /api/cartoonize (quality gate + fallback) and
+  of the first POST /api/print-sheet, and the server's own warm-up report from /api/info.
+Each mode runs with WARMUP=true, then WARMUP=false, so the warm-up's effect shows side by side.
+
+    python -m benchmarks.cold_start [--runs 3] [--modes wsgi,asgi] [--delay 0] [--out cold.json]
+
+--delay waits that long after the first response before the first cartoonize, like a guest who
+walks up a few seconds after the restart (the warm-up has had time to finish).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+import httpx
+
+from benchmarks.suite import synthetic_photo
+from benchmarks.load_test import _free_port
+
+
+def _launch(mode: str, port: int, warmup: bool, proc_workers: str):
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "",
+        "GPT_ALLOW_FALLBACK_WITHOUT_KEY": "true",
+        "CACHE_DIR": tempfile.mkdtemp(prefix=f"cold_{mode}_"),
+        "LOG_DIR": tempfile.mkdtemp(prefix=f"cold_{mode}_logs_"),
+        "WARMUP": "true" if warmup else "false",
+    }
+    if proc_workers:
+        env["PROC_WORKERS"] = proc_workers
+    else:
+        env.pop("PROC_WORKERS", None)  # the app's default (one per CPU); benchmarks.suite sets 0
+    if mode == "wsgi":
+        cmd = [sys.executable, "-c",
+               f"import main; main.warmup.start(); main.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "asgi:app", "--host", "127.0.0.1", "--port", str(port),
+               "--log-level", "warning", "--no-access-log"]
+    return subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def _first_ok(client, path: str, t0: float, timeout: float = 60) -> float:
+    """Seconds from t0 until GET path first answers 200 (polled every 10 ms)."""
+    while time.perf_counter() - t0 < timeout:
+        try:
+            if client.get(path, timeout=5).status_code == 200:
+                return time.perf_counter() - t0
+        except httpx.TransportError:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError(f"no response from {path} within {timeout}s")
+
+
+def _timed_post(client, path: str, **kwargs) -> tuple:
+    t = time.perf_counter()
+    r = client.post(path, **kwargs)
+    return time.perf_counter() - t, r.status_code
+
+
+def cold_start(mode: str, warmup: bool, photo: bytes, delay: float, proc_workers: str) -> dict:
+    port = _free_port()
+    t0 = time.perf_counter()
+    proc = _launch(mode, port, warmup, proc_workers)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=120) as client:
+            first = _first_ok(client, "/", t0)
+            info = _first_ok(client, "/api/info", t0)
+            time.sleep(delay)
+            cartoon_s, cartoon_status = _timed_post(
+                client, "/api/cartoonize", files={"image": ("p.jpg", photo, "image/jpeg")},
+                data={"response": "binary"})
+            sheet_s, sheet_status = _timed_post(
+                client, "/api/print-sheet", files={"image": ("s.jpg", photo, "image/jpeg")})
+            report = client.get("/api/info").json()["warmup"]
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    return {
+        "first_response_s": round(first, 3),
+        "info_s": round(info, 3),
+        "first_cartoonize_s": round(cartoon_s, 3),
+        "first_print_sheet_s": round(sheet_s, 3),
+        "statuses": [cartoon_status, sheet_status],
+        "server_first_response_s": report["first_response_s"],
+        "warmup_state": report["state"],
+        "warmup_s": report["seconds"],
+        "warmup_steps": report["steps"],
+    }
+
+
+def _summary(runs: list) -> dict:
+    out = {}
+    for key in ("first_response_s", "info_s", "first_cartoonize_s", "first_print_sheet_s",
+                "server_first_response_s"):
+        values = [r[key] for r in runs if r[key] is not None]
+        out[key] = round(statistics.median(values), 3) if values else None
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--modes", default="wsgi,asgi")
+    ap.add_argument("--delay", type=float, default=0.0, help="seconds between first response and first cartoonize")
+    ap.add_argument("--proc-workers", default="", help="PROC_WORKERS for the server (default: the app's)")
+    ap.add_argument("--out", help="write results as JSON")
+    args = ap.parse_args(argv)
+
+    photo = synthetic_photo((640, 480))
+    results = {}
+    for mode in args.modes.split(","):
+        for warmup in (True, False):
+            runs = [cold_start(mode, warmup, photo, args.delay, args.proc_workers) for _ in range(args.runs)]
+            name = f"{mode} warmup={'on' if warmup else 'off'}"
+            results[name] = {"median": _summary(runs), "runs": runs}
+            print(f"{name:<17} " + "  ".join(f"{k}={v}" for k, v in results[name]["median"].items()))
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+"""
+Load test: concurrent /api/cartoonize calls against a local fake images API, threaded (WSGI) vs async (ASGI).
+
+The fake API answers every edit after --delay seconds with a small PNG, so requests spend their
+time waiting on "upstream" the way real ones do. Each mode runs the app in its own process with
+the same cache directory layout (fresh per run); the server's thread count and RSS are sampled
+while the requests are in flight. Needs httpx and uvicorn.
+
+    python -m benchmarks.load_test [--requests 128] [--concurrency 64] [--delay 2] [--match-caps]
+
+--match-caps raises the threaded server's upstream cap (GPT_MAX_CONCURRENCY, default 4) to
+--concurrency, so both modes may wait on the same number of calls and only the cost differs.
+"""
+import io
+import os
+import sys
+import json
+import time
+import base64
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+
+import httpx
+from PIL import Image
+
+from benchmarks.suite import synthetic_photo
+
+
+# ---- Fake images API ----
+def _fake_png() -> str:
+    buf = io.BytesIO()
+    Image.new("RGBA", (256, 256), (200, 120, 80, 255)).save(buf, format="PNG")
+    return base64.b64encode(buf.getvalue()).decode("ascii")
+
+
+async def _serve_edit(reader, writer, delay: float, body: bytes):
+    """Minimal HTTP/1.1 keep-alive handler: read a request with Content-Length, answer after delay."""
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in head.split(b"\r\n")[1:]:
+                name, _, value = line.partition(b":")
+                if name.strip().lower() == b"content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            await asyncio.sleep(delay)
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                         b"Content-Length: %d\r\n\r\n" % len(body) + body)
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+def start_fake_api(port: int, delay: float) -> None:
+    body = json.dumps({"data": [{"b64_json": _fake_png()}]}).encode()
+
+    def run():
+        async def main():
+            server = await asyncio.start_server(lambda r, w: _serve_edit(r, w, delay, body),
+                                                "127.0.0.1", port, backlog=1024)
+            async with server:
+                await server.serve_forever()
+        asyncio.run(main())
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+# ---- App server ----
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_app(mode: str, port: int, api_port: int, concurrency: int, match_caps: bool):
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "load-test",
+        "GPT_IMAGES_EDIT_URL": f"http://127.0.0.1:{api_port}/v1/images/edits",
+        "CACHE_DIR": tempfile.mkdtemp(prefix=f"load_{mode}_"),
+        "LOG_DIR": tempfile.mkdtemp(prefix=f"load_{mode}_logs_"),
+        "GPT_CROP_TO_SUBJECT": "false",  # measure the serving model, not GrabCut on one core
+        "PROC_WORKERS": "0",
+    }
+    if match_caps:
+        env["GPT_MAX_CONCURRENCY"] = str(concurrency)
+    if mode == "wsgi":
+        cmd = [sys.executable, "-c",
+               f"import main; main.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "asgi:app", "--host", "127.0.0.1", "--port", str(port),
+               "--log-level", "warning", "--no-access-log"]
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/info", timeout=1)
+            return proc
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"{mode} server did not start")
+
+
+def _cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")  # utime + stime
+
+
+def _proc_status(pid: int) -> dict:
+    out = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("Threads", "VmRSS"):
+                out[key] = int(value.split()[0])
+    return out
+
+
+# ---- Client ----
+async def run_load(port: int, pid: int, photos, concurrency: int) -> dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    sem = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], {}
+    peak = {"Threads": 0, "VmRSS": 0}
+    done = asyncio.Event()
+
+    async def sample():
+        while not done.is_set():
+            st = _proc_status(pid)
+            for k in peak:
+                peak[k] = max(peak[k], st.get(k, 0))
+            await asyncio.sleep(0.05)
+
+    async def one(client, photo):
+        async with sem:
+            t0 = time.perf_counter()
+            r = await client.post("/api/cartoonize", files={"image": ("p.jpg", photo, "image/jpeg")},
+                                  data={"qualityGate": "false", "response": "binary"})
+            latencies.append(time.perf_counter() - t0)
+            key = r.status_code if r.headers.get("X-Fallback") != "true" else f"{r.status_code} fallback"
+            statuses[key] = statuses.get(key, 0) + 1
+
+    cpu0 = _cpu_seconds(pid)
+    sampler = asyncio.create_task(sample())
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=600) as client:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(client, p) for p in photos))
+        wall = time.perf_counter() - t0
+    done.set()
+    await sampler
+    cpu = _cpu_seconds(pid) - cpu0
+
+    latencies.sort()
+    return {
+        "requests": len(photos),
+        "wall_s": round(wall, 2),
+        "throughput_rps": round(len(photos) / wall, 2),
+        "latency_p50_s": round(statistics.median(latencies), 2),
+        "latency_p95_s": round(latencies[int(0.95 * (len(latencies) - 1))], 2),
+        "server_cpu_ms_per_request": round(1000 * cpu / len(photos), 1),
+        "peak_threads": peak["Threads"],
+        "peak_rss_mb": round(peak["VmRSS"] / 1024, 1),
+        "statuses": {str(k): v for k, v in statuses.items()},
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--requests", type=int, default=128)
+    ap.add_argument("--concurrency", type=int, default=64)
+    ap.add_argument("--delay", type=float, default=2.0, help="fake upstream latency (s)")
+    ap.add_argument("--modes", default="wsgi,asgi")
+    ap.add_argument("--match-caps", action="store_true")
+    ap.add_argument("--out", help="write results as JSON")
+    args = ap.parse_args(argv)
+
+    api_port = _free_port()
+    start_fake_api(api_port, args.delay)
+    # Distinct photos: identical ones would be coalesced by the single-flight guard
+    photos = [synthetic_photo((320, 240), seed=i) for i in range(args.requests)]
+
+    results = {}
+    for mode in args.modes.split(","):
+        port = _free_port()
+        proc = start_app(mode, port, api_port, args.concurrency, args.match_caps)
+        try:
+            results[mode] = asyncio.run(run_load(port, proc.pid, photos, args.concurrency))
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+        print(f"{mode:<5} " + "  ".join(f"{k}={v}" for k, v in results[mode].items()))
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
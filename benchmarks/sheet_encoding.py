@@ -0,0 +1,64 @@
+"""
+Compare encode time and output size of the A4 sheet for each encoding setting.
+
+    python -m benchmarks.sheet_encoding [--repeat 3]
+"""
+import os
+import io
+import sys
+import time
+import argparse
+import tempfile
+
+os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="bench_cache_"))
+
+from PIL import Image, ImageDraw
+
+from utils.image_sheet import make_a4_sheet, sheet_encoding, describe_encoding, _encode_sheet
+
+SETTINGS = [
+    {"format": "png", "compress_level": 9, "optimize": True},   # previous behaviour
+    {"format": "png", "compress_level": 6, "optimize": False},
+    {"format": "png", "compress_level": 1, "optimize": False},  # default
+    {"format": "png", "compress_level": 0, "optimize": False},
+    {"format": "jpeg", "quality": 92},
+    {"format": "webp", "quality": 90},
+]
+
+
+def synthetic_sticker(size=1536) -> bytes:
+    """Cartoon-like RGBA sticker: flat color regions on a transparent background."""
+    im = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+    d = ImageDraw.Draw(im)
+    d.ellipse([size * 0.2, size * 0.1, size * 0.8, size * 0.75], fill=(240, 190, 150, 255), outline=(20, 20, 20, 255), width=8)
+    d.rectangle([size * 0.25, size * 0.7, size * 0.75, size], fill=(40, 110, 200, 255))
+    d.ellipse([size * 0.35, size * 0.3, size * 0.45, size * 0.38], fill=(30, 30, 30, 255))
+    d.ellipse([size * 0.55, size * 0.3, size * 0.65, size * 0.38], fill=(30, 30, 30, 255))
+    buf = io.BytesIO()
+    im.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args(argv)
+
+    sheet = make_a4_sheet(synthetic_sticker(), {"theme": "gold", "border": "thin"})
+    rgb = Image.open(io.BytesIO(sheet)).convert("RGB")
+
+    print(f"{'encoding':<44} {'ms':>9} {'KiB':>9}")
+    for setting in SETTINGS:
+        enc = sheet_encoding({"encoding": setting})
+        best = None
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            out = _encode_sheet(rgb, enc)
+            dt = time.perf_counter() - t0
+            best = dt if best is None else min(best, dt)
+        print(f"{describe_encoding(enc):<44} {best * 1000:>9.1f} {len(out) / 1024:>9.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,323 @@
+"""
+Benchmark suite: quality gate, local fallback, tile composition, A4 sheet/PDF rendering and cache ops.
+
+Every case runs on synthetic fixture images (no network, no API key) and reports median/min/max
+wall time plus peak memory: growth of the process peak RSS during the case (native buffers
+included; Linux only, via /proc/self/clear_refs) and the Python-heap peak from tracemalloc.
+Results are written as JSON; --compare prints the change against an earlier run.
+
+    python -m benchmarks.suite [--only tile] [--repeat 5] [--out bench.json] [--compare old.json]
+                               [--cache-sizes 1000,10000,100000]
+"""
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import itertools
+import statistics
+import subprocess
+import tracemalloc
+import multiprocessing
+
+# Everything runs in this process, on a throwaway cache
+os.environ["PROC_WORKERS"] = "0"
+os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="bench_cache_"))
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from benchmarks.sheet_encoding import SETTINGS as ENCODINGS, synthetic_sticker
+
+PHOTO_SIZES = [(640, 480), (1280, 720), (1920, 1080), (4000, 3000)]
+SHAPES = ["circle", "rounded"]
+THEMES = ["none", "gold", "neon", "brand"]
+BORDERS = ["none", "thin", "medium", "thick", "dotted"]
+CACHE_SIZES = [1000, 10000, 100000]
+
+
+# ---- Fixtures ----
+def synthetic_photo(size, fmt="JPEG", seed=0) -> bytes:
+    """Webcam-like portrait: lit background gradient, head-and-shoulders shapes, sensor noise."""
+    w, h = size
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:h, 0:w].astype(np.float32)
+    bg = 90 + 80 * (xx / w) * (1 - yy / (2 * h))
+    arr = np.dstack([bg, bg * 0.95, bg * 0.9])
+    im = Image.fromarray(np.clip(arr, 0, 255).astype(np.uint8))
+    d = ImageDraw.Draw(im)
+    d.ellipse([w * 0.38, h * 0.18, w * 0.62, h * 0.58], fill=(205, 160, 130))
+    d.rectangle([w * 0.25, h * 0.6, w * 0.75, h], fill=(40, 50, 70))
+    d.ellipse([w * 0.44, h * 0.32, w * 0.48, h * 0.36], fill=(30, 25, 25))
+    d.ellipse([w * 0.52, h * 0.32, w * 0.56, h * 0.36], fill=(30, 25, 25))
+    noisy = np.asarray(im, np.float32) + rng.normal(0, 4, (h, w, 3))
+    im = Image.fromarray(np.clip(noisy, 0, 255).astype(np.uint8))
+    buf = io.BytesIO()
+    im.save(buf, format=fmt, **({"quality": 90} if fmt == "JPEG" else {"compress_level": 6}))
+    return buf.getvalue()
+
+
+# ---- Measurement ----
+def _rss_peak_reset() -> bool:
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")  # resets VmHWM to the current RSS
+        return True
+    except OSError:
+        return False
+
+
+def _status_kb(field: str):
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def measure(name, fn, repeat, **params):
+    """Run fn once cold, then `repeat` times; one extra untimed run under tracemalloc."""
+    t0 = time.perf_counter()
+    fn()
+    cold = time.perf_counter() - t0
+
+    times = []
+    can_reset = _rss_peak_reset()
+    rss_before = _status_kb("VmRSS")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    rss_peak = _status_kb("VmHWM")
+
+    tracemalloc.start()
+    fn()
+    py_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    result = {
+        "name": name,
+        "params": params,
+        "repeat": repeat,
+        "cold_ms": round(cold * 1000, 3),
+        "median_ms": round(statistics.median(times) * 1000, 3),
+        "min_ms": round(min(times) * 1000, 3),
+        "max_ms": round(max(times) * 1000, 3),
+        "peak_rss_kb": (rss_peak - rss_before) if can_reset and rss_peak and rss_before else None,
+        "py_peak_kb": round(py_peak / 1024, 1),
+    }
+    print(f"{name:<34} {json.dumps(params, sort_keys=True):<62} {result['median_ms']:>10.2f} ms"
+          f"  rss +{result['peak_rss_kb'] or 0:>7} KiB")
+    return result
+
+
+# ---- Cases ----
+def bench_quality(repeat):
+    from utils.quality import assess_quality
+    for size, fmt in itertools.product(PHOTO_SIZES, ["JPEG", "PNG"]):
+        photo = synthetic_photo(size, fmt)
+        yield measure("quality.assess_quality", lambda: assess_quality(photo), repeat,
+                      size=f"{size[0]}x{size[1]}", format=fmt.lower())
+
+
+def bench_fallback(repeat):
+    from utils.gpt_image import _local_cartoon_fallback
+    for size in PHOTO_SIZES:
+        photo = synthetic_photo(size)
+        yield measure("gpt_image._local_cartoon_fallback", lambda: _local_cartoon_fallback(photo), repeat,
+                      size=f"{size[0]}x{size[1]}")
+
+
+def bench_tiles(repeat):
+    from utils.image_sheet import _compose_sticker_tile, _sheet_layout
+    sticker = synthetic_sticker()
+    tile_size = _sheet_layout()["tile_size"]
+    for shape, theme, border in itertools.product(SHAPES, THEMES, BORDERS):
+        yield measure("image_sheet._compose_sticker_tile",
+                      lambda: _compose_sticker_tile(sticker, tile_size, shape=shape, border=border, theme=theme),
+                      repeat, shape=shape, theme=theme, border=border)
+    for shape in SHAPES:
+        yield measure("image_sheet._compose_sticker_tile",
+                      lambda: _compose_sticker_tile(sticker, tile_size, shape=shape, theme="gold",
+                                                    branding=True, brand_text="Photo Booth"),
+                      repeat, shape=shape, theme="gold", border="none", branding=True)
+
+
+def _uncached(module):
+    """Disable the finished-output disk cache and the tile memo so every call renders."""
+    from utils import cache
+    module.cache_get = lambda *a, **k: None
+    module.cache_set = lambda *a, **k: None
+    cache._mem.clear()
+    return cache
+
+
+def bench_sheet(repeat):
+    from utils import image_sheet
+    cache = _uncached(image_sheet)
+    sticker = synthetic_sticker()
+    options = {"theme": "gold", "border": "thin"}
+
+    def render(enc):
+        cache._mem.clear()
+        image_sheet.make_a4_sheet(sticker, {**options, "encoding": enc})
+
+    sheet = image_sheet._compose_page([image_sheet._cached_tile(sticker, image_sheet._sheet_layout()["tile_size"],
+                                                                **image_sheet._sheet_options(options))] * 4,
+                                      image_sheet._sheet_layout()).convert("RGB")
+    for enc in ENCODINGS:
+        e = image_sheet.sheet_encoding({"encoding": enc})
+        yield measure("image_sheet._encode_sheet", lambda: image_sheet._encode_sheet(sheet, e), repeat,
+                      encoding=image_sheet.describe_encoding(e))
+    yield measure("image_sheet.make_a4_sheet", lambda: render({}), repeat, options=options, tile_cache="cold")
+
+
+def bench_pdf(repeat):
+    from utils import pdf_sheet, batch_sheet
+    _uncached(pdf_sheet)
+    sticker = synthetic_sticker()
+    for options in ({}, {"theme": "neon", "border": "dotted", "branding": True, "brand_text": "Photo Booth"}):
+        yield measure("pdf_sheet.make_a4_pdf", lambda: pdf_sheet.make_a4_pdf(sticker, options), repeat,
+                      options=options)
+    guests = [synthetic_sticker(1024 + i) for i in range(8)]
+    yield measure("batch_sheet.stream_batch_pdf",
+                  lambda: b"".join(batch_sheet.stream_batch_pdf(guests, {"grid": {"cols": 3, "rows": 3}})),
+                  max(1, repeat // 2), guests=len(guests), grid="3x3")
+
+
+def _cache_worker(n, repeat, conn):
+    """Child process (own CACHE_DIR): fill the cache with n entries, then time get/set/sweep."""
+    from utils import cache
+    db = cache._db()  # open (and adopt the empty root) before the files appear
+    payload = os.urandom(1024)
+    now = time.time()
+    rows = []
+    for i in range(n):
+        p = cache.path_for("bench", str(i).encode())
+        with open(p, "wb") as f:
+            f.write(payload)
+        rows.append((cache._rel(p), "bench", len(payload), now, now - n + i))
+    with cache._lock:
+        db.execute("BEGIN IMMEDIATE")
+        db.executemany("INSERT INTO entries (path, prefix, size, mtime, atime) VALUES (?, ?, ?, ?, ?)", rows)
+        db.execute("COMMIT")
+    cache.MAX_FILES = n
+
+    rng = np.random.default_rng(0)
+    keys = iter(rng.integers(0, n, 10 ** 6))
+    fresh = itertools.count(n)
+    results = [
+        measure("cache.get (disk hit)", lambda: (cache._mem.clear(), cache.get("bench", str(next(keys)).encode())),
+                repeat, entries=n),
+        measure("cache.get (memory hit)", lambda: cache.get("bench", b"0"), repeat, entries=n),
+        measure("cache.get (miss)", lambda: cache.get("bench", b"missing"), repeat, entries=n),
+        measure("cache.set (+1 eviction)", lambda: cache.set("bench", str(next(fresh)).encode(), payload),
+                repeat, entries=n),
+    ]
+
+    def sweep_1pct():
+        cache.MAX_FILES -= max(1, n // 100)
+        cache._maybe_sweep()
+    results.append(measure("cache._maybe_sweep (1% evicted)", sweep_1pct, max(1, repeat // 2), entries=n))
+    results.append(measure("cache.stats", cache.stats, repeat, entries=n))
+    conn.send(results)
+
+
+def bench_cache(repeat, sizes=CACHE_SIZES):
+    ctx = multiprocessing.get_context("spawn")
+    for n in sizes:
+        root = tempfile.mkdtemp(prefix=f"bench_cache_{n}_")
+        old = os.environ["CACHE_DIR"]
+        os.environ["CACHE_DIR"] = root  # inherited by the spawned child before it imports utils.cache
+        try:
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(target=_cache_worker, args=(n, max(repeat, 50), child))
+            proc.start()
+            results = parent.recv()
+            proc.join()
+        finally:
+            os.environ["CACHE_DIR"] = old
+            shutil.rmtree(root, ignore_errors=True)
+        yield from results
+
+
+GROUPS = {
+    "quality": bench_quality,
+    "fallback": bench_fallback,
+    "tile": bench_tiles,
+    "sheet": bench_sheet,
+    "pdf": bench_pdf,
+    "cache": bench_cache,
+}
+
+
+# ---- Runner ----
+def _meta():
+    import cv2
+    import PIL
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                timeout=5).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "pillow": PIL.__version__,
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+    }
+
+
+def _case_key(r):
+    return r["name"], json.dumps(r["params"], sort_keys=True)
+
+
+def compare(old_path, results):
+    with open(old_path) as f:
+        old = {_case_key(r): r for r in json.load(f)["results"]}
+    print(f"\n{'case':<96} {'old ms':>10} {'new ms':>10} {'change':>8}")
+    for r in results:
+        before = old.get(_case_key(r))
+        if before and before["median_ms"] > 0:
+            change = (r["median_ms"] - before["median_ms"]) / before["median_ms"]
+            label = f"{r['name']} {json.dumps(r['params'], sort_keys=True)}"
+            print(f"{label[:96]:<96} {before['median_ms']:>10.2f} {r['median_ms']:>10.2f} {change:>+8.0%}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--only", action="append", choices=sorted(GROUPS), help="run only these groups")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--out", default=f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    ap.add_argument("--compare", help="earlier results JSON to compare against")
+    ap.add_argument("--cache-sizes", default=",".join(map(str, CACHE_SIZES)))
+    args = ap.parse_args(argv)
+
+    results = []
+    for group in args.only or list(GROUPS):
+        if group == "cache":
+            results += bench_cache(args.repeat, [int(n) for n in args.cache_sizes.split(",")])
+        else:
+            results += GROUPS[group](args.repeat)
+
+    with open(args.out, "w") as f:
+        json.dump({"meta": _meta(), "results": results}, f, indent=1)
+    print(f"\nwrote {len(results)} results to {args.out}")
+    if args.compare:
+        compare(args.compare, results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,21 +1,25 @@
 import os
 import io
+import json
+import time
 import base64
+import asyncio
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Response, g, render_template, request, jsonify, send_file, stream_with_context
 from dotenv import load_dotenv
-from utils.quality import assess_quality
-from utils.image_sheet import make_a4_sheet
+from utils.image_sheet import make_a4_sheet, sheet_encoding, describe_encoding, SHEET_MIMETYPES
+from utils.batch_sheet import (
+    stream_batch_pdf, grid as batch_grid, remember_sticker, sticker_by_key, sticker_file, unreadable,
+)
+from utils import jobs, procpool, metrics, cache, logsink, gpt_async, warmup, imageload
 from utils.gpt_image import (
     cartoonize_with_bg_remove,
+    cartoon_preview,
     IMAGE_MODEL,
     IMG_SIZE,
     IMG_QUALITY,
     OPENAI_API_KEY,
 )
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.utils import ImageReader
 
 
 load_dotenv()
@@ -25,6 +29,128 @@ app = Flask(__name__)
 # Optional: protect against giant uploads (adjust as you like)
 app.config["MAX_CONTENT_LENGTH"] = int(os.getenv("MAX_CONTENT_LENGTH_MB", "12")) * 1024 * 1024
 
+# OpenCV (quality gate, fallback) and ReportLab (PDF sheet) are imported in the views that use them,
+# so the page and the light endpoints answer right after a restart; warmup.py preloads them meanwhile.
+# The warm-up is started by the server entry points (below, and asgi.py's lifespan), not on import.
+
+
+RAW_IMAGE_TYPES = ("image/png", "image/jpeg", "image/webp", "application/octet-stream")
+CARTOON_MAX_AGE_S = 365 * 24 * 3600  # cartoon URLs are content-addressed, so they never change
+JOB_WAIT_MAX_S = float(os.getenv("JOB_WAIT_MAX_S", "30"))  # longest long-poll wait / SSE keep-alive interval
+
+
+@app.before_request
+def _start_timing():
+    g.started = time.perf_counter()
+    metrics.begin()
+
+
+@app.after_request
+def _server_timing(resp):
+    """Per-endpoint latency, and the stage breakdown of this request as a Server-Timing header."""
+    total = time.perf_counter() - g.started
+    metrics.observe("booth_request_seconds", total, endpoint=request.endpoint or "unknown")
+    resp.headers["Server-Timing"] = metrics.server_timing(total)
+    warmup.note_response()
+    return resp
+
+
+def _read_upload():
+    """
+    Image bytes + parameters from any accepted request shape:
+    - multipart/form-data: file field "image"; other fields as form values ("options" as JSON text)
+    - raw body with an image Content-Type (or application/octet-stream); parameters in the query string
+    - JSON: { imageData: <base64 data URI>, ... } (original format)
+    Returns (img_bytes, params); img_bytes is None when no image was sent.
+    """
+    with metrics.stage("decode"):
+        if request.mimetype == "multipart/form-data":
+            f = request.files.get("image")
+            params = request.form.to_dict()
+            return (f.read() if f else None), params
+        if request.mimetype in RAW_IMAGE_TYPES:
+            return (request.get_data() or None), request.args.to_dict()
+
+        data = request.get_json(silent=True) or {}
+        if "imageData" not in data:
+            return None, data
+        b64_uri = data["imageData"]
+        header, b64 = b64_uri.split(",", 1) if "," in b64_uri else ("", b64_uri)
+        return base64.b64decode(b64), data
+
+
+def _flag(params, name, default=False):
+    """Boolean parameter that may arrive as JSON bool or form/query text ("true", "1")."""
+    value = params.get(name, default)
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+
+def _options(params):
+    """Sheet options as a dict (JSON bodies carry an object, form/query fields carry JSON text)."""
+    options = params.get("options") or {}
+    return json.loads(options) if isinstance(options, str) else options
+
+
+def _wants_binary(params):
+    """Return the cartoon as raw image/png rather than a base64 data URI in JSON."""
+    if params.get("response") == "binary":
+        return True
+    return request.accept_mimetypes.best_match(["application/json", "image/png"]) == "image/png"
+
+
+def _read_sticker():
+    """
+    Sticker bytes + parameters for the print endpoints: an upload (see _read_upload), or the
+    cartoonKey returned by /api/cartoonize so the image doesn't cross the network again.
+    Returns (img_bytes, params, error) where error is a response to return as-is.
+    """
+    img_bytes, params = _read_upload()
+    if img_bytes:
+        return img_bytes, params, None
+    key = params.get("cartoonKey")
+    if not key:
+        return None, params, (jsonify({"error": "imageData or cartoonKey missing"}), 400)
+    if not isinstance(key, str):
+        return None, params, (jsonify({"error": "cartoonKey must be a string"}), 400)
+    img_bytes = sticker_by_key(key.strip())
+    if img_bytes is None:
+        return None, params, (jsonify({"error": "unknown_key", "key": key}), 404)
+    return img_bytes, params, None
+
+
+def _too_large(*images):
+    """
+    413 response if an image's header declares more than IMAGE_MAX_PIXELS, or all of them together
+    more than IMAGE_REQUEST_MAX_PIXELS; None otherwise. Only headers are read.
+    """
+    try:
+        imageload.check_request(images)
+    except imageload.ImageTooLarge as e:
+        return jsonify({"error": "image_too_large", "detail": str(e), "maxPixels": imageload.MAX_PIXELS,
+                        "requestMaxPixels": imageload.REQUEST_MAX_PIXELS}), 413
+    return None
+
+
+def _cartoon_response(png_bytes, used_fallback, binary, key=None):
+    with metrics.stage("response"):
+        # The key lets the print endpoints reference this sticker without re-uploading it
+        key = remember_sticker(png_bytes, key)
+        if binary:
+            resp = send_file(io.BytesIO(png_bytes), mimetype="image/png")
+            resp.headers["X-Fallback"] = "true" if used_fallback else "false"
+            resp.headers["X-Cartoon-Key"] = key
+            resp.headers["X-Cartoon-Url"] = f"/api/cartoons/{key}"
+            return resp
+        out_b64 = base64.b64encode(png_bytes).decode("utf-8")
+        return jsonify({
+            "cartoonData": "data:image/png;base64," + out_b64,
+            "fallback": used_fallback,
+            "cartoonKey": key,
+            "cartoonUrl": f"/api/cartoons/{key}",
+        })
+
 
 @app.route("/")
 def index():
@@ -41,65 +167,357 @@ def api_info():
         "size": IMG_SIZE,
         "quality": IMG_QUALITY,
         "key_present": bool(OPENAI_API_KEY),
+        "warmup": warmup.status(),
     })
 
 
 @app.post("/api/cartoonize")
 def api_cartoonize():
-    data = request.get_json()
-    if not data or "imageData" not in data:
-        return jsonify({"error": "imageData missing"}), 400
-
+    """
+    Accepts the photo as JSON imageData, multipart field "image" or a raw image body.
+    Params: forceFresh, qualityGate, async, response ("binary" for an image/png reply),
+    reuseSimilar (accept a recent result for a near-identical photo),
+    preview (progressive mode: an async job plus a quick low-res local cartoon in previewData;
+    the final image arrives on eventsUrl (SSE) or statusUrl?wait=N (long-poll)).
+    """
+    from utils.quality import assess_quality
     try:
-        b64_uri = data["imageData"]
-        header, b64 = b64_uri.split(",", 1) if "," in b64_uri else ("", b64_uri)
-        img_bytes = base64.b64decode(b64)
+        img_bytes, params = _read_upload()
+        if not img_bytes:
+            return jsonify({"error": "imageData missing"}), 400
+        too_large = _too_large(img_bytes)
+        if too_large:
+            return too_large
 
-        force_fresh = bool(data.get("forceFresh", False))
-        quality_gate = bool(data.get("qualityGate", True))
+        force_fresh = _flag(params, "forceFresh", False)
+        reuse_similar = _flag(params, "reuseSimilar", False)
+        quality_gate = _flag(params, "qualityGate", True)
+        binary = _wants_binary(params)
 
         # 1) Quality check (reject blurry/dark before spending API)
         if quality_gate:
-            q = assess_quality(img_bytes)
+            with metrics.stage("quality"):
+                q = procpool.run(assess_quality, img_bytes)
             if not q["ok"]:
-                # 422 Unprocessable Entity with reason
-                return jsonify({
-                    "error": "low_quality",
-                    "reason": q["reason"],
-                    "metrics": {"blur": q["blur"], "brightness": q["brightness"]},
-                    "action": "retake"
-                }), 422
+                return _low_quality_response(q)
+
+        # 2) Job mode: hand the upstream call to the worker pool and return immediately
+        preview = _flag(params, "preview", False)
+        if preview or _flag(params, "async", False):
+            try:
+                job_id = jobs.submit(_cartoon_job, img_bytes, force_fresh=force_fresh,
+                                     reuse_similar=reuse_similar)
+            except jobs.QueueFull:
+                return jsonify({"error": "busy", "action": "retry"}), 503, {"Retry-After": "5"}
+            # The upstream call is already running; the preview is rendered meanwhile
+            return _job_response(job_id, binary, cartoon_preview(img_bytes) if preview else None)
 
         cartoon_png_bytes, used_fallback = cartoonize_with_bg_remove(
-            img_bytes, force_fresh=force_fresh
+            img_bytes, force_fresh=force_fresh, reuse_similar=reuse_similar
         )
-        out_b64 = base64.b64encode(cartoon_png_bytes).decode("utf-8")
-        return jsonify({
-            "cartoonData": "data:image/png;base64," + out_b64,
-            "fallback": used_fallback
-        })
+        return _cartoon_response(cartoon_png_bytes, used_fallback, binary)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+async def api_cartoonize_async():
+    """
+    /api/cartoonize under the ASGI server (asgi.py): same parameters and responses, but the upstream
+    call is awaited on the event loop and async jobs run as tasks instead of taking a worker thread.
+    """
+    from utils.quality import assess_quality
+    try:
+        # Multipart parsing and base64 decoding of a 12 MB body would stall every other request on the
+        # loop; to_thread copies the context, so the worker thread sees this request
+        img_bytes, params = await asyncio.to_thread(_read_upload)
+        if not img_bytes:
+            return jsonify({"error": "imageData missing"}), 400
+        too_large = _too_large(img_bytes)
+        if too_large:
+            return too_large
+
+        force_fresh = _flag(params, "forceFresh", False)
+        reuse_similar = _flag(params, "reuseSimilar", False)
+        binary = _wants_binary(params)
+
+        if _flag(params, "qualityGate", True):
+            with metrics.stage("quality"):
+                q = await gpt_async.offload(assess_quality, img_bytes)
+            if not q["ok"]:
+                return _low_quality_response(q)
+
+        preview = _flag(params, "preview", False)
+        if preview or _flag(params, "async", False):
+            try:
+                job_id = jobs.submit_async(_cartoon_job_async, img_bytes, force_fresh=force_fresh,
+                                           reuse_similar=reuse_similar)
+            except jobs.QueueFull:
+                return jsonify({"error": "busy", "action": "retry"}), 503, {"Retry-After": "5"}
+            preview_png = await asyncio.to_thread(cartoon_preview, img_bytes) if preview else None
+            return _job_response(job_id, binary, preview_png)
+
+        cartoon_png_bytes, used_fallback = await gpt_async.cartoonize_async(
+            img_bytes, force_fresh=force_fresh, reuse_similar=reuse_similar
+        )
+        # remember_sticker touches the cache on disk
+        return await asyncio.to_thread(_cartoon_response, cartoon_png_bytes, used_fallback, binary)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def _low_quality_response(q):
+    # 422 Unprocessable Entity with reason
+    return jsonify({
+        "error": "low_quality",
+        "reason": q["reason"],
+        "metrics": {"blur": q["blur"], "brightness": q["brightness"], "scale": q["scale"], "ms": q["ms"]},
+        "action": "retake"
+    }), 422
+
+
+def _cartoon_job(img_bytes, **kwargs):
+    """Job body: the cartoon, the fallback flag and the sticker key (hashed once, here, not per status reply)."""
+    cartoon_png_bytes, used_fallback = cartoonize_with_bg_remove(img_bytes, **kwargs)
+    return cartoon_png_bytes, used_fallback, remember_sticker(cartoon_png_bytes)
+
+
+async def _cartoon_job_async(img_bytes, **kwargs):
+    """_cartoon_job on the event loop (ASGI mode)."""
+    cartoon_png_bytes, used_fallback = await gpt_async.cartoonize_async(img_bytes, **kwargs)
+    return cartoon_png_bytes, used_fallback, await asyncio.to_thread(remember_sticker, cartoon_png_bytes)
+
+
+def _job_response(job_id, binary, preview_png=None):
+    query = "?response=binary" if binary else ""
+    body = {
+        "jobId": job_id,
+        "status": "queued",
+        "statusUrl": f"/api/jobs/{job_id}{query}",
+        "eventsUrl": f"/api/jobs/{job_id}/events{query}",
+        "resultUrl": f"/api/jobs/{job_id}/result",
+    }
+    if preview_png is not None:
+        body["previewData"] = "data:image/png;base64," + base64.b64encode(preview_png).decode("utf-8")
+    return jsonify(body), 202
+
+
+@app.get("/api/jobs/<job_id>")
+def api_job_status(job_id):
+    """
+    Poll a job started with {"async": true} on /api/cartoonize.
+    status: queued | running | done | failed; when done, same fields as the synchronous response
+    (without cartoonData if ?response=binary — fetch resultUrl instead).
+    ?wait=N (long-poll) holds the reply until the job finishes or N seconds (at most JOB_WAIT_MAX_S) pass.
+    """
+    try:
+        wait = min(float(request.args.get("wait", 0) or 0), JOB_WAIT_MAX_S)
+    except ValueError:
+        return jsonify({"error": "wait must be a number of seconds"}), 400
+    job = jobs.wait(job_id, wait) if wait > 0 else jobs.status(job_id)
+    if job is None:
+        return jsonify({"error": "unknown job"}), 404
+    metrics.merge(job["timings"])
+    return jsonify(_job_status_body(job_id, job, request.args.get("response") == "binary"))
+
+
+async def api_job_status_async(job_id):
+    """
+    GET /api/jobs/<id> under the ASGI server (asgi.py): a long-poll awaits the job on the event loop
+    instead of holding one of the bridge's ASGI_THREADS for up to JOB_WAIT_MAX_S.
+    """
+    try:
+        wait = min(float(request.args.get("wait", 0) or 0), JOB_WAIT_MAX_S)
+    except ValueError:
+        return jsonify({"error": "wait must be a number of seconds"}), 400
+    job = await jobs.wait_async(job_id, wait) if wait > 0 else jobs.status(job_id)
+    if job is None:
+        return jsonify({"error": "unknown job"}), 404
+    metrics.merge(job["timings"])
+    body = await asyncio.to_thread(_job_status_body, job_id, job, request.args.get("response") == "binary")
+    return jsonify(body)
+
+
+@app.get("/api/jobs/<job_id>/events")
+def api_job_events(job_id):
+    """
+    Server-Sent Events for a job: "status" events while it runs (at least every JOB_WAIT_MAX_S),
+    then one "done" or "failed" event carrying the same body as GET /api/jobs/<id>, and the stream ends.
+    """
+    binary = request.args.get("response") == "binary"
+    if jobs.status(job_id) is None:
+        return jsonify({"error": "unknown job"}), 404
+
+    def events():
+        while True:
+            event, final = _job_event(job_id, jobs.wait(job_id, JOB_WAIT_MAX_S), binary)
+            yield event
+            if final:
+                return
+
+    return _event_stream(events())
+
+
+async def api_job_events_async(job_id):
+    """
+    The SSE stream under the ASGI server: the events come from an async generator that awaits the job,
+    so open streams take no thread (asgi.py sends it directly). Threads are only borrowed briefly to
+    build each event, and stay free for the jobs themselves.
+    """
+    binary = request.args.get("response") == "binary"
+    if jobs.status(job_id) is None:
+        return jsonify({"error": "unknown job"}), 404
+
+    async def events():
+        while True:
+            job = await jobs.wait_async(job_id, JOB_WAIT_MAX_S)
+            event, final = await asyncio.to_thread(_job_event, job_id, job, binary)
+            yield event.encode("utf-8")
+            if final:
+                return
+
+    return _event_stream(events())
+
+
+def _event_stream(events):
+    return Response(events, mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # don't let a reverse proxy hold the events back
+    })
+
+
+def _job_event(job_id, job, binary):
+    """(SSE event text, whether it is the last one) for a job snapshot from jobs.wait()."""
+    if job is None:
+        return f"event: failed\ndata: {json.dumps({'jobId': job_id, 'error': 'unknown job'})}\n\n", True
+    body = json.dumps(_job_status_body(job_id, job, binary))
+    if job["state"] in ("done", "failed"):
+        return f"event: {job['state']}\ndata: {body}\n\n", True
+    return f"event: status\ndata: {body}\n\n", False
+
+
+def _job_status_body(job_id, job, binary):
+    body = {
+        "jobId": job_id,
+        "status": job["state"],
+        "queuePosition": job["queue_position"],
+        "queuedSeconds": job["queued_s"],
+        "runSeconds": job["run_s"],
+    }
+    if job["state"] == "done":
+        cartoon_png_bytes, used_fallback, key = job["result"]
+        if not binary:
+            out_b64 = base64.b64encode(cartoon_png_bytes).decode("utf-8")
+            body["cartoonData"] = "data:image/png;base64," + out_b64
+        body["fallback"] = used_fallback
+        body["resultUrl"] = f"/api/jobs/{job_id}/result"
+        remember_sticker(cartoon_png_bytes, key)  # index lookup; stores it again only if evicted
+        body["cartoonKey"] = key
+        body["cartoonUrl"] = f"/api/cartoons/{key}"
+    elif job["state"] == "failed":
+        body["error"] = job["error"]
+    return body
+
+
+@app.get("/api/cartoons/<key>")
+def api_cartoon(key):
+    """
+    A finished cartoon by its cartoonKey (sha256 of the PNG), sent from the cache file.
+    The URL is content-addressed: strong ETag = key, cacheable for good (immutable).
+    """
+    path = sticker_file(key)
+    if path is None:
+        return jsonify({"error": "unknown_key", "key": key}), 404
+    try:
+        resp = send_file(path, mimetype="image/png", etag=key.lower(), max_age=CARTOON_MAX_AGE_S,
+                         conditional=True)
+    except FileNotFoundError:  # evicted between the lookup and the open
+        return jsonify({"error": "unknown_key", "key": key}), 404
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+    return resp
+
+
+@app.get("/api/jobs/<job_id>/result")
+def api_job_result(job_id):
+    """Finished job's cartoon as image/png (X-Fallback header tells whether the local stylizer was used)."""
+    job = jobs.status(job_id)
+    if job is None:
+        return jsonify({"error": "unknown job"}), 404
+    if job["state"] != "done":
+        return jsonify({"error": job["error"] or "not ready", "status": job["state"]}), 409
+    metrics.merge(job["timings"])
+    cartoon_png_bytes, used_fallback, key = job["result"]
+    return _cartoon_response(cartoon_png_bytes, used_fallback, binary=True, key=key)
+
+
+@app.get("/api/jobs")
+def api_jobs():
+    """Queue depth and recent job latency for the cartoonize worker pool."""
+    return jsonify(jobs.stats())
+
+
+@app.get("/api/pool")
+def api_pool():
+    """Queue depth and per-task timings of the process pool used for sheets, PDFs and image checks."""
+    return jsonify(procpool.stats())
+
+
+@app.get("/api/metrics")
+def api_metrics():
+    """Prometheus text format: stage/request latency summaries, result/upstream counters, cache and pools."""
+    c = cache.stats()
+    pool = procpool.stats()
+    queue = jobs.stats()
+    counters = [(f"booth_cache_{field}_total", {"tier": tier}, c[tier][field])
+                for tier in ("memory", "disk") for field in ("hits", "misses", "evictions")]
+    gauges = [
+        ("booth_cache_bytes", {"tier": "memory"}, c["memory"]["bytes"]),
+        ("booth_cache_bytes", {"tier": "disk"}, c["disk"]["bytes"]),
+        ("booth_cache_files", {}, c["disk"]["files"]),
+        ("booth_pool_in_flight", {}, pool["in_flight"]),
+        ("booth_pool_queued", {}, pool["queued"]),
+        ("booth_jobs_queued", {}, queue["queued"]),
+        ("booth_jobs_running", {}, queue["running"]),
+        ("booth_log_queued", {}, logsink.stats()["queued"]),
+        ("booth_decode_bytes", {}, imageload.stats()["used_bytes"]),
+        ("booth_decode_waiting", {}, imageload.stats()["waiting"]),
+    ]
+    warm = warmup.status()
+    gauges += [("booth_warmup_seconds", {"step": step}, s) for step, s in warm["steps"].items()]
+    if warm["first_response_s"] is not None:
+        gauges.append(("booth_first_response_seconds", {}, warm["first_response_s"]))
+    return Response(metrics.prometheus(gauges, counters), mimetype="text/plain; version=0.0.4")
+
+
 @app.post("/api/print-sheet")
 def api_print_sheet():
-    data = request.get_json()
-    if not data or "imageData" not in data:
-        return jsonify({"error": "imageData missing"}), 400
+    """
+    Expects: JSON { imageData, options?: { shape, border, theme, ..., encoding?: { format: "png"|"jpeg"|"webp",
+    compress_level?, optimize?, quality? } } }, or the sticker as multipart field "image" / raw image body
+    with options as JSON text. Instead of the image, cartoonKey (from /api/cartoonize) may be sent.
+    The encoding used is echoed in X-Sheet-Encoding.
+    """
     try:
-        b64_uri = data["imageData"]
-        header, b64 = b64_uri.split(",", 1) if "," in b64_uri else ("", b64_uri)
-        img_bytes = base64.b64decode(b64)
-        options = data.get("options", {})
+        img_bytes, params, error = _read_sticker()
+        error = error or _too_large(img_bytes)
+        if error:
+            return error
+        options = _options(params)
 
-        a4_png_bytes = make_a4_sheet(img_bytes, options=options)
-        return send_file(
-            io.BytesIO(a4_png_bytes),
-            mimetype="image/png",
+        try:
+            enc = sheet_encoding(options)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        a4_bytes = procpool.run(make_a4_sheet, img_bytes, options=options)
+        ext = "jpg" if enc["format"] == "jpeg" else enc["format"]
+        resp = send_file(
+            io.BytesIO(a4_bytes),
+            mimetype=SHEET_MIMETYPES[enc["format"]],
             as_attachment=True,
-            download_name="sticker_sheet_a4.png"
+            download_name=f"sticker_sheet_a4.{ext}"
         )
+        resp.headers["X-Sheet-Encoding"] = describe_encoding(enc)
+        return resp
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -107,33 +525,21 @@ def api_print_sheet():
 @app.post("/api/print-sheet-pdf")
 def api_print_sheet_pdf():
     """
-    Same payload as /api/print-sheet, but returns A4 PDF with the composed PNG placed full-page.
+    Same payload as /api/print-sheet (image or cartoonKey), but returns the A4 layout as a vector PDF
+    (cut lines, rings and borders as paths; the sticker embedded once and placed per tile).
     Helps with printer drivers that scale PNG oddly.
     """
-    data = request.get_json()
-    if not data or "imageData" not in data:
-        return jsonify({"error": "imageData missing"}), 400
+    from utils.pdf_sheet import make_a4_pdf
     try:
-        b64_uri = data["imageData"]
-        header, b64 = b64_uri.split(",", 1) if "," in b64_uri else ("", b64_uri)
-        img_bytes = base64.b64decode(b64)
-        options = data.get("options", {})
-
-        a4_png_bytes = make_a4_sheet(img_bytes, options=options)
-
-        # Create PDF in-memory
-        pdf_buf = io.BytesIO()
-        c = canvas.Canvas(pdf_buf, pagesize=A4)
-        w, h = A4  # points
-        img = ImageReader(io.BytesIO(a4_png_bytes))
-        # Cover full page (no margins) — your print dialog can set margins if needed
-        c.drawImage(img, 0, 0, width=w, height=h, preserveAspectRatio=True, mask='auto')
-        c.showPage()
-        c.save()
-        pdf_buf.seek(0)
+        img_bytes, params, error = _read_sticker()
+        error = error or _too_large(img_bytes)
+        if error:
+            return error
+        options = _options(params)
 
+        pdf_bytes = procpool.run(make_a4_pdf, img_bytes, options=options)
         return send_file(
-            pdf_buf,
+            io.BytesIO(pdf_bytes),
             mimetype="application/pdf",
             as_attachment=True,
             download_name="sticker_sheet_a4.pdf"
@@ -142,26 +548,90 @@ def api_print_sheet_pdf():
         return jsonify({"error": str(e)}), 500
 
 
+@app.post("/api/print-batch-pdf")
+def api_print_batch_pdf():
+    """
+    Many guests in one multi-page PDF. Stickers come as multipart fields "image" (repeatable)
+    and/or keys (cartoonKey from /api/cartoonize) in "keys" (JSON list or comma-separated).
+    JSON bodies use { keys: [...], images: [<data URI>...], options, copies }.
+    options: the print-sheet options plus grid: { cols, rows } (1-4 each, default 2x2);
+    copies: slots per guest (default 1). Pages are streamed as they are rendered.
+    Every sticker is checked before streaming starts: 400 {"error": "unreadable_image", "index"}
+    names the first bad one (uploaded images first, then keys, in the order sent).
+    """
+    try:
+        if request.mimetype == "multipart/form-data":
+            params = request.form.to_dict()
+            stickers = [f.read() for f in request.files.getlist("image")]
+        else:
+            params = request.get_json(silent=True) or {}
+            stickers = [base64.b64decode(uri.split(",", 1)[-1]) for uri in params.get("images", [])]
+        keys = params.get("keys") or []
+        if isinstance(keys, str):
+            try:
+                keys = json.loads(keys) if keys.strip().startswith("[") else [k for k in keys.split(",") if k.strip()]
+            except ValueError:
+                keys = None
+        if not isinstance(keys, list) or not all(isinstance(k, str) and k.strip() for k in keys):
+            return jsonify({"error": "keys must be a list of non-empty strings"}), 400
+        for key in keys:
+            png = sticker_by_key(key.strip())
+            if png is None:
+                return jsonify({"error": "unknown_key", "key": key}), 404
+            stickers.append(png)
+        if not stickers:
+            return jsonify({"error": "no stickers"}), 400
+        too_large = _too_large(*stickers)
+        if too_large:
+            return too_large
+        # Pages are decoded while the PDF streams, after the 200 is sent: catch bad images now
+        bad = unreadable(stickers)
+        if bad is not None:
+            return jsonify({"error": "unreadable_image", "index": bad}), 400
+
+        options = _options(params)
+        try:
+            batch_grid(options)
+            copies = int(params.get("copies", 1))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        chunks = stream_batch_pdf(stickers, options=options, copies=copies)
+        return Response(stream_with_context(chunks), mimetype="application/pdf", headers={
+            "Content-Disposition": "attachment; filename=sticker_sheets_a4.pdf",
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 @app.post("/api/log")
 def api_log():
     """
-    Expects: JSON { level: "info"|"warn"|"error", message: str, meta?: dict }
-    Writes to logs/app.log (server-side).
+    Expects: JSON { level: "info"|"warn"|"error", message: str, meta?: dict }, or a list of such
+    events (also as { events: [...] }). Lines are queued for logs/app.log and written in batches
+    by a background thread; "dropped" counts events refused because the queue was full.
     """
     try:
         data = request.get_json() or {}
-        level = data.get("level", "info")
-        message = data.get("message", "")
-        meta = data.get("meta", {})
-        os.makedirs("logs", exist_ok=True)
-        line = f"{datetime.utcnow().isoformat()}Z\t{level.upper()}\t{message}\t{meta}\n"
-        with open(os.path.join("logs", "app.log"), "a", encoding="utf-8") as f:
-            f.write(line)
-        return jsonify({"ok": True})
+        events = data.get("events", [data]) if isinstance(data, dict) else data
+        if (not isinstance(events, list) or len(events) > logsink.LOG_MAX_EVENTS
+                or not all(isinstance(e, dict) for e in events)):
+            return jsonify({"error": f"expected up to {logsink.LOG_MAX_EVENTS} events"}), 400
+        now = datetime.utcnow().isoformat()
+        dropped = 0
+        for event in events:
+            level = str(event.get("level", "info"))
+            message = " ".join(str(event.get("message", "")).split("\n"))  # one line per event
+            meta = event.get("meta", {})
+            dropped += not logsink.write(f"{now}Z\t{level.upper()}\t{message}\t{meta}\n")
+        return jsonify({"ok": True, "accepted": len(events) - dropped, "dropped": dropped})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
+    # With debug=True the reloader's child process (WERKZEUG_RUN_MAIN) is the one serving requests
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        warmup.start()
     app.run(host="0.0.0.0", port=port, debug=True)
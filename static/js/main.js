@@ -68,6 +68,7 @@ const i18n = {
     startCapture: "Start Capture",
     autoHint: (n)=> `Auto capture in ${n}s`,
     converting: "Converting to cartoon…",
+    refining: "Preview — finishing your cartoon…",
     retry: "Retry",
     approve: "Approve",
     retake: "Retake",
@@ -103,8 +104,15 @@ const CENTER_TOL = 0.18;
 const MIN_FACE_RATIO = 0.18;
 
 let detector = null;
-let latestCartoonData = null;
-let latestPhotoData = null;
+let latestCartoonBlob = null;   // image/png Blob from /api/cartoonize
+let latestCartoonKey = null;    // its content hash: the print endpoints take this instead of the image
+let latestPhotoBlob = null;     // captured snapshot Blob
+
+/* Object URLs for previews (revoked when replaced) */
+function setBlobSrc(imgEl, blob){
+  if(imgEl.src && imgEl.src.startsWith("blob:")) URL.revokeObjectURL(imgEl.src);
+  imgEl.src = blob ? URL.createObjectURL(blob) : "";
+}
 
 const settings = {
   timerSeconds: 5,
@@ -180,15 +188,60 @@ function showToast(msg, type=""){
   setTimeout(()=> div.remove(), 3500);
 }
 
-/* Telemetry */
-async function logEvent(level, message, meta={}){
-  try{
-    await fetch("/api/log", {
-      method: "POST",
-      headers: {"Content-Type":"application/json"},
-      body: JSON.stringify({ level, message, meta })
-    });
-  }catch{}
+/* Telemetry: events are buffered and sent to /api/log in batches */
+const LOG_BATCH_SIZE = 20;
+const LOG_FLUSH_MS = 3000;
+let logBuffer = [];
+let logTimer = null;
+
+function logEvent(level, message, meta={}){
+  logBuffer.push({ level, message, meta });
+  if(logBuffer.length >= LOG_BATCH_SIZE || level === "error") flushLogs();
+  else if(!logTimer) logTimer = setTimeout(flushLogs, LOG_FLUSH_MS);
+}
+
+function flushLogs(useBeacon=false){
+  clearTimeout(logTimer);
+  logTimer = null;
+  if(!logBuffer.length) return;
+  const body = JSON.stringify({ events: logBuffer });
+  logBuffer = [];
+  if(useBeacon && navigator.sendBeacon){
+    navigator.sendBeacon("/api/log", new Blob([body], { type: "application/json" }));
+    return;
+  }
+  fetch("/api/log", {
+    method: "POST",
+    headers: {"Content-Type":"application/json"},
+    body,
+    keepalive: true
+  }).catch(()=>{});
+}
+
+// Don't lose the tail of the buffer when the kiosk page is closed or reloaded
+window.addEventListener("pagehide", ()=> flushLogs(true));
+
+/* Server-Timing breakdown ("quality;dur=12.3, upstream;dur=8012.0") -> { quality: 12.3, ... } ms */
+function serverTiming(res){
+  const out = {};
+  for(const part of (res.headers.get("Server-Timing") || "").split(",")){
+    const [name, ...params] = part.trim().split(";");
+    const dur = params.find(p => p.trim().startsWith("dur="));
+    if(name && dur) out[name] = parseFloat(dur.trim().slice(4));
+  }
+  return out;
+}
+
+function logTiming(label, ...responses){
+  const stages = {};
+  for(const res of responses){
+    for(const [name, ms] of Object.entries(serverTiming(res))){
+      stages[name] = (stages[name] || 0) + ms;
+    }
+  }
+  if(!Object.keys(stages).length) return;
+  console.debug(`[timing] ${label}`, stages);
+  logEvent("info", `timing_${label}`, stages);
 }
 
 /* Fetch with timeout + JSON */
@@ -424,7 +477,9 @@ function takeSnapshotFromVideo(){
   photoCanvas.height = videoHeight;
   const ctx = photoCanvas.getContext("2d");
   ctx.drawImage(cameraEl, 0, 0, videoWidth, videoHeight);
-  return photoCanvas.toDataURL("image/png");
+  return new Promise((resolve, reject)=>{
+    photoCanvas.toBlob(b => b ? resolve(b) : reject(new Error("Snapshot failed")), "image/png");
+  });
 }
 
 function setBusy(btn, busy, label="Please wait…"){
@@ -478,26 +533,69 @@ async function startAutoCountdownAndCapture(){
   }, 1000);
 }
 
+function showJobProgress(j){
+  procText.textContent = (j.status === "queued" && j.queuePosition > 0)
+    ? `Waiting in queue… (${j.queuePosition} ahead)`
+    : i18n.en.converting;
+}
+
+/* Long-poll a background cartoonize job until it finishes (the server holds each reply up to waitS) */
+async function pollJob(statusUrl, waitS=25, timeoutMs=240000){
+  const until = Date.now() + timeoutMs;
+  const url = statusUrl + (statusUrl.includes("?") ? "&" : "?") + `wait=${waitS}`;
+  while(Date.now() < until){
+    const j = await fetchJson(url, {}, (waitS + 15) * 1000);
+    if(j.status === "done") return j;
+    if(j.status === "failed") throw new Error(j.error || "Conversion failed");
+    showJobProgress(j);
+  }
+  throw new Error("Conversion timed out");
+}
+
+/* Wait for a job over Server-Sent Events; falls back to long-polling if the stream can't be used */
+function jobEvents(eventsUrl, timeoutMs=240000){
+  return new Promise((resolve, reject)=>{
+    const es = new EventSource(eventsUrl);
+    const timer = setTimeout(()=> finish(reject, new Error("Conversion timed out")), timeoutMs);
+    function finish(fn, value){ clearTimeout(timer); es.close(); fn(value); }
+    es.addEventListener("status", e => showJobProgress(JSON.parse(e.data)));
+    es.addEventListener("done", e => finish(resolve, JSON.parse(e.data)));
+    es.addEventListener("failed", e => finish(reject, new Error(JSON.parse(e.data).error || "Conversion failed")));
+    es.onerror = () => finish(resolve, null);  // stream unavailable (proxy, dropped connection)
+  });
+}
+
+async function waitJob(job){
+  const done = (window.EventSource && job.eventsUrl) ? await jobEvents(job.eventsUrl) : null;
+  return done || pollJob(job.statusUrl);
+}
+
+function showCartoon(src, isPreview){
+  cartoonPreview.src = src;
+  processing.classList.add("d-none");
+  cartoonWrap.classList.remove("d-none");
+  cartoonWrap.classList.toggle("is-preview", isPreview);
+  cartoonWrap.dataset.note = isPreview ? i18n.en.refining : "";
+}
+
 /* === quality gate + forceFresh retry === */
-async function runCartoonize(imageData, attempt=1){
+async function runCartoonize(photoBlob, attempt=1){
   processing.classList.remove("d-none");
   cartoonWrap.classList.add("d-none");
   approveBtn.disabled = true;
   retryBtn.classList.add("d-none");
   procText.textContent = attempt > 1 ? `Retrying… (attempt ${attempt})` : i18n.en.converting;
 
-  const payload = {
-    imageData,
-    qualityGate: true,
-    forceFresh: attempt > 1
-  };
+  // Binary multipart upload (no base64 copies); result comes back as image/png
+  const form = new FormData();
+  form.append("image", photoBlob, "capture.png");
+  form.append("qualityGate", "true");
+  form.append("forceFresh", attempt > 1 ? "true" : "false");
+  form.append("preview", "true");   // job + quick local preview; the final image replaces it
+  form.append("response", "binary");
 
   try{
-    const res = await fetch("/api/cartoonize", {
-      method: "POST",
-      headers: {"Content-Type":"application/json"},
-      body: JSON.stringify(payload)
-    });
+    const res = await fetch("/api/cartoonize", { method: "POST", body: form });
 
     // Quality gate failed
     if(res.status === 422){
@@ -523,21 +621,36 @@ async function runCartoonize(imageData, attempt=1){
       throw new Error(j.error || `HTTP ${res.status}`);
     }
 
-    const json = await res.json();
-    latestCartoonData = json.cartoonData;
-    cartoonPreview.src = latestCartoonData;
-
-    processing.classList.add("d-none");
-    cartoonWrap.classList.remove("d-none");
+    let fallback;
+    if(res.status === 202){
+      const started = await res.json();
+      if(started.previewData) showCartoon(started.previewData, true);
+      const job = await waitJob(started);
+      const out = await fetch(job.cartoonUrl || job.resultUrl);  // content-addressed, browser-cacheable
+      if(!out.ok) throw new Error(`HTTP ${out.status}`);
+      latestCartoonBlob = await out.blob();
+      latestCartoonKey = job.cartoonKey || null;
+      fallback = job.fallback;
+      logTiming("cartoonize", res, out);  // upload + gate, then the job's stages
+    }else{
+      latestCartoonBlob = await res.blob();
+      latestCartoonKey = res.headers.get("X-Cartoon-Key");
+      fallback = res.headers.get("X-Fallback") === "true";
+      logTiming("cartoonize", res);
+    }
+    setBlobSrc(cartoonPreview, latestCartoonBlob);
+    showCartoon(cartoonPreview.src, false);
     approveBtn.disabled = false;
 
-    if(json.fallback){
+    if(fallback){
       showToast(i18n.en.toastFallback, "error");
       logEvent("warn", "fallback_stylize_used");
     }else{
       showToast(i18n.en.toastReady, "success");
     }
   }catch(err){
+    cartoonWrap.classList.add("d-none");  // drop the preview, if one was shown
+    processing.classList.remove("d-none");
     procText.textContent = `Conversion failed: ${err.message}`;
     retryBtn.classList.remove("d-none");
     showToast(i18n.en.toastErr(err.message), "error");
@@ -546,9 +659,9 @@ async function runCartoonize(imageData, attempt=1){
 }
 
 async function doCaptureFlow(){
-  const snap = takeSnapshotFromVideo();
-  latestPhotoData = snap;
-  origPreview.src = snap;
+  const snap = await takeSnapshotFromVideo();
+  latestPhotoBlob = snap;
+  setBlobSrc(origPreview, snap);
   showPanel(panelPreview);
   await runCartoonize(snap, 1);
 }
@@ -580,8 +693,9 @@ function applyKioskMode(on){
 
 /* Reset session */
 function resetSession(){
-  latestPhotoData = null;
-  latestCartoonData = null;
+  latestPhotoBlob = null;
+  latestCartoonBlob = null;
+  latestCartoonKey = null;
   cartoonWrap.classList.add("d-none");
   processing.classList.add("d-none");
   approveBtn.disabled = true;
@@ -606,40 +720,50 @@ captureBtn.addEventListener("click", async ()=>{
 
 retryBtn.addEventListener("click", async ()=>{
   retryBtn.classList.add("d-none");
-  await runCartoonize(latestPhotoData, 2); // attempt 2 => forceFresh
+  await runCartoonize(latestPhotoBlob, 2); // attempt 2 => forceFresh
 });
 
 retakeBtn.addEventListener("click", ()=> resetSession());
 
-approveBtn.addEventListener("click", async ()=>{
-  if(!latestCartoonData){
-    showToast(i18n.en.toastErr("Please wait for the cartoon"), "error");
-    return;
-  }
+/* Sticker (by key, or the image itself) + layout options as a multipart body for the sheet endpoints */
+function sheetForm(byKey){
   const shape = shapeSelect?.value || "circle";
   const border = borderSelect?.value || "none";
   const theme  = themeSelect?.value || "none";
   const brand_color = brandColorInput?.value || "#FF4081";
   const branding = brandToggle?.checked || false;
   const brand_text = brandTextInput?.value || "";
+  const form = new FormData();
+  if(byKey) form.append("cartoonKey", latestCartoonKey);
+  else form.append("image", latestCartoonBlob, "cartoon.png");
+  form.append("options", JSON.stringify({ shape, border, branding, brand_text, theme, brand_color }));
+  return form;
+}
+
+/* POST the sheet form by key; upload the image only if the server no longer has it (404) */
+async function postSheet(url){
+  if(latestCartoonKey){
+    const res = await fetch(url, { method: "POST", body: sheetForm(true) });
+    if(res.status !== 404) return res;
+  }
+  return fetch(url, { method: "POST", body: sheetForm(false) });
+}
+
+approveBtn.addEventListener("click", async ()=>{
+  if(!latestCartoonBlob){
+    showToast(i18n.en.toastErr("Please wait for the cartoon"), "error");
+    return;
+  }
 
   setBusy(approveBtn, true, "Preparing sheet…");
   try{
-    const res = await fetch("/api/print-sheet", {
-      method: "POST",
-      headers: {"Content-Type":"application/json"},
-      body: JSON.stringify({
-        imageData: latestCartoonData,
-        options: { shape, border, branding, brand_text, theme, brand_color }
-      })
-    });
+    const res = await postSheet("/api/print-sheet");
     if(!res.ok){
       const j = await res.json().catch(()=> ({}));
       throw new Error(j.error || "Failed to generate A4 sheet");
     }
-    const blob = await res.blob();
-    const url = URL.createObjectURL(blob);
-    sheetPreview.src = url;
+    logTiming("print_sheet", res);
+    setBlobSrc(sheetPreview, await res.blob());
     showPanel(panelPrint);
   }catch(err){
     showToast("Sheet generation error: " + err.message, "error");
@@ -665,26 +789,14 @@ printBtn.addEventListener("click", ()=>{
 });
 
 downloadPdfBtn.addEventListener("click", async ()=>{
-  if(!latestCartoonData){ showToast("No sheet to export.", "error"); return; }
-  const shape = shapeSelect?.value || "circle";
-  const border = borderSelect?.value || "none";
-  const theme  = themeSelect?.value || "none";
-  const brand_color = brandColorInput?.value || "#FF4081";
-  const branding = brandToggle?.checked || false;
-  const brand_text = brandTextInput?.value || "";
+  if(!latestCartoonBlob){ showToast("No sheet to export.", "error"); return; }
   try{
-    const res = await fetch("/api/print-sheet-pdf", {
-      method: "POST",
-      headers: {"Content-Type":"application/json"},
-      body: JSON.stringify({
-        imageData: latestCartoonData,
-        options: { shape, border, branding, brand_text, theme, brand_color }
-      })
-    });
+    const res = await postSheet("/api/print-sheet-pdf");
     if(!res.ok){
       const j = await res.json().catch(()=> ({}));
       throw new Error(j.error || "Failed to create PDF");
     }
+    logTiming("print_sheet_pdf", res);
     const blob = await res.blob();
     const url = URL.createObjectURL(blob);
     const a = document.createElement("a");
@@ -0,0 +1,15 @@
+import os
+import sys
+import tempfile
+
+# The app reads its settings from the environment at import time: an empty cache, no API key
+# (local fallback), work inline instead of in a process pool, no background warm-up.
+os.environ.update(
+    CACHE_DIR=tempfile.mkdtemp(prefix="booth_test_cache_"),
+    LOG_DIR=tempfile.mkdtemp(prefix="booth_test_logs_"),
+    OPENAI_API_KEY="",
+    GPT_ALLOW_FALLBACK_WITHOUT_KEY="true",
+    PROC_WORKERS="0",
+    WARMUP="false",
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,77 @@
+"""Job long-poll and SSE under the ASGI server must not hold the threads the jobs themselves need."""
+import asyncio
+import hashlib
+import threading
+import time
+
+import httpx
+
+import asgi
+from utils import jobs
+
+THREADS = 2
+
+
+async def _job():
+    # Like main._cartoon_job_async: several blocking steps on the loop's default executor
+    for _ in range(3):
+        await asyncio.to_thread(time.sleep, 0.1)
+    return b"png", True, hashlib.sha256(b"png").hexdigest()
+
+
+async def _lifespan(threads: int):
+    """Run asgi.app's lifespan startup (sets the default executor to ASGI_THREADS threads)."""
+    asgi.ASGI_THREADS = threads
+    messages = asyncio.Queue()
+    sent = asyncio.Queue()
+    await messages.put({"type": "lifespan.startup"})
+    task = asyncio.create_task(asgi.app({"type": "lifespan"}, messages.get, sent.put))
+    assert (await sent.get())["type"] == "lifespan.startup.complete"
+    return task, messages
+
+
+async def _run(clients: int):
+    task, messages = await _lifespan(THREADS)
+    job_ids = [jobs.submit_async(_job) for _ in range(clients)]
+    transport = httpx.ASGITransport(app=asgi.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://booth", timeout=30) as client:
+        streams = [client.get(f"/api/jobs/{job_id}/events?response=binary") for job_id in job_ids]
+        polls = [client.get(f"/api/jobs/{job_id}?wait=10&response=binary") for job_id in job_ids]
+        replies = await asyncio.wait_for(asyncio.gather(*streams, *polls), timeout=15)
+        listing = await client.get("/api/jobs")
+    await messages.put({"type": "lifespan.shutdown"})
+    await task
+    return replies[:clients], replies[clients:], listing
+
+
+def test_more_streams_than_threads_all_finish():
+    clients = THREADS * 3
+    result = []
+    # In a daemon thread: if the executor deadlocks, the test fails instead of hanging the run
+    runner = threading.Thread(target=lambda: result.append(asyncio.run(_run(clients))), daemon=True)
+    runner.start()
+    runner.join(20)
+    assert result, "SSE/long-poll clients starved the jobs of threads (no reply within 20 s)"
+    streams, polls, listing = result[0]
+
+    for r in streams:
+        assert r.status_code == 200
+        assert r.headers["content-type"].startswith("text/event-stream")
+        assert r.text.rstrip().split("\n\n")[-1].startswith("event: done")
+    for r in polls:
+        assert r.status_code == 200
+        assert r.json()["status"] == "done"
+    assert listing.status_code == 200
+
+
+def test_unknown_job_and_bad_wait():
+    async def run():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://booth") as client:
+            return (await client.get("/api/jobs/nope/events"), await client.get("/api/jobs/nope?wait=1"),
+                    await client.get("/api/jobs/nope?wait=soon"))
+
+    events, poll, bad = asyncio.run(run())
+    assert events.status_code == 404
+    assert poll.status_code == 404
+    assert bad.status_code == 400
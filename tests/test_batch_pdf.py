@@ -0,0 +1,62 @@
+"""POST /api/print-batch-pdf: request validation before the PDF starts streaming."""
+import io
+
+import pytest
+from PIL import Image
+
+import main
+
+
+def _png(color=(200, 40, 40, 255), size=(64, 64)) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGBA", size, color).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _post(*images, **form):
+    client = main.app.test_client()
+    data = {"image": [(io.BytesIO(b), f"s{i}.png") for i, b in enumerate(images)], **form}
+    return client.post("/api/print-batch-pdf", data=data, content_type="multipart/form-data")
+
+
+def test_valid_batch_streams_a_complete_pdf():
+    r = _post(_png(), _png((40, 40, 200, 255)))
+    assert r.status_code == 200
+    assert r.mimetype == "application/pdf"
+    assert r.data.startswith(b"%PDF") and r.data.rstrip().endswith(b"%%EOF")
+
+
+def test_corrupt_sticker_is_rejected_before_streaming():
+    r = _post(_png(), b"not an image")
+    assert r.status_code == 400
+    assert r.json == {"error": "unreadable_image", "index": 1}
+
+
+def test_truncated_png_is_rejected():
+    png = _png(size=(300, 300))
+    r = _post(png[: len(png) // 2])
+    assert r.status_code == 400
+    assert r.json["index"] == 0
+
+
+def test_keys_must_be_non_empty_strings():
+    client = main.app.test_client()
+    for keys in ([1], [""], ["  "], {"a": 1}, [None], "[1,"):
+        r = client.post("/api/print-batch-pdf", json={"keys": keys})
+        assert r.status_code == 400, keys
+
+
+def test_failure_mid_stream_aborts_instead_of_ending_the_pdf(monkeypatch, capsys):
+    from utils import batch_sheet
+
+    def broken(*args, **kwargs):
+        raise OSError("image file is truncated")
+
+    monkeypatch.setattr(batch_sheet, "render_page", broken)
+    client = main.app.test_client()
+    data = {"image": [(io.BytesIO(_png()), "s.png")]}
+    r = client.post("/api/print-batch-pdf", data=data, content_type="multipart/form-data", buffered=False)
+    assert r.status_code == 200  # already sent when the first page fails
+    with pytest.raises(OSError):  # the server drops the connection; the client never sees %%EOF
+        b"".join(r.response)
+    assert "[batch-pdf] aborted" in capsys.readouterr().out
@@ -0,0 +1,48 @@
+"""Sticker sheet rendering: option handling."""
+import io
+import base64
+
+import pytest
+from PIL import Image
+
+import main
+from utils.image_sheet import _sheet_options
+
+
+def _sticker(size=(256, 256)) -> bytes:
+    im = Image.new("RGBA", size, (0, 0, 0, 0))
+    im.paste((230, 120, 40, 255), (40, 40, size[0] - 40, size[1] - 40))
+    buf = io.BytesIO()
+    im.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+BAD_OPTIONS = [
+    {"theme": "brand", "brand_color": [255, 0, 0]},
+    {"theme": "brand", "brand_color": {"r": 255}},
+    {"theme": "brand", "brand_color": None},
+    {"shape": ["circle"], "border": {"dashed": True}, "theme": 5},
+    {"branding": True, "brand_text": ["Booth"]},
+]
+
+
+@pytest.mark.parametrize("options", BAD_OPTIONS)
+def test_unhashable_option_values_fall_back_to_defaults(options):
+    opts = _sheet_options(options)
+    assert all(isinstance(v, (str, bool)) for v in opts.values())
+    hash(tuple(opts.items()))
+
+
+def test_brand_color_is_canonical():
+    assert _sheet_options({"brand_color": "#f00"})["brand_color"] == "#FF0000"
+    assert _sheet_options({"brand_color": "00ff00"})["brand_color"] == "#00FF00"
+    assert _sheet_options({"brand_color": [1, 2, 3]})["brand_color"] == "#FF4081"
+    assert _sheet_options(None) == _sheet_options({}) == _sheet_options(["not", "a", "dict"])
+
+
+@pytest.mark.parametrize("path", ["/api/print-sheet", "/api/print-sheet-pdf"])
+def test_print_endpoints_accept_odd_option_values(path):
+    client = main.app.test_client()
+    data = "data:image/png;base64," + base64.b64encode(_sticker()).decode()
+    r = client.post(path, json={"imageData": data, "options": BAD_OPTIONS[0]})
+    assert r.status_code == 200, r.get_data(as_text=True)
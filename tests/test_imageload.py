@@ -0,0 +1,22 @@
+"""Bounded decoding: the decode budget is shared by the web process and the pool workers."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _budget(workers: int, mb: int) -> int:
+    env = {**os.environ, "PROC_WORKERS": str(workers), "IMAGE_DECODE_BUDGET_MB": str(mb)}
+    out = subprocess.run([sys.executable, "-c", "from utils import imageload; print(imageload.stats()['budget_bytes'])"],
+                         cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return int(out.stdout)
+
+
+@pytest.mark.parametrize("workers", [0, 1, 3, 7])
+def test_each_process_holds_an_equal_share(workers):
+    share = _budget(workers, 512)
+    assert share == 512 * 1024 * 1024 // (workers + 1)
+    assert share * (workers + 1) <= 512 * 1024 * 1024  # web process + workers stay within the budget
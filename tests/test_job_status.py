@@ -0,0 +1,46 @@
+"""Job status replies reuse the sticker key computed when the job finished."""
+import hashlib
+from types import SimpleNamespace
+
+import pytest
+
+import main
+from utils import batch_sheet, cache, jobs
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"cartoon" * 100
+
+
+@pytest.fixture
+def done_job(monkeypatch):
+    monkeypatch.setattr(main, "cartoonize_with_bg_remove", lambda img, **kw: (PNG, False))
+    job_id = jobs.submit(main._cartoon_job, b"photo", force_fresh=False, reuse_similar=True)
+    assert jobs.wait(job_id, 10)["state"] == "done"
+    return job_id
+
+
+def _no_rehash(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("status replies must not hash or read the sticker again")
+    monkeypatch.setattr(batch_sheet, "hashlib", SimpleNamespace(sha256=fail))
+    monkeypatch.setattr(batch_sheet, "cache_get", fail)
+
+
+def test_status_and_events_reuse_the_key(done_job, monkeypatch):
+    key = hashlib.sha256(PNG).hexdigest()
+    _no_rehash(monkeypatch)
+    client = main.app.test_client()
+    for _ in range(3):
+        body = client.get(f"/api/jobs/{done_job}").get_json()
+        assert body["cartoonKey"] == key and body["cartoonUrl"] == f"/api/cartoons/{key}"
+    events = client.get(f"/api/jobs/{done_job}/events").get_data(as_text=True)
+    assert key in events
+    r = client.get(f"/api/jobs/{done_job}/result")
+    assert r.status_code == 200 and r.headers["X-Cartoon-Key"] == key
+
+
+def test_evicted_sticker_is_stored_again(done_job, monkeypatch):
+    cache.clear("sticker")
+    _no_rehash(monkeypatch)
+    key = main.app.test_client().get(f"/api/jobs/{done_job}").get_json()["cartoonKey"]
+    monkeypatch.undo()
+    assert batch_sheet.sticker_by_key(key) == PNG
@@ -0,0 +1,43 @@
+"""Upload normalization: the cartoon cache key hashes the exact normalized pixels."""
+import io
+
+import pytest
+from PIL import Image, ImageDraw
+
+from utils.normalize import normalize_photo
+
+
+def _capture() -> Image.Image:
+    im = Image.new("RGB", (1200, 900), (70, 110, 160))
+    draw = ImageDraw.Draw(im)
+    for i in range(0, 1200, 60):
+        draw.line([(i, 0), (1200 - i, 900)], fill=(200, 180 - i // 10, 90), width=5)
+    draw.ellipse([400, 250, 800, 650], fill=(235, 190, 160))
+    return im
+
+
+def _encode(im, fmt, **params) -> bytes:
+    buf = io.BytesIO()
+    im.save(buf, format=fmt, **params)
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize("box", [None, (1024, 1024)])
+def test_lossless_re_encode_hits_the_same_key(box):
+    im = _capture()
+    png = _encode(im, "PNG", compress_level=1)
+    key = normalize_photo(png, box)[1]
+    assert normalize_photo(_encode(im, "PNG", compress_level=9, optimize=True), box)[1] == key
+    assert normalize_photo(_encode(im, "WEBP", lossless=True), box)[1] == key
+    exif = Image.Exif()
+    exif[0x010F] = "Booth camera"  # Make: metadata only
+    assert normalize_photo(_encode(im, "PNG", exif=exif), box)[1] == key
+
+
+@pytest.mark.parametrize("box", [None, (1024, 1024)])
+def test_lossy_re_save_misses(box):
+    jpeg = _encode(_capture(), "JPEG", quality=95)
+    key = normalize_photo(jpeg, box)[1]
+    resaved = _encode(Image.open(io.BytesIO(jpeg)), "JPEG", quality=80)
+    assert normalize_photo(resaved, box)[1] != key
+    assert normalize_photo(jpeg, box)[1] == key  # the same file is stable
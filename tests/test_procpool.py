@@ -0,0 +1,35 @@
+"""Process pool workers: each gets a small memory tier, not a full CACHE_MEM_MAX_BYTES copy."""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def memory_budget(_data) -> int:
+    """Runs in a worker: the memory tier budget of that process."""
+    from utils import cache
+    return cache.stats()["memory"]["max_bytes"]
+
+
+def test_workers_use_their_own_memory_tier_budget():
+    env = {**os.environ, "PROC_WORKERS": "1", "PROC_WARM": "false", "PROC_MEM_MAX_BYTES": str(4 << 20),
+           "CACHE_MEM_MAX_BYTES": str(64 << 20), "PYTHONPATH": os.pathsep.join([ROOT, HERE])}
+    script = ("from utils import procpool, cache; import test_procpool as t; "
+              "print(cache.stats()['memory']['max_bytes'], procpool.run(t.memory_budget, b''))")
+    out = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env,
+                         capture_output=True, text=True, timeout=120, check=True)
+    assert out.stdout.split() == [str(64 << 20), str(4 << 20)]
+
+
+def test_resizing_the_memory_tier_evicts_down_to_the_new_budget():
+    from utils.cache import _MemoryTier
+    tier = _MemoryTier(100)
+    for i in range(5):
+        tier.put(("t", i), i, 20)
+    tier.resize(50)
+    assert tier.stats()["bytes"] <= 50 and tier.get(("t", 4)) == 4 and tier.get(("t", 0)) is None
+    tier.resize(0)
+    tier.put(("t", 9), 9, 1)
+    assert tier.stats()["items"] == 0
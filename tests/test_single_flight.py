@@ -0,0 +1,72 @@
+"""Coalescing identical cartoon calls: a forced refresh never joins a call that may use the cache."""
+import asyncio
+import io
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from utils import gpt_async, gpt_image
+
+
+def _photo(seed: int) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", (64, 48), (seed % 256, 90, 200)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Fake upstream call: slow enough for a second caller to arrive; records force_fresh."""
+    calls = []
+    monkeypatch.setattr(gpt_image, "OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(gpt_image, "_lookup", lambda *args: None)
+
+    def fake(photo_bytes, photo, pixel_key, *, force_fresh):
+        calls.append(force_fresh)
+        time.sleep(0.3)
+        return (b"fresh" if force_fresh else b"cached-or-new"), False
+
+    async def fake_async(photo_bytes, photo, pixel_key, *, force_fresh):
+        calls.append(force_fresh)
+        await asyncio.sleep(0.3)
+        return (b"fresh" if force_fresh else b"cached-or-new"), False
+
+    monkeypatch.setattr(gpt_image, "_cartoonize_uncached", fake)
+    monkeypatch.setattr(gpt_async, "_cartoonize_uncached", fake_async)
+    return calls
+
+
+def test_sync_force_fresh_does_not_join_a_plain_call(upstream):
+    photo = _photo(1)
+    results = {}
+
+    def call(name, fresh):
+        results[name] = gpt_image.cartoonize_with_bg_remove(photo, force_fresh=fresh)[0]
+
+    threads = [threading.Thread(target=call, args=("plain", False)),
+               threading.Thread(target=call, args=("plain2", False)),
+               threading.Thread(target=call, args=("fresh", True))]
+    threads[0].start()
+    time.sleep(0.1)
+    for t in threads[1:]:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert results == {"plain": b"cached-or-new", "plain2": b"cached-or-new", "fresh": b"fresh"}
+    assert sorted(upstream) == [False, True]  # the second plain call was coalesced
+
+
+def test_async_force_fresh_does_not_join_a_plain_call(upstream):
+    photo = _photo(2)
+
+    async def run():
+        plain = asyncio.create_task(gpt_async.cartoonize_async(photo))
+        await asyncio.sleep(0.1)
+        return await asyncio.gather(plain, gpt_async.cartoonize_async(photo),
+                                    gpt_async.cartoonize_async(photo, force_fresh=True))
+
+    plain, plain2, fresh = asyncio.run(run())
+    assert plain[0] == plain2[0] == b"cached-or-new" and fresh[0] == b"fresh"
+    assert sorted(upstream) == [False, True]
@@ -0,0 +1,112 @@
+"""
+Sticker tiles: the bounding-box compositor must match a full-canvas reference pixel for pixel.
+The reference below is the renderer as it was before tiles were composited over boxes only:
+every layer is tile-sized, the glow is blurred over the whole canvas, layers are alpha-composited.
+"""
+import io
+import itertools
+
+import pytest
+from PIL import Image, ImageDraw, ImageFilter, ImageOps
+
+from utils import image_sheet as sheet
+from utils.cache import load_rgba
+
+
+def _reference_underlay(size, shape, theme, brand_color):
+    layer = Image.new("RGBA", size, (255, 255, 255, 0))
+    style = sheet._theme_style(theme, brand_color)
+    if style is None:
+        return layer
+    w, h = size
+    ring_col, glow_col, expand_mm, glow_w_mm, blur_mm = style
+    draw = ImageDraw.Draw(layer)
+    bbox, ring_width, radius = sheet._ring_geometry(size)
+    if shape == "circle":
+        draw.ellipse(bbox, outline=ring_col, width=ring_width)
+    else:
+        draw.rounded_rectangle(bbox, radius=radius, outline=ring_col, width=ring_width)
+    glow = Image.new("RGBA", size, (255, 255, 255, 0))
+    gdraw = ImageDraw.Draw(glow)
+    expand = sheet.mm_to_px(expand_mm)
+    gb = [bbox[0] - expand, bbox[1] - expand, bbox[2] + expand, bbox[3] + expand]
+    if shape == "circle":
+        gdraw.ellipse(gb, outline=glow_col, width=sheet.mm_to_px(glow_w_mm))
+    else:
+        gdraw.rounded_rectangle(gb, radius=max(10, min(w, h) // 18), outline=glow_col, width=sheet.mm_to_px(glow_w_mm))
+    glow = glow.filter(ImageFilter.GaussianBlur(radius=sheet.mm_to_px(blur_mm)))
+    return Image.alpha_composite(layer, glow)
+
+
+def _reference_tile(png, size, shape="circle", border="none", branding=False, brand_text="",
+                    theme="none", brand_color="#FF4081"):
+    w, h = size
+    tile = Image.new("RGBA", size, (255, 255, 255, 0))
+    inset = sheet.mm_to_px(sheet.BLEED_MM) + sheet.mm_to_px(sheet.SAFE_PAD_MM)
+    tile = Image.alpha_composite(tile, _reference_underlay(size, shape, theme, brand_color))
+
+    user_img = ImageOps.contain(load_rgba(png), (w - 2 * inset, h - 2 * inset), Image.LANCZOS)
+    content = Image.new("RGBA", size, (255, 255, 255, 0))
+    sheet._place_center(content, user_img)
+    if shape == "circle":
+        mask = sheet._circle_mask(size)
+    else:
+        mask = sheet._rounded_rect_mask(size, max(8, min(w, h) // 20))
+    shaped = Image.new("RGBA", size, (255, 255, 255, 0))
+    shaped.paste(content, (0, 0), mask=mask)
+
+    border_mask = sheet._border_mask(size, shape, border)
+    if border_mask is not None:
+        shaped.paste((0, 0, 0, 230), (0, 0), mask=border_mask)
+    if branding:
+        shaped = Image.alpha_composite(shaped, sheet._brand_layer(size, brand_text))
+    return Image.alpha_composite(tile, shaped)
+
+
+def _sticker(size, background=(0, 0, 0, 0)) -> bytes:
+    """A subject with a soft (semi-transparent) edge on a transparent or solid background."""
+    im = Image.new("RGBA", size, background)
+    subject = Image.new("L", size, 0)
+    ImageDraw.Draw(subject).ellipse([size[0] // 6, size[1] // 8, size[0] * 5 // 6, size[1] * 7 // 8], fill=255)
+    subject = subject.filter(ImageFilter.GaussianBlur(6))
+    im.paste((230, 120, 40, 255), (0, 0), mask=subject)
+    ImageDraw.Draw(im).rectangle([0, 0, size[0] // 3, 12], fill=(20, 60, 200, 128))
+    buf = io.BytesIO()
+    im.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+STICKERS = {
+    "tall-transparent": _sticker((300, 420)),
+    "wide-opaque": _sticker((480, 260), background=(250, 250, 250, 255)),
+}
+SHAPES = ["circle", "rounded"]
+BORDERS = ["none", "thin", "dotted"]
+THEMES = ["none", "gold", "neon", "brand"]
+BRANDING = [(False, ""), (True, ""), (True, "Photo Booth")]
+
+
+@pytest.mark.parametrize("shape,border,theme,branding",
+                         list(itertools.product(SHAPES, BORDERS, THEMES, BRANDING)))
+def test_tile_matches_full_canvas_reference(shape, border, theme, branding):
+    opts = dict(shape=shape, border=border, theme=theme, branding=branding[0], brand_text=branding[1],
+                brand_color="#2E7D32")
+    size = (420, 600)
+    for png in STICKERS.values():
+        got = sheet._compose_sticker_tile(png, size, **opts)
+        assert got.tobytes() == _reference_tile(png, size, **opts).tobytes()
+
+
+@pytest.mark.parametrize("opts", [
+    dict(shape="circle", border="none", theme="none"),
+    dict(shape="rounded", border="thick", theme="gold", branding=True, brand_text="Booth"),
+    dict(shape="circle", border="dotted", theme="neon", branding=True),
+    dict(shape="rounded", border="thin", theme="brand", brand_color="#FF0000"),
+])
+def test_sheet_tile_matches_full_canvas_reference(opts):
+    """At the real sheet tile size, through the memoized _cached_tile used by make_a4_sheet."""
+    size = sheet._sheet_layout()["tile_size"]
+    png = STICKERS["tall-transparent"]
+    opts = {**sheet._sheet_options({}), **opts}
+    got = sheet._cached_tile(png, target_size=size, **opts)
+    assert got.tobytes() == _reference_tile(png, size, **opts).tobytes()
@@ -0,0 +1,173 @@
+# Batch print: many guests on multi-page A4 PDFs. Pages are composed (raster, same look as the
+# PNG sheet) on the shared process pool and written out as soon as they are ready, so only the
+# pages in flight are ever held in memory.
+import io
+import os
+import hashlib
+from collections import deque
+from typing import Iterator, List, Optional
+from PIL import Image
+from . import procpool, metrics
+from .cache import get as cache_get, set as cache_set, file_for as cache_file_for
+from .image_sheet import _sheet_layout, _sheet_options, _cached_tile, _compose_page
+
+BATCH_PREFETCH = int(os.getenv("BATCH_PREFETCH", str(2 * max(1, procpool.PROC_WORKERS))))  # pages in flight
+BATCH_JPEG_QUALITY = int(os.getenv("BATCH_JPEG_QUALITY", "92"))  # pages are embedded as 300-DPI JPEGs
+MAX_GRID = 4  # up to 4 x 4 stickers per page
+
+def remember_sticker(png_bytes: bytes, key: str = None) -> str:
+    """
+    Keep a finished sticker so batch prints can refer to it by key (sha256 hex of the PNG).
+    Pass the key when it is already known: then only the cache index is checked, nothing is hashed or read.
+    """
+    key = key or hashlib.sha256(png_bytes).hexdigest()
+    if cache_file_for("sticker", key.encode("ascii")) is None:
+        cache_set("sticker", key.encode("ascii"), png_bytes)
+    return key
+
+
+def _valid_key(key: str) -> bool:
+    return len(key) == 64 and all(ch in "0123456789abcdef" for ch in key)
+
+
+def sticker_by_key(key: str):
+    """PNG bytes of a remembered sticker, or None if unknown/evicted."""
+    key = key.lower()
+    if not _valid_key(key):
+        return None
+    return cache_get("sticker", key.encode("ascii"))
+
+
+def sticker_file(key: str):
+    """Cache file holding a remembered sticker (for send_file), or None if unknown/evicted."""
+    key = key.lower()
+    if not _valid_key(key):
+        return None
+    return cache_file_for("sticker", key.encode("ascii"))
+
+
+def grid(options: dict = None):
+    """(cols, rows) from options["grid"] = {"cols", "rows"}; default 2 x 2. Raises ValueError."""
+    g = (options or {}).get("grid") or {}
+    cols, rows = int(g.get("cols", 2)), int(g.get("rows", 2))
+    if not (1 <= cols <= MAX_GRID and 1 <= rows <= MAX_GRID):
+        raise ValueError(f"grid must be between 1x1 and {MAX_GRID}x{MAX_GRID}")
+    return cols, rows
+
+
+def unreadable(stickers: List[bytes]) -> Optional[int]:
+    """
+    Index of the first sticker PIL cannot open and verify, or None. verify() reads the whole file
+    (PNG chunk CRCs included) without decoding pixels, so a batch is checked before streaming starts.
+    """
+    for i, data in enumerate(stickers):
+        try:
+            Image.open(io.BytesIO(data)).verify()
+        except Exception:
+            return i
+    return None
+
+
+def render_page(stickers: List[bytes], opts: dict, cols: int, rows: int) -> tuple:
+    """Compose one page (stickers fill the grid row by row) -> (JPEG bytes, width px, height px)."""
+    layout = _sheet_layout(cols, rows)
+    tiles = [_cached_tile(s, target_size=layout["tile_size"], **opts) for s in stickers]
+    page = _compose_page(tiles, layout).convert("RGB")
+    buf = io.BytesIO()
+    with metrics.stage("page_encode"):
+        page.save(buf, format="JPEG", quality=BATCH_JPEG_QUALITY, subsampling=0)
+    return buf.getvalue(), page.width, page.height
+
+
+def _pdf_pages(pages: Iterator[tuple]) -> Iterator[bytes]:
+    """
+    Minimal PDF writer: one full-page DCT image per page, emitted object by object.
+    Object 1 is the catalog and 2 the page tree (written last, once the page count is known).
+    """
+    from reportlab.lib.pagesizes import A4  # only the page size; the PDF itself is written here
+    offsets = {}
+    pos = 0
+
+    def emit(num, body, stream=None):
+        nonlocal pos
+        chunk = b"%d 0 obj\n%s\n" % (num, body)
+        if stream is not None:
+            chunk += b"stream\n" + stream + b"\nendstream\n"
+        chunk += b"endobj\n"
+        offsets[num] = pos
+        pos += len(chunk)
+        return chunk
+
+    head = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+    pos = len(head)
+    yield head
+    yield emit(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+    page_w, page_h = A4
+    kids = []
+    num = 3
+    for jpeg, w, h in pages:
+        img, content, page = num, num + 1, num + 2
+        num += 3
+        yield emit(img, b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB "
+                        b"/BitsPerComponent 8 /Filter /DCTDecode /Length %d >>" % (w, h, len(jpeg)), jpeg)
+        draw = b"q %.4f 0 0 %.4f 0 0 cm /Im0 Do Q" % (page_w, page_h)
+        yield emit(content, b"<< /Length %d >>" % len(draw), draw)
+        yield emit(page, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.4f %.4f] "
+                         b"/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>"
+                         % (page_w, page_h, img, content))
+        kids.append(page)
+
+    yield emit(2, b"<< /Type /Pages /Kids [%s] /Count %d >>"
+                  % (b" ".join(b"%d 0 R" % k for k in kids), len(kids)))
+
+    xref = [b"xref\n0 %d\n" % num, b"0000000000 65535 f \n"]
+    xref += [b"%010d 00000 n \n" % offsets[i] for i in range(1, num)]
+    yield b"".join(xref) + b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (num, pos)
+
+
+def stream_batch_pdf(stickers: List[bytes], options: dict = None, copies: int = 1) -> Iterator[bytes]:
+    """
+    Multi-page A4 PDF for many guests, yielded in chunks as pages finish.
+    Each sticker fills `copies` consecutive slots; guests are mixed across pages in order.
+    Options are the make_a4_sheet options plus grid = {"cols", "rows"}.
+    """
+    opts = _sheet_options(options)
+    cols, rows = grid(options)
+    copies = min(max(1, copies), MAX_GRID * MAX_GRID)
+    slots = [s for s in stickers for _ in range(copies)]
+    per_page = cols * rows
+    groups = [slots[i:i + per_page] for i in range(0, len(slots), per_page)]
+
+    return _logged(_pdf_pages(_ordered(groups, opts, cols, rows)), len(stickers))
+
+
+def _logged(chunks: Iterator[bytes], guests: int) -> Iterator[bytes]:
+    """
+    Pass the PDF through; a failure once streaming has begun (status 200 already sent) is logged and
+    re-raised, so the server aborts the response instead of ending it like a finished file.
+    """
+    sent = 0
+    try:
+        for chunk in chunks:
+            sent += len(chunk)
+            yield chunk
+    except Exception as e:
+        print(f"[batch-pdf] aborted after {sent} bytes ({guests} guests): {type(e).__name__}: {e}")
+        raise
+
+
+def _ordered(groups, opts, cols, rows):
+    """Render pages on the process pool in order, keeping at most BATCH_PREFETCH pages in flight."""
+    pending = deque()
+    todo = iter(groups)
+    for g in todo:
+        pending.append(procpool.submit(render_page, g, opts, cols, rows))
+        if len(pending) >= BATCH_PREFETCH:
+            break
+    while pending:
+        page = pending.popleft().result()
+        nxt = next(todo, None)
+        if nxt is not None:
+            pending.append(procpool.submit(render_page, nxt, opts, cols, rows))
+        yield page
@@ -2,20 +2,207 @@ import os
 import hashlib
 import time
 import tempfile
-from typing import Optional
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional, Callable, TypeVar
 from dotenv import load_dotenv
+from .imageload import STICKER_MAX_SIDE, open_image
 load_dotenv()
 
+try:
+    import fcntl  # POSIX only; cross-process coalescing is skipped elsewhere
+except ImportError:
+    fcntl = None
+
+T = TypeVar("T")
+
 # ---- Configurable locations/limits ----
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-CACHE_ROOT = os.getenv("CACHE_DIR") or os.path.normpath(os.path.join(BASE_DIR, "..", "cache"))
-os.makedirs(CACHE_ROOT, exist_ok=True)
+CACHE_ROOT = os.getenv("CACHE_DIR") or os.path.normpath(os.path.join(BASE_DIR, "..", "cache"))  # created on first use
 
 # TTL: seconds (0 = never expire)
 CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "0"))
-# Max files and bytes (0 = unbounded). Oldest items are pruned first.
+# Max files and bytes (0 = unbounded). Least-recently-used items are pruned first.
 MAX_FILES = int(os.getenv("CACHE_MAX_FILES", "0"))
 MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", "0"))
+# In-process memory tier in front of the disk (0 = disabled). Decoded images count at w*h*4 bytes.
+MEM_MAX_BYTES = int(os.getenv("CACHE_MEM_MAX_BYTES", str(128 * 1024 * 1024)))
+# Also coalesce identical work across processes via lock files under <cache>/locks
+PROCESS_LOCKS = os.getenv("CACHE_PROCESS_LOCKS", "false").lower() == "true"
+
+# ---- Persistent index (size / mtime / last access per entry) ----
+# The index lets writes enforce the limits without walking the cache tree:
+# running totals are kept by triggers, eviction reads the oldest rows off the atime index.
+INDEX_NAME = "index.sqlite3"
+INDEX_PATH = os.path.join(CACHE_ROOT, INDEX_NAME)
+SWEEP_BATCH = 64  # max rows removed per query while sweeping
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    path   TEXT PRIMARY KEY,
+    prefix TEXT NOT NULL,
+    size   INTEGER NOT NULL,
+    mtime  REAL NOT NULL,
+    atime  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_atime ON entries(atime);
+CREATE INDEX IF NOT EXISTS entries_mtime ON entries(mtime);
+CREATE INDEX IF NOT EXISTS entries_prefix ON entries(prefix);
+
+CREATE TABLE IF NOT EXISTS totals (
+    id    INTEGER PRIMARY KEY CHECK (id = 0),
+    files INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO totals (id, files, bytes) VALUES (0, 0, 0);
+
+CREATE TRIGGER IF NOT EXISTS entries_ins AFTER INSERT ON entries BEGIN
+    UPDATE totals SET files = files + 1, bytes = bytes + NEW.size WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_del AFTER DELETE ON entries BEGIN
+    UPDATE totals SET files = files - 1, bytes = bytes - OLD.size WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_upd AFTER UPDATE OF size ON entries BEGIN
+    UPDATE totals SET bytes = bytes - OLD.size + NEW.size WHERE id = 0;
+END;
+"""
+
+_lock = threading.RLock()
+_conn = None
+_clear_hooks = []  # callables(prefix) run after clear(), e.g. to drop indexes derived from entries
+
+
+class _MemoryTier:
+    """Byte-budgeted LRU map kept in process memory, with hit/miss/eviction counters."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()  # key -> (value, size, mtime)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            if CACHE_TTL_SECONDS > 0 and time.time() - item[2] > CACHE_TTL_SECONDS:
+                self._drop(key)
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value, size: int, mtime: float = None) -> None:
+        if self.max_bytes <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                self._drop(key)
+            self._items[key] = (value, size, mtime or time.time())
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._items))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def resize(self, max_bytes: int) -> None:
+        with self._lock:
+            self.max_bytes = max_bytes
+            while self._items and self._bytes > max(0, max_bytes):
+                self._drop(next(iter(self._items)))
+                self.evictions += 1
+
+    def discard(self, key) -> None:
+        with self._lock:
+            if key in self._items:
+                self._drop(key)
+
+    def clear(self, prefix: str = None) -> None:
+        with self._lock:
+            for key in [k for k in self._items if prefix is None or k[0] == prefix]:
+                self._drop(key)
+
+    def _drop(self, key) -> None:
+        _, size, _ = self._items.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"items": len(self._items), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+# Raw bytes (keyed by (prefix, rel path)) and decoded RGBA images (keyed by ("rgba", sha256 of PNG))
+# share one budget so a burst of prints can't push the memory tier past CACHE_MEM_MAX_BYTES.
+_mem = _MemoryTier(MEM_MAX_BYTES)
+_disk_counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+def _db() -> sqlite3.Connection:
+    """Open (once per process) the index; the first open adopts any files already on disk."""
+    global _conn
+    if _conn is None:
+        os.makedirs(CACHE_ROOT, exist_ok=True)
+        conn = sqlite3.connect(INDEX_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        if conn.execute("PRAGMA user_version").fetchone()[0] == 0:
+            _rebuild_index(conn)
+            conn.execute("PRAGMA user_version = 1")
+        _conn = conn
+    return _conn
+
+def _rebuild_index(conn: sqlite3.Connection) -> None:
+    """One-off scan of CACHE_ROOT so a pre-index cache (or a lost index) is tracked again."""
+    rows = []
+    for dirpath, _, filenames in os.walk(CACHE_ROOT):
+        for fn in filenames:
+            if not fn.endswith(".bin"):
+                continue
+            p = os.path.join(dirpath, fn)
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            rel = os.path.relpath(p, CACHE_ROOT).replace(os.sep, "/")
+            rows.append((rel, rel.split("/", 1)[0], st.st_size, st.st_mtime, st.st_mtime))
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM entries")
+        conn.executemany("INSERT INTO entries (path, prefix, size, mtime, atime) VALUES (?, ?, ?, ?, ?)", rows)
+
+def check_index() -> dict:
+    """
+    Startup check of the index: a corrupt database is dropped and rebuilt from the files on disk,
+    and running totals that drifted from the rows (e.g. after a crash mid-write) are recomputed.
+    """
+    global _conn
+    with _lock:
+        try:
+            ok = _db().execute("PRAGMA quick_check").fetchone()[0] == "ok"
+        except sqlite3.DatabaseError:
+            ok = False
+        if not ok:
+            if _conn is not None:
+                _conn.close()
+                _conn = None
+            for suffix in ("", "-wal", "-shm"):
+                try:
+                    os.remove(INDEX_PATH + suffix)
+                except FileNotFoundError:
+                    pass
+        db = _db()
+        files, total = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        repaired = db.execute("UPDATE totals SET files = ?, bytes = ? WHERE id = 0 AND (files != ? OR bytes != ?)",
+                              (files, total, files, total)).rowcount > 0
+    return {"ok": ok, "totals_repaired": repaired, "files": files, "bytes": total}
 
 def _key(bytes_data: bytes, *parts: str) -> str:
     m = hashlib.sha256()
@@ -32,27 +219,115 @@ def path_for(prefix: str, bytes_data: bytes, *parts: str) -> str:
     os.makedirs(subdir, exist_ok=True)
     return os.path.join(subdir, f"{h}.bin")
 
+def _rel(p: str) -> str:
+    return os.path.relpath(p, CACHE_ROOT).replace(os.sep, "/")
+
+def _remove(rel: str) -> None:
+    """Delete an entry's file and index row (best-effort)."""
+    _mem.discard((rel.split("/", 1)[0], rel))
+    try:
+        os.remove(os.path.join(CACHE_ROOT, rel))
+    except Exception:
+        pass
+    with _lock:
+        _db().execute("DELETE FROM entries WHERE path = ?", (rel,))
+
 def get(prefix: str, bytes_data: bytes, *parts: str) -> Optional[bytes]:
     p = path_for(prefix, bytes_data, *parts)
-    if not os.path.exists(p):
-        return None
+    rel = _rel(p)
+    now = time.time()
 
-    # TTL expiry
-    if CACHE_TTL_SECONDS > 0:
-        age = time.time() - os.path.getmtime(p)
-        if age > CACHE_TTL_SECONDS:
+    data = _mem.get((prefix, rel))
+    if data is not None:
+        _touch(rel, now)
+        return data
+
+    with _lock:
+        db = _db()
+        row = db.execute("SELECT mtime FROM entries WHERE path = ?", (rel,)).fetchone()
+        if row is None:
+            # Not indexed (written by another tool / older build): adopt it if present
             try:
-                os.remove(p)
-            except Exception:
-                pass
-            return None
+                st = os.stat(p)
+            except OSError:
+                _disk_counters["misses"] += 1
+                return None
+            db.execute(
+                "INSERT OR IGNORE INTO entries (path, prefix, size, mtime, atime) VALUES (?, ?, ?, ?, ?)",
+                (rel, prefix, st.st_size, st.st_mtime, st.st_mtime),
+            )
+            row = (st.st_mtime,)
+
+    # TTL expiry
+    if CACHE_TTL_SECONDS > 0 and now - row[0] > CACHE_TTL_SECONDS:
+        _remove(rel)
+        _disk_counters["misses"] += 1
+        return None
 
     try:
         with open(p, "rb") as f:
-            return f.read()
+            data = f.read()
     except Exception:
+        _remove(rel)
+        _disk_counters["misses"] += 1
         return None
 
+    _disk_counters["hits"] += 1
+    _mem.put((prefix, rel), data, len(data), row[0])
+    _touch(rel, now)
+    return data
+
+def file_for(prefix: str, bytes_data: bytes, *parts: str) -> Optional[str]:
+    """
+    Path of a live entry's file, for handing to send_file (the bytes never pass through Python),
+    or None. Counts as a read like get(); the file may still be evicted before it is opened.
+    """
+    p = path_for(prefix, bytes_data, *parts)
+    rel = _rel(p)
+    now = time.time()
+    with _lock:
+        row = _db().execute("SELECT mtime FROM entries WHERE path = ?", (rel,)).fetchone()
+    if row is None:
+        return p if get(prefix, bytes_data, *parts) is not None else None  # adopts unindexed files
+    if (CACHE_TTL_SECONDS > 0 and now - row[0] > CACHE_TTL_SECONDS) or not os.path.exists(p):
+        _remove(rel)
+        _disk_counters["misses"] += 1
+        return None
+    _disk_counters["hits"] += 1
+    _touch(rel, now)
+    return p
+
+def _touch(rel: str, now: float) -> None:
+    """Reads count as use for LRU eviction (memory hits included, so hot entries stay on disk)."""
+    with _lock:
+        _db().execute("UPDATE entries SET atime = ? WHERE path = ?", (now, rel))
+
+def load_rgba(png_bytes: bytes):
+    """
+    Decoded RGBA PIL.Image for these bytes, memoized in the memory tier.
+    The returned image is shared between callers — treat it as read-only.
+    Bounded by utils/imageload.py: header size check, decode budget, and reduced to about
+    IMAGE_STICKER_MAX_SIDE (raises imageload.ImageTooLarge past the pixel budget).
+    """
+    key = ("rgba", hashlib.sha256(png_bytes).hexdigest())
+    img = _mem.get(key)
+    if img is None:
+        img = open_image(png_bytes, "RGBA", max_side=STICKER_MAX_SIDE)
+        _mem.put(key, img, img.width * img.height * 4)
+    return img
+
+def mem_get(key: tuple):
+    """Look up a derived in-process object (e.g. a composed tile) in the memory tier."""
+    return _mem.get(key)
+
+def mem_put(key: tuple, value, size: int) -> None:
+    """Store a derived object in the memory tier; size is its approximate footprint in bytes."""
+    _mem.put(key, value, size)
+
+def mem_limit(max_bytes: int) -> None:
+    """Set this process's memory tier budget (pool workers run with PROC_MEM_MAX_BYTES); 0 disables it."""
+    _mem.resize(max_bytes)
+
 def set(prefix: str, bytes_data: bytes, out_bytes: bytes, *parts: str) -> None:
     p = path_for(prefix, bytes_data, *parts)
     d = os.path.dirname(p)
@@ -68,7 +343,16 @@ def set(prefix: str, bytes_data: bytes, out_bytes: bytes, *parts: str) -> None:
             with open(p, "wb") as f:
                 f.write(out_bytes)
         except Exception:
-            pass
+            return
+
+    now = time.time()
+    _mem.put((prefix, _rel(p)), out_bytes, len(out_bytes), now)
+    with _lock:
+        _db().execute(
+            "INSERT INTO entries (path, prefix, size, mtime, atime) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(path) DO UPDATE SET size = excluded.size, mtime = excluded.mtime, atime = excluded.atime",
+            (_rel(p), prefix, len(out_bytes), now, now),
+        )
     _maybe_sweep()
 
 def clear(prefix: str = None) -> None:
@@ -76,49 +360,127 @@ def clear(prefix: str = None) -> None:
     root = os.path.join(CACHE_ROOT, prefix) if prefix else CACHE_ROOT
     for dirpath, _, filenames in os.walk(root):
         for fn in filenames:
+            if dirpath == CACHE_ROOT and fn.startswith(INDEX_NAME):
+                continue  # keep the index db (and its -wal/-shm files)
             try:
                 os.remove(os.path.join(dirpath, fn))
             except Exception:
                 pass
+    _mem.clear(prefix)
+    with _lock:
+        if prefix:
+            _db().execute("DELETE FROM entries WHERE prefix = ?", (prefix,))
+        else:
+            _db().execute("DELETE FROM entries")
+    for hook in _clear_hooks:
+        hook(prefix)
+
+def on_clear(hook: Callable[[Optional[str]], None]) -> None:
+    """Run hook(prefix) after every clear() (prefix is None when everything was cleared)."""
+    _clear_hooks.append(hook)
+
+def stats() -> dict:
+    """Per-tier counters plus current disk totals from the index (no filesystem access)."""
+    with _lock:
+        files, total = _db().execute("SELECT files, bytes FROM totals WHERE id = 0").fetchone()
+    return {
+        "memory": _mem.stats(),
+        "disk": {"files": files, "bytes": total, "max_files": MAX_FILES, "max_bytes": MAX_BYTES,
+                 "ttl_seconds": CACHE_TTL_SECONDS, **_disk_counters},
+    }
 
 def _maybe_sweep():
-    """Enforce MAX_FILES / MAX_BYTES (oldest-first pruning)."""
-    if MAX_FILES <= 0 and MAX_BYTES <= 0:
+    """Enforce CACHE_TTL_SECONDS / MAX_FILES / MAX_BYTES incrementally (least-recently-used first)."""
+    if CACHE_TTL_SECONDS <= 0 and MAX_FILES <= 0 and MAX_BYTES <= 0:
         return
 
-    files = []
-    total = 0
-    for dirpath, _, filenames in os.walk(CACHE_ROOT):
-        for fn in filenames:
-            p = os.path.join(dirpath, fn)
-            try:
-                sz = os.path.getsize(p)
-                total += sz
-                files.append((os.path.getmtime(p), sz, p))
-            except Exception:
-                pass
+    with _lock:
+        db = _db()
 
-    files.sort()  # oldest first
+        # Expired entries (oldest writes first, via the mtime index)
+        if CACHE_TTL_SECONDS > 0:
+            cutoff = time.time() - CACHE_TTL_SECONDS
+            while True:
+                rows = db.execute(
+                    "SELECT path FROM entries WHERE mtime < ? ORDER BY mtime LIMIT ?", (cutoff, SWEEP_BATCH)
+                ).fetchall()
+                for (rel,) in rows:
+                    _remove(rel)
+                _disk_counters["evictions"] += len(rows)
+                if len(rows) < SWEEP_BATCH:
+                    break
 
-    # Prune by file count
-    if MAX_FILES > 0 and len(files) > MAX_FILES:
-        to_delete = len(files) - MAX_FILES
-        for i in range(to_delete):
-            try:
-                os.remove(files[i][2])
-            except Exception:
-                pass
-        files = files[to_delete:]
-
-    # Prune by total bytes
-    if MAX_BYTES > 0:
-        total = sum(sz for _, sz, _ in files)
-        i = 0
-        while total > MAX_BYTES and i < len(files):
-            _, sz, p = files[i]
+        # Over budget: evict by last access (reads and writes), via the atime index
+        while True:
+            files, total = db.execute("SELECT files, bytes FROM totals WHERE id = 0").fetchone()
+            over_files = MAX_FILES > 0 and files > MAX_FILES
+            over_bytes = MAX_BYTES > 0 and total > MAX_BYTES
+            if not (over_files or over_bytes):
+                break
+            n = files - MAX_FILES if over_files else 1
+            rows = db.execute(
+                "SELECT path FROM entries ORDER BY atime LIMIT ?", (max(1, min(n, SWEEP_BATCH)),)
+            ).fetchall()
+            if not rows:
+                break
+            for (rel,) in rows:
+                _remove(rel)
+            _disk_counters["evictions"] += len(rows)
+
+
+# ---- Single-flight: one computation per key at a time ----
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+def single_flight(fn: Callable[[], T], prefix: str, bytes_data: bytes, *parts: str) -> T:
+    """
+    Run fn() for this cache key unless an identical call is already in flight, in which case
+    wait for it and share its result (or exception). fn should re-check the cache itself:
+    with CACHE_PROCESS_LOCKS a caller that waited on another process's lock runs fn() afterwards.
+    """
+    key = f"{prefix}/{_key(bytes_data, *parts)}"
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    try:
+        flight.result = _locked(key, fn) if PROCESS_LOCKS and fcntl else fn()
+        return flight.result
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+
+def _locked(key: str, fn: Callable[[], T]) -> T:
+    """Hold an exclusive flock on <cache>/locks/<prefix>_<hash>.lock while fn() runs."""
+    lock_dir = os.path.join(CACHE_ROOT, "locks")
+    os.makedirs(lock_dir, exist_ok=True)
+    lock_path = os.path.join(lock_dir, key.replace("/", "_") + ".lock")
+    with open(lock_path, "a+b") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            return fn()
+        finally:
+            # Unlink before unlocking; a process that raced us onto the old inode re-checks the cache
             try:
-                os.remove(p)
-                total -= sz
-            except Exception:
+                os.remove(lock_path)
+            except OSError:
                 pass
-            i += 1
+            fcntl.flock(f, fcntl.LOCK_UN)
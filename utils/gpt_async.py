@@ -0,0 +1,146 @@
+import os
+import asyncio
+from dotenv import load_dotenv
+from . import gpt_image as gi, procpool, metrics
+from .normalize import normalize_photo, size_box
+
+load_dotenv()
+
+# ---- Async variant of cartoonize_with_bg_remove for the ASGI server (see asgi.py) ----
+# The upstream wait is an awaitable on one event loop instead of a parked thread; cache file I/O
+# and PIL work run on the default thread pool, the fallback on the process pool. Same cache keys,
+# rate limiter, retry policy and metrics as the threaded path.
+ASYNC_MAX_CONCURRENCY = int(os.getenv("GPT_ASYNC_MAX_CONCURRENCY", "256"))  # in-flight upstream calls per process
+ASYNC_POOL_SIZE       = int(os.getenv("GPT_ASYNC_POOL_SIZE", "64"))         # keep-alive connections to the API host
+
+_client = None
+_semaphore = None
+_flights = {}  # (pixel key, force_fresh) -> Future of the call converting that photo
+
+
+def _http():
+    """Shared httpx.AsyncClient (optional dependency: pip install httpx), created on the running loop."""
+    global _client, _semaphore
+    if _client is None:
+        import httpx
+        # The semaphore caps calls; the pool only bounds idle keep-alive connections (like requests' pool)
+        limits = httpx.Limits(max_connections=ASYNC_MAX_CONCURRENCY, max_keepalive_connections=ASYNC_POOL_SIZE)
+        _client = httpx.AsyncClient(limits=limits, timeout=gi.TIMEOUT_S)
+        _semaphore = asyncio.Semaphore(ASYNC_MAX_CONCURRENCY)
+    return _client
+
+
+async def close() -> None:
+    """Close the HTTP client (server shutdown)."""
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.aclose()
+
+
+async def offload(fn, data, *args, **kwargs):
+    """CPU-bound fn(data, ...) on the process pool without blocking the loop (a thread when PROC_WORKERS=0)."""
+    if procpool.PROC_WORKERS > 0:
+        return await asyncio.wrap_future(procpool.submit(fn, data, *args, **kwargs))
+    return await asyncio.to_thread(fn, data, *args, **kwargs)
+
+
+async def _post_edit(headers: dict, files: dict, data: dict):
+    """Awaitable gpt_image._post_edit: same retries, Retry-After handling, rate limit and status counters."""
+    import httpx
+    client = _http()
+    for attempt in range(gi.MAX_RETRIES + 1):
+        while (wait := gi._rate.try_acquire()) > 0:
+            await asyncio.sleep(wait)
+        try:
+            async with _semaphore:
+                resp = await client.post(gi.IMAGES_EDIT_URL, headers=headers, files=files, data=data)
+        except (httpx.NetworkError, httpx.ConnectTimeout, httpx.RemoteProtocolError):
+            metrics.count("booth_upstream_responses_total", status="error")
+            if attempt == gi.MAX_RETRIES:
+                raise
+            await asyncio.sleep(gi._backoff(attempt))
+            continue
+        except httpx.TimeoutException:
+            metrics.count("booth_upstream_responses_total", status="timeout")
+            raise
+        metrics.count("booth_upstream_responses_total", status=resp.status_code)
+
+        if resp.status_code == 200 or resp.status_code not in gi.RETRY_STATUSES or attempt == gi.MAX_RETRIES:
+            return resp
+        await asyncio.sleep(gi._retry_delay(resp, attempt))
+    return resp
+
+
+async def _fallback(photo_bytes: bytes) -> bytes:
+    from .local_cartoon import cartoonize_local
+    metrics.count("booth_cartoon_results_total", source="fallback")
+    with metrics.stage("fallback"):
+        return await offload(cartoonize_local, photo_bytes, remove_bg=True)
+
+
+async def cartoonize_async(photo_bytes: bytes, *, force_fresh: bool = False,
+                           reuse_similar: bool = False) -> tuple[bytes, bool]:
+    """Same contract as gpt_image.cartoonize_with_bg_remove: (png_bytes, used_fallback)."""
+    if not gi.OPENAI_API_KEY:
+        if gi.ALLOW_FALLBACK:
+            return await _fallback(photo_bytes), True
+        raise RuntimeError("OPENAI_API_KEY not set. Please configure it on the server.")
+
+    with metrics.stage("normalize"):
+        photo, pixel_key = await asyncio.to_thread(normalize_photo, photo_bytes, size_box(gi.IMG_SIZE))
+
+    if not force_fresh:
+        cached = await asyncio.to_thread(gi._lookup, photo, pixel_key, reuse_similar)
+        if cached:
+            return cached, False
+
+    # Single flight within this process: identical photos await the call already converting it
+    # (a forced refresh only joins other forced refreshes)
+    flight_key = (pixel_key, force_fresh)
+    flight = _flights.get(flight_key)
+    if flight is not None:
+        return await asyncio.shield(flight)
+    flight = _flights[flight_key] = asyncio.get_running_loop().create_future()
+    try:
+        result = await _cartoonize_uncached(photo_bytes, photo, pixel_key, force_fresh=force_fresh)
+        flight.set_result(result)
+        return result
+    except asyncio.CancelledError:
+        flight.cancel()
+        raise
+    except Exception as e:
+        flight.set_exception(e)
+        flight.exception()  # retrieved: no "never retrieved" warning when nobody else waited
+        raise
+    finally:
+        del _flights[flight_key]
+
+
+async def _cartoonize_uncached(photo_bytes: bytes, photo, pixel_key: bytes, *, force_fresh: bool):
+    import httpx
+    if not force_fresh:
+        cached = await asyncio.to_thread(gi._recheck, pixel_key)
+        if cached:
+            return cached, False
+
+    headers, files, data = await asyncio.to_thread(gi._edit_request, photo)
+    try:
+        with metrics.stage("upstream"):
+            try:
+                resp = await _post_edit(headers, files, data)
+            except httpx.TimeoutException:
+                resp = None
+            if (resp is None or resp.status_code != 200) and data["size"] != gi.DOWNGRADE_SIZE \
+                    and gi._downgrade_helps(resp):
+                data = {**data, "size": gi.DOWNGRADE_SIZE}
+                resp = await _post_edit(headers, files, data)
+            if resp is not None and resp.status_code == 200:
+                png_bytes = gi._decode_image_payload(resp.json())
+        if resp is None or resp.status_code != 200:
+            return await _fallback(photo_bytes), True
+    except Exception:
+        return await _fallback(photo_bytes), True
+
+    await asyncio.to_thread(gi._store, png_bytes, photo, pixel_key)
+    return png_bytes, False
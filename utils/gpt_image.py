@@ -1,14 +1,19 @@
 import os
-import io
 import base64
 import time
-import requests
+import random
+import threading
+import email.utils
 from dotenv import load_dotenv
-from PIL import Image, ImageFilter, ImageOps, ImageEnhance
-from .cache import get as cache_get, set as cache_set
+from .cache import get as cache_get, set as cache_set, path_for, single_flight
+from . import procpool, metrics
+from .normalize import normalize_photo, encode_upload, size_box
 
 load_dotenv()
 
+# requests, NumPy and the OpenCV helpers (local_cartoon, segment, similar) are imported where they are
+# used, so endpoints like /api/info don't pay for them; the startup warm-up (warmup.py) loads them early.
+
 # --- Config (env-driven) ---
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")                # may be None; handled at call time
 IMAGE_MODEL    = os.getenv("GPT_IMAGE_MODEL", "gpt-image-1")
@@ -17,8 +22,22 @@ IMG_QUALITY    = os.getenv("GPT_IMAGE_QUALITY", "high")
 IMG_FORMAT     = "png"
 TIMEOUT_S      = int(os.getenv("GPT_IMAGE_TIMEOUT_S", "90"))
 ALLOW_FALLBACK = os.getenv("GPT_ALLOW_FALLBACK_WITHOUT_KEY", "false").lower() == "true"
+CROP_TO_SUBJECT = os.getenv("GPT_CROP_TO_SUBJECT", "true").lower() == "true"  # upload only the subject box
+
+IMAGES_EDIT_URL = os.getenv("GPT_IMAGES_EDIT_URL", "https://api.openai.com/v1/images/edits")
+
+# --- HTTP client / retry policy ---
+HTTP_POOL_SIZE  = int(os.getenv("GPT_HTTP_POOL_SIZE", "8"))      # keep-alive connections to the API host
+MAX_RETRIES     = int(os.getenv("GPT_MAX_RETRIES", "3"))         # extra attempts on 429 / 5xx / connect errors
+BACKOFF_BASE_S  = float(os.getenv("GPT_BACKOFF_BASE_S", "1.0"))
+BACKOFF_MAX_S   = float(os.getenv("GPT_BACKOFF_MAX_S", "30"))
+MAX_CONCURRENCY = int(os.getenv("GPT_MAX_CONCURRENCY", "4"))     # in-flight upstream calls per process
+RATE_PER_MIN    = float(os.getenv("GPT_RATE_PER_MIN", "0"))      # request starts per minute (0 = unlimited)
+RETRY_STATUSES  = {408, 409, 429, 500, 502, 503, 504}
+DOWNGRADE_SIZE  = "1024x1024"
 
-IMAGES_EDIT_URL = "https://api.openai.com/v1/images/edits"
+# --- Progressive mode: quick local preview while the API call runs ---
+PREVIEW_MAX_SIDE = int(os.getenv("GPT_PREVIEW_MAX_SIDE", "384"))  # preview size (px, longest side)
 
 PROMPT = (
     "Convert this portrait photo into a high-quality cartoon/hand-drawn comic style while KEEPING "
@@ -37,27 +56,152 @@ def _decode_image_payload(json_obj: dict) -> bytes:
         raise ValueError("No base64 image payload found")
     return base64.b64decode(b64)
 
-def _local_cartoon_fallback(photo_bytes: bytes) -> bytes:
+class _RateLimiter:
+    """Token bucket for request starts, plus a shared cool-down set from Retry-After."""
+
+    def __init__(self, per_min: float):
+        self.rate = per_min / 60.0
+        self.capacity = max(1.0, per_min / 60.0)
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+        self.cooldown_until = 0.0
+        self.lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        """Take a token and return 0, or return the seconds to wait before trying again."""
+        with self.lock:
+            now = time.monotonic()
+            wait = self.cooldown_until - now
+            if wait <= 0 and self.rate > 0:
+                self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return 0.0
+                wait = (1 - self.tokens) / self.rate
+            return max(0.0, wait)
+
+    def acquire(self) -> None:
+        while (wait := self.try_acquire()) > 0:
+            time.sleep(wait)
+
+    def cool_down(self, seconds: float) -> None:
+        """Hold back every caller (not just the one that got the 429)."""
+        with self.lock:
+            self.cooldown_until = max(self.cooldown_until, time.monotonic() + seconds)
+
+_rate = _RateLimiter(RATE_PER_MIN)
+_concurrency = threading.BoundedSemaphore(MAX_CONCURRENCY)
+_session = None
+_session_lock = threading.Lock()
+
+def _http():
+    """Shared keep-alive requests.Session so calls reuse TCP/TLS connections."""
+    global _session
+    import requests
+    from requests.adapters import HTTPAdapter
+    with _session_lock:
+        if _session is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            _session = s
+    return _session
+
+def _retry_after(resp) -> float | None:
+    """Seconds from a Retry-After header (delta-seconds or HTTP date), if present."""
+    value = resp.headers.get("Retry-After") if resp is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+def _backoff(attempt: int) -> float:
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, min(BACKOFF_MAX_S, BACKOFF_BASE_S * (2 ** attempt)))
+
+def _post_edit(headers: dict, files: dict, data: dict):
     """
-    Simple, fast local stylization (no BG removal) — last resort to keep booth running.
+    POST to the edit endpoint through the shared session, rate limiter and concurrency cap.
+    Retries 429/5xx and connection failures (honoring Retry-After); returns the last response,
+    or re-raises the last connection error. Read timeouts are not retried here.
     """
-    im = Image.open(io.BytesIO(photo_bytes)).convert("RGB")
-    base = ImageOps.posterize(im, 3)
-    base = ImageEnhance.Color(base).enhance(1.2)
-    base = ImageEnhance.Sharpness(base).enhance(1.3)
+    import requests
+    for attempt in range(MAX_RETRIES + 1):
+        _rate.acquire()
+        try:
+            with _concurrency:
+                resp = _http().post(IMAGES_EDIT_URL, headers=headers, files=files, data=data, timeout=TIMEOUT_S)
+        except requests.ConnectionError:
+            metrics.count("booth_upstream_responses_total", status="error")
+            if attempt == MAX_RETRIES:
+                raise
+            time.sleep(_backoff(attempt))
+            continue
+        except requests.Timeout:
+            metrics.count("booth_upstream_responses_total", status="timeout")
+            raise
+        metrics.count("booth_upstream_responses_total", status=resp.status_code)
+
+        if resp.status_code == 200 or resp.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+            return resp
+        time.sleep(_retry_delay(resp, attempt))
+    return resp
+
+def _retry_delay(resp, attempt: int) -> float:
+    """Wait before retrying a 429/5xx: Retry-After when given (a 429 holds back every caller), else backoff."""
+    delay = _retry_after(resp)
+    if delay is None:
+        return _backoff(attempt)
+    delay = min(BACKOFF_MAX_S, delay)
+    if resp.status_code == 429:
+        _rate.cool_down(delay)
+    return delay
 
-    edges = im.convert("L").filter(ImageFilter.FIND_EDGES).filter(ImageFilter.SMOOTH_MORE)
-    edges_col = ImageOps.colorize(edges, black=(10,10,10), white=(255,255,255))
-    out = Image.blend(base, edges_col, alpha=0.15).convert("RGBA")
+def _downgrade_helps(resp) -> bool:
+    """A smaller output only helps if the size was rejected or the server kept failing (None = timed out)."""
+    if resp is None or resp.status_code >= 500:
+        return True
+    if resp.status_code == 400:
+        return "size" in resp.text.lower()
+    return False
 
-    buf = io.BytesIO()
-    out.save(buf, format="PNG")
-    return buf.getvalue()
+def _local_cartoon_fallback(photo_bytes: bytes) -> bytes:
+    """
+    Local OpenCV cartoon filter with GrabCut BG removal — last resort to keep booth running.
+    """
+    from .local_cartoon import cartoonize_local
+    metrics.count("booth_cartoon_results_total", source="fallback")
+    with metrics.stage("fallback"):
+        return procpool.run(cartoonize_local, photo_bytes, remove_bg=True)
 
-def cartoonize_with_bg_remove(photo_bytes: bytes, *, force_fresh: bool = False) -> tuple[bytes, bool]:
+def cartoon_preview(photo_bytes: bytes) -> bytes:
+    """
+    Low-resolution local cartoon (no background removal) to show while the API result is pending.
+    Cached under its own prefix, keyed by the upload, so a retake/retry of the same photo is free.
+    """
+    cached = cache_get("preview", photo_bytes, str(PREVIEW_MAX_SIDE), "v1")
+    if cached:
+        return cached
+    from .local_cartoon import cartoonize_local
+    with metrics.stage("preview"):
+        png_bytes = procpool.run(cartoonize_local, photo_bytes, max_side=PREVIEW_MAX_SIDE)
+    cache_set("preview", photo_bytes, png_bytes, str(PREVIEW_MAX_SIDE), "v1")
+    return png_bytes
+
+def cartoonize_with_bg_remove(photo_bytes: bytes, *, force_fresh: bool = False,
+                              reuse_similar: bool = False) -> tuple[bytes, bool]:
     """
     Returns: (png_bytes, used_fallback: bool)
-    - Uses disk cache (unless force_fresh=True)
+    - Uses disk cache keyed by the normalized pixels (unless force_fresh=True)
+    - reuse_similar=True also accepts a recent result for a near-identical photo (pHash index)
     - Calls OpenAI Images Edit with background=transparent
     - Falls back to local stylize on error (or when key missing and ALLOW_FALLBACK is true)
     """
@@ -68,15 +212,55 @@ def cartoonize_with_bg_remove(photo_bytes: bytes, *, force_fresh: bool = False)
             return png_bytes, True
         raise RuntimeError("OPENAI_API_KEY not set. Please configure it on the server.")
 
-    # 1) Cache check (skip when force_fresh)
+    # 1) Decode once: orient + fit to IMG_SIZE; the cache key hashes these pixels, not the upload
+    with metrics.stage("normalize"):
+        photo, pixel_key = normalize_photo(photo_bytes, size_box(IMG_SIZE))
+
+    # 2) Cache check (skip when force_fresh)
     if not force_fresh:
-        cached = cache_get("cartoon", photo_bytes, IMAGE_MODEL, IMG_SIZE, IMG_QUALITY, "v1")
+        cached = _lookup(photo, pixel_key, reuse_similar)
         if cached:
             return cached, False
 
-    # 2) Call OpenAI (with fallback size)
+    # 3) Identical photos already being converted (double-click, two kiosks) wait for that call;
+    #    a forced refresh only joins other forced refreshes, never a call that may return the cache
+    return single_flight(
+        lambda: _cartoonize_uncached(photo_bytes, photo, pixel_key, force_fresh=force_fresh),
+        "cartoon", pixel_key, IMAGE_MODEL, IMG_SIZE, IMG_QUALITY, "v2", "fresh" if force_fresh else "cached",
+    )
+
+def _lookup(photo, pixel_key: bytes, reuse_similar: bool):
+    """Cached cartoon for these pixels (or, with reuse_similar, a near-identical photo's), else None."""
+    with metrics.stage("cache_lookup"):
+        cached = cache_get("cartoon", pixel_key, IMAGE_MODEL, IMG_SIZE, IMG_QUALITY, "v2")
+        source = "cache"
+        if not cached and reuse_similar:
+            from . import similar
+            match = similar.nearest(similar.phash(photo))
+            cached = match and cache_get("cartoon", match[0], IMAGE_MODEL, IMG_SIZE, IMG_QUALITY, "v2")
+            source = "similar"
+    metrics.count("booth_cartoon_cache_lookups_total", result=source if cached else "miss")
+    if cached:
+        metrics.count("booth_cartoon_results_total", source=source)
+    return cached
+
+def _recheck(pixel_key: bytes):
+    """Cache re-check inside single_flight: another caller may have finished this photo meanwhile."""
+    cached = cache_get("cartoon", pixel_key, IMAGE_MODEL, IMG_SIZE, IMG_QUALITY, "v2")
+    if cached:
+        metrics.count("booth_cartoon_results_total", source="cache")
+    return cached
+
+def _edit_request(photo) -> tuple[dict, dict, dict]:
+    """(headers, files, data) for the edit call: the subject box of the normalized photo, compactly encoded."""
+    import numpy as np
+    from .segment import crop_box
+    with metrics.stage("upload_encode"):
+        box = crop_box(np.asarray(photo)[:, :, ::-1]) if CROP_TO_SUBJECT else None
+        upload, mime, filename = encode_upload(photo.crop(box) if box else photo)
+
     headers = {"Authorization": f"Bearer {OPENAI_API_KEY}"}
-    files = {"image[]": ("input.png", photo_bytes, "image/png")}
+    files = {"image[]": (filename, upload, mime)}
     data = {
         "model": IMAGE_MODEL,
         "prompt": PROMPT,
@@ -86,27 +270,47 @@ def cartoonize_with_bg_remove(photo_bytes: bytes, *, force_fresh: bool = False)
         "format": IMG_FORMAT,
         "n": "1",
     }
+    return headers, files, data
+
+def _store(png_bytes: bytes, photo, pixel_key: bytes) -> None:
+    """Cache a fresh upstream result and index its photo for near-duplicate reuse."""
+    from . import similar
+    cache_set("cartoon", pixel_key, png_bytes, IMAGE_MODEL, IMG_SIZE, IMG_QUALITY, "v2")
+    path = path_for("cartoon", pixel_key, IMAGE_MODEL, IMG_SIZE, IMG_QUALITY, "v2")
+    similar.add(similar.phash(photo), pixel_key, path)
+    metrics.count("booth_cartoon_results_total", source="upstream")
 
-    t0 = time.time()
+def _cartoonize_uncached(photo_bytes: bytes, photo, pixel_key: bytes, *, force_fresh: bool) -> tuple[bytes, bool]:
+    """Upstream call + cache write; runs at most once at a time per cache key (see single_flight)."""
+    import requests
+    # Re-check: another process may have finished this photo while we waited on its lock
+    if not force_fresh:
+        cached = _recheck(pixel_key)
+        if cached:
+            return cached, False
+
+    # Call OpenAI (with fallback size)
+    headers, files, data = _edit_request(photo)
     try:
-        resp = requests.post(IMAGES_EDIT_URL, headers=headers, files=files, data=data, timeout=TIMEOUT_S)
-        if resp.status_code != 200:
-            # fallback: try smaller size once
-            data_small = {**data, "size": "1024x1024"}
-            resp2 = requests.post(IMAGES_EDIT_URL, headers=headers, files=files, data=data_small, timeout=TIMEOUT_S)
-            if resp2.status_code != 200:
-                png_bytes = _local_cartoon_fallback(photo_bytes)
-                return png_bytes, True
-            png_bytes = _decode_image_payload(resp2.json())
-        else:
-            png_bytes = _decode_image_payload(resp.json())
+        # Upstream time includes retries, backoff and the downsized second try
+        with metrics.stage("upstream"):
+            try:
+                resp = _post_edit(headers, files, data)
+            except requests.Timeout:
+                resp = None
+            if (resp is None or resp.status_code != 200) and data["size"] != DOWNGRADE_SIZE and _downgrade_helps(resp):
+                # fallback: try smaller size once
+                data = {**data, "size": DOWNGRADE_SIZE}
+                resp = _post_edit(headers, files, data)
+            if resp is not None and resp.status_code == 200:
+                png_bytes = _decode_image_payload(resp.json())
+        if resp is None or resp.status_code != 200:
+            png_bytes = _local_cartoon_fallback(photo_bytes)
+            return png_bytes, True
     except Exception:
         png_bytes = _local_cartoon_fallback(photo_bytes)
         return png_bytes, True
-    finally:
-        t1 = time.time()
-        print(f"[cartoonize] {IMAGE_MODEL} total {t1 - t0:.2f}s, size={data.get('size')}")
 
-    # 3) Cache & return
-    cache_set("cartoon", photo_bytes, png_bytes, IMAGE_MODEL, IMG_SIZE, IMG_QUALITY, "v1")
+    # Cache & return
+    _store(png_bytes, photo, pixel_key)
     return png_bytes, False
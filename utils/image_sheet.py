@@ -3,6 +3,11 @@ from PIL import Image, ImageDraw, ImageOps, ImageFont, ImageFilter
 import io
 import os
 import math
+import json
+import hashlib
+from functools import lru_cache
+from .cache import load_rgba, mem_get, mem_put, get as cache_get, set as cache_set
+from . import metrics
 
 # === Define print metrics for A4 sheet ===
 DPI = 300  # Set resolution to 300 DPI
@@ -31,6 +36,13 @@ BORDER_MAP = {
     "dotted": 6,  # Dotted border (6px)
 }
 
+# Define output encoding for PNG-route sheets (defaults favor latency; override per request)
+SHEET_FORMAT = os.getenv("SHEET_FORMAT", "png").lower()  # png | jpeg | webp
+SHEET_PNG_COMPRESS_LEVEL = int(os.getenv("SHEET_PNG_COMPRESS_LEVEL", "1"))  # zlib level 0-9
+SHEET_PNG_OPTIMIZE = os.getenv("SHEET_PNG_OPTIMIZE", "false").lower() == "true"  # extra slow pass
+SHEET_QUALITY = int(os.getenv("SHEET_QUALITY", "92"))  # JPEG/WebP quality
+SHEET_MIMETYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
 # Draw a dashed line between two points
 def _draw_dashed_line(draw, p1, p2, dash=20, gap=14, fill=(0,0,0,120), width=3):
     x1, y1 = p1; x2, y2 = p2
@@ -65,7 +77,8 @@ def _dotted_rect(draw, bbox, fill, width=4, dash=16, gap=10):
 
 
 
-# Create a mask for a rounded rectangle
+# Create a mask for a rounded rectangle (memoized per size; treat as read-only)
+@lru_cache(maxsize=16)
 def _rounded_rect_mask(size, radius):
     w, h = size  # Unpack size
     mask = Image.new("L", size, 0)  # Create a grayscale mask
@@ -73,7 +86,8 @@ def _rounded_rect_mask(size, radius):
     draw.rounded_rectangle([0,0,w,h], radius=radius, fill=255)  # Draw filled rounded rectangle
     return mask
 
-# Create a mask for a circular shape
+# Create a mask for a circular shape (memoized per size; treat as read-only)
+@lru_cache(maxsize=16)
 def _circle_mask(size):
     w, h = size  # Unpack size
     r = min(w, h) // 2  # Calculate radius
@@ -90,7 +104,8 @@ def _place_center(base_rgba, fg_rgba):
     y = (bh - fh) // 2      # Calculate y offset for centering
     base_rgba.alpha_composite(fg_rgba, dest=(x, y))  # Composite foreground onto base
 
-# Load brand icon from possible file paths
+# Load brand icon from possible file paths (read once per process; treat as read-only)
+@lru_cache(maxsize=1)
 def _load_brand_icon():
     candidates = [
         os.path.join("static", "img", "brand.png"),  # Path to brand icon
@@ -118,83 +133,195 @@ def _parse_hex(color_hex, default=(255,64,129)):
 
 
 
-# Create themed underlay with ring and glow effects
-def _theme_underlay(size, shape, theme, brand_color="#FF4081"):
-    """Return an RGBA underlay with ring/glow per theme."""
+# Ring/glow styling per theme: (ring color, glow color, glow expand mm, glow stroke mm, blur mm)
+def _theme_style(theme, brand_color="#FF4081"):
+    if theme == "gold":
+        return (255, 200, 60), (255, 220, 120, 120), 4, 6, 2  # Gold ring, soft glow
+    if theme == "neon":
+        return (255, 64, 129, 200), (0, 229, 255, 200), 3, 8, 3  # Pink inner ring, cyan outer glow
+    if theme == "brand":
+        col = _parse_hex(brand_color)  # Parse brand color
+        return (*col, 230), (*col, 140), 2, 6, 2  # Brand ring, subtle glow
+    return None  # theme == "none": no ring/glow
+
+# Ring geometry shared by the raster and PDF renderers: (bbox, ring width, corner radius)
+def _ring_geometry(size):
+    w, h = size
+    pad = mm_to_px(2)  # Define insets for ring
+    return [pad, pad, w - pad, h - pad], mm_to_px(3.5), max(8, min(w,h)//20)
+
+# Create the blurred glow band for a theme (memoized; None for theme "none")
+@lru_cache(maxsize=32)
+def _theme_glow(size, shape, theme, brand_color="#FF4081"):
+    style = _theme_style(theme, brand_color)
+    if style is None:
+        return None
     w, h = size
+    _, glow_col, expand_mm, glow_w_mm, blur_mm = style
+    bbox, _, _ = _ring_geometry(size)
+    glow = Image.new("RGBA", size, (255,255,255,0))
+    gdraw = ImageDraw.Draw(glow)
+    expand = mm_to_px(expand_mm)
+    gb = [bbox[0]-expand, bbox[1]-expand, bbox[2]+expand, bbox[3]+expand]
+    glow_w = mm_to_px(glow_w_mm)
+    glow_r = max(10, min(w,h)//18)
+    if shape == "circle":
+        gdraw.ellipse(gb, outline=glow_col, width=glow_w)
+    else:
+        gdraw.rounded_rectangle(gb, radius=glow_r, outline=glow_col, width=glow_w)
+
+    # Blur only the band around the ring: inside the ring (less the blur's reach) stays empty
+    blur = mm_to_px(blur_mm)
+    reach = 3 * blur + 8  # the box-blur passes of GaussianBlur never reach further than this
+    inset = glow_w + reach
+    if shape == "circle":  # largest rectangle inside the ellipse's inner edge
+        ax, ay = (gb[2] - gb[0]) / 2 - glow_w, (gb[3] - gb[1]) / 2 - glow_w
+        cx, cy = (gb[0] + gb[2]) / 2, (gb[1] + gb[3]) / 2
+        hole = [int(cx - ax / math.sqrt(2)) + reach, int(cy - ay / math.sqrt(2)) + reach,
+                int(cx + ax / math.sqrt(2)) - reach, int(cy + ay / math.sqrt(2)) - reach]
+    else:
+        hole = [gb[0] + inset + glow_r, gb[1] + inset + glow_r, gb[2] - inset - glow_r, gb[3] - inset - glow_r]
+    if hole[2] - hole[0] < 2 * reach or hole[3] - hole[1] < 2 * reach:
+        return glow.filter(ImageFilter.GaussianBlur(radius=blur))  # Apply blur
+    x0, y0, x1, y1 = hole
+    out = glow.copy()
+    for band in ([0, 0, w, y0], [0, y1, w, h], [0, y0, x0, y1], [x1, y0, w, y1]):  # top, bottom, left, right
+        src = [max(0, band[0] - reach), max(0, band[1] - reach), min(w, band[2] + reach), min(h, band[3] + reach)]
+        part = glow.crop(src).filter(ImageFilter.GaussianBlur(radius=blur))
+        out.paste(part.crop((band[0] - src[0], band[1] - src[1], band[2] - src[0], band[3] - src[1])), band[:2])
+    return out
+
+# Create themed underlay with ring and glow effects (memoized per option combination)
+@lru_cache(maxsize=32)
+def _theme_underlay(size, shape, theme, brand_color="#FF4081"):
+    """Return an RGBA underlay with ring/glow per theme. Shared between tiles — treat as read-only."""
     layer = Image.new("RGBA", size, (255,255,255,0))  # Create transparent RGBA layer
-    draw = ImageDraw.Draw(layer)
+    style = _theme_style(theme, brand_color)
+    if style is None:
+        return layer  # theme == "none": transparent
 
-    # Define insets for ring
-    pad = mm_to_px(2)
-    bbox = [pad, pad, w - pad, h - pad]
-    ring_width = mm_to_px(3.5)
+    # Draw ring, then the soft glow over it
+    draw = ImageDraw.Draw(layer)
+    bbox, ring_width, radius = _ring_geometry(size)
+    if shape == "circle":
+        draw.ellipse(bbox, outline=style[0], width=ring_width)
+    else:
+        draw.rounded_rectangle(bbox, radius=radius, outline=style[0], width=ring_width)
+    return Image.alpha_composite(layer, _theme_glow(size, shape, theme, brand_color))
 
-    if theme == "gold":
-        gold = (255, 200, 60)  # Define gold color
-        # Draw ring
-        if shape == "circle":
-            draw.ellipse(bbox, outline=gold, width=ring_width)
-        else:
-            draw.rounded_rectangle(bbox, radius=max(8, min(w,h)//20), outline=gold, width=ring_width)
-        # Add soft glow
-        glow = Image.new("RGBA", size, (255,255,255,0))
-        gdraw = ImageDraw.Draw(glow)
-        expand = mm_to_px(4)
-        gb = [bbox[0]-expand, bbox[1]-expand, bbox[2]+expand, bbox[3]+expand]
-        if shape == "circle":
-            gdraw.ellipse(gb, outline=(255,220,120,120), width=mm_to_px(6))
-        else:
-            gdraw.rounded_rectangle(gb, radius=max(10, min(w,h)//18), outline=(255,220,120,120), width=mm_to_px(6))
-        glow = glow.filter(ImageFilter.GaussianBlur(radius=mm_to_px(2)))  # Apply blur
-        layer = Image.alpha_composite(layer, glow)
-
-    elif theme == "neon":
-        neon1 = (255, 64, 129, 200)  # Inner neon color
-        neon2 = (0, 229, 255, 200)   # Outer neon color
-        # Draw inner ring
-        if shape == "circle":
-            draw.ellipse(bbox, outline=neon1, width=ring_width)
-        else:
-            draw.rounded_rectangle(bbox, radius=max(8, min(w,h)//20), outline=neon1, width=ring_width)
-        # Add outer glow
-        glow = Image.new("RGBA", size, (255,255,255,0))
-        gdraw = ImageDraw.Draw(glow)
-        expand = mm_to_px(3)
-        gb = [bbox[0]-expand, bbox[1]-expand, bbox[2]+expand, bbox[3]+expand]
-        if shape == "circle":
-            gdraw.ellipse(gb, outline=neon2, width=mm_to_px(8))
-        else:
-            gdraw.rounded_rectangle(gb, radius=max(10, min(w,h)//18), outline=neon2, width=mm_to_px(8))
-        glow = glow.filter(ImageFilter.GaussianBlur(radius=mm_to_px(3)))  # Apply blur
-        layer = Image.alpha_composite(layer, glow)
+# Border outline box, inset into the bleed
+def _border_bbox(size):
+    w, h = size
+    inset = max(mm_to_px(BLEED_MM) // 2, 8)
+    return [inset, inset, w - inset, h - inset]
 
-    elif theme == "brand":
-        col = _parse_hex(brand_color)  # Parse brand color
-        if shape == "circle":
-            draw.ellipse(bbox, outline=(*col, 230), width=ring_width)
+# Build the border stroke as a binary mask (memoized per size/shape/border; None = no border)
+@lru_cache(maxsize=32)
+def _border_mask(size, shape, border):
+    border_px = BORDER_MAP.get(border, 0)
+    if not (border_px > 0 or border == "dotted"):
+        return None
+    w, h = size
+    mask = Image.new("L", size, 0)
+    draw = ImageDraw.Draw(mask)
+    bbox = _border_bbox(size)
+    if shape == "circle":
+        if border == "dotted":
+            _dotted_ellipse(draw, bbox, fill=255, width=BORDER_MAP["dotted"])
         else:
-            draw.rounded_rectangle(bbox, radius=max(8, min(w,h)//20), outline=(*col,230), width=ring_width)
-        # Add subtle glow
-        glow = Image.new("RGBA", size, (255,255,255,0))
-        gdraw = ImageDraw.Draw(glow)
-        expand = mm_to_px(2)
-        gb = [bbox[0]-expand, bbox[1]-expand, bbox[2]+expand, bbox[3]+expand]
-        gcol = (*col, 140)
-        if shape == "circle":
-            gdraw.ellipse(gb, outline=gcol, width=mm_to_px(6))
+            draw.ellipse(bbox, outline=255, width=border_px)
+    else:
+        if border == "dotted":
+            _dotted_rect(draw, bbox, fill=255, width=BORDER_MAP["dotted"])
         else:
-            gdraw.rounded_rectangle(gb, radius=max(10, min(w,h)//18), outline=gcol, width=mm_to_px(6))
-        glow = glow.filter(ImageFilter.GaussianBlur(radius=mm_to_px(2)))  # Apply blur
-        layer = Image.alpha_composite(layer, glow)
-
-    # theme == "none": transparent
-    return layer
+            draw.rounded_rectangle(bbox, radius=max(8, min(w,h)//20), outline=255, width=border_px)
+    return mask
 
-# Compose a single sticker tile with specified options
+# Load the brand font once
+@lru_cache(maxsize=1)
+def _brand_font():
+    try:
+        return ImageFont.truetype("arial.ttf", size=mm_to_px(3.2))
+    except Exception:
+        return ImageFont.load_default()
+
+# Measure text with whichever API this Pillow provides (textsize was removed in Pillow 10)
+def _text_size(draw, text, font):
+    if hasattr(draw, "textbbox"):
+        x0, y0, x1, y1 = draw.textbbox((0, 0), text, font=font)
+        return x1, y1
+    return draw.textsize(text, font=font)
+
+# Build the branding layer (icon and/or text), memoized per size/text; treat as read-only
+@lru_cache(maxsize=16)
+def _brand_layer(size, brand_text):
+    w, h = size
+    brand_layer = Image.new("RGBA", size, (255,255,255,0))
+    draw_b = ImageDraw.Draw(brand_layer)
+    pad = mm_to_px(3)
+    icon_h = mm_to_px(10)
+    x_right = w - pad
+    y_bottom = h - pad
+
+    # Add brand icon if available
+    icon = _load_brand_icon()
+    if icon:
+        iw, ih = icon.size
+        scale = icon_h / ih
+        new_size = (int(iw*scale), int(ih*scale))
+        icon_r = icon.resize(new_size, Image.LANCZOS)
+        bx = x_right - new_size[0]
+        by = y_bottom - new_size[1]
+        brand_layer.alpha_composite(icon_r, dest=(bx, by))
+        x_right = bx - pad
+
+    # Add brand text if provided
+    if brand_text:
+        font = _brand_font()
+        tw, th = _text_size(draw_b, brand_text, font)  # Calculate text size
+        bx = x_right - tw
+        by = y_bottom - th
+        bg_pad = 6
+        draw_b.rounded_rectangle([bx-bg_pad, by-bg_pad, x_right+bg_pad, y_bottom+bg_pad],
+                                 radius=8, fill=(255,255,255,180))  # Draw text background
+        draw_b.text((bx, by), brand_text, fill=(10,10,10,255), font=font)  # Draw text
+    return brand_layer
+
+# Intersection and union of (x0, y0, x1, y1) boxes
+def _box_and(a, b):
+    return (max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3]))
+
+def _box_or(a, b):
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+# Shape mask for a tile and the box it covers (memoized; treat as read-only)
+@lru_cache(maxsize=32)
+def _shape_mask(size, shape):
+    w, h = size
+    if shape == "circle":
+        mask = _circle_mask(size)
+    else:
+        mask = _rounded_rect_mask(size, max(8, min(w, h) // 20))  # Corner radius
+    return mask, mask.getbbox() or (0, 0, 0, 0)
+
+# Border mask cropped to the stroke (memoized; None = no border)
+@lru_cache(maxsize=32)
+def _border_patch(size, shape, border):
+    mask = _border_mask(size, shape, border)
+    box = mask.getbbox() if mask is not None else None
+    return (box, mask.crop(box)) if box else None
+
+# Branding layer cropped to where it draws (memoized; None = nothing to draw)
+@lru_cache(maxsize=16)
+def _brand_patch(size, brand_text):
+    layer = _brand_layer(size, brand_text)
+    box = layer.getbbox()
+    return (box, layer.crop(box)) if box else None
+
+# Compose a single sticker tile with specified options. Layers are only built and blended over the
+# boxes they touch: the result is the same as compositing full-size layers, pixel for pixel.
 def _compose_sticker_tile(user_png_bytes, target_size, shape="circle", border="none",
                           branding=False, brand_text="", theme="none", brand_color="#FF4081"):
-    tile = Image.new("RGBA", target_size, (255,255,255,0))  # Create transparent tile
     w, h = target_size
 
     # Define content area with bleed and padding
@@ -204,135 +331,177 @@ def _compose_sticker_tile(user_png_bytes, target_size, shape="circle", border="n
     cw = content_box[2] - content_box[0]
     ch = content_box[3] - content_box[1]
 
-    # Add themed underlay (ring/glow) behind subject
-    underlay = _theme_underlay(target_size, shape, theme, brand_color)
-    tile = Image.alpha_composite(tile, underlay)
+    # Start from the themed underlay (ring/glow); for theme "none" it is fully transparent
+    tile = _theme_underlay(target_size, shape, theme, brand_color).copy()
 
-    # Fit user image within content area
-    user_img = Image.open(io.BytesIO(user_png_bytes)).convert("RGBA")
+    # Fit user image within content area, centered
+    user_img = load_rgba(user_png_bytes)  # memoized decode (PNG then PDF for the same guest)
     user_img = ImageOps.contain(user_img, (cw, ch), Image.LANCZOS)  # Resize with aspect ratio
-    content_layer = Image.new("RGBA", target_size, (255,255,255,0))
-    _place_center(content_layer, user_img)  # Center the user image
-
-    # Apply shape mask (circle or rounded rectangle)
-    if shape == "circle":
-        mask = _circle_mask(target_size)
-    else:
-        radius = max(8, min(w, h) // 20)  # Calculate corner radius
-        mask = _rounded_rect_mask(target_size, radius)
-    shaped = Image.new("RGBA", target_size, (255,255,255,0))
-    shaped.paste(content_layer, (0,0), mask=mask)  # Apply mask to content
-
-    # Add border if specified
-    border_px = BORDER_MAP.get(border, 0)
-    if border_px > 0 or border == "dotted":
-        draw = ImageDraw.Draw(shaped)
-        inset = max(bleed // 2, 8)
-        bbox = [inset, inset, w - inset, h - inset]
-        if shape == "circle":
-            if border == "dotted":
-                _dotted_ellipse(draw, bbox, fill=(0,0,0,230), width=BORDER_MAP["dotted"])
-            else:
-                draw.ellipse(bbox, outline=(0,0,0,230), width=border_px)
-        else:
-            if border == "dotted":
-                _dotted_rect(draw, bbox, fill=(0,0,0,230), width=BORDER_MAP["dotted"])
-            else:
-                draw.rounded_rectangle(bbox, radius=max(8, min(w,h)//20), outline=(0,0,0,230), width=border_px)
-
-    # Add branding (icon and/or text) if enabled
-    if branding:
-        brand_layer = Image.new("RGBA", target_size, (255,255,255,0))
-        draw_b = ImageDraw.Draw(brand_layer)
-        pad = mm_to_px(3)
-        icon_h = mm_to_px(10)
-        x_right = w - pad
-        y_bottom = h - pad
-
-        # Add brand icon if available
-        icon = _load_brand_icon()
-        if icon:
-            iw, ih = icon.size
-            scale = icon_h / ih
-            new_size = (int(iw*scale), int(ih*scale))
-            icon_r = icon.resize(new_size, Image.LANCZOS)
-            bx = x_right - new_size[0]
-            by = y_bottom - new_size[1]
-            brand_layer.alpha_composite(icon_r, dest=(bx, by))
-            x_right = bx - pad
-
-        # Add brand text if provided
-        if brand_text:
-            try:
-                font = ImageFont.truetype("arial.ttf", size=mm_to_px(3.2))
-            except Exception:
-                font = ImageFont.load_default()
-            tw, th = draw_b.textsize(brand_text, font=font)  # Calculate text size
-            bx = x_right - tw
-            by = y_bottom - th
-            bg_pad = 6
-            draw_b.rounded_rectangle([bx-bg_pad, by-bg_pad, x_right+bg_pad, y_bottom+bg_pad],
-                                     radius=8, fill=(255,255,255,180))  # Draw text background
-            draw_b.text((bx, by), brand_text, fill=(10,10,10,255), font=font)  # Draw text
-        shaped = Image.alpha_composite(shaped, brand_layer)
+    fw, fh = user_img.size
+    fx, fy = (w - fw) // 2, (h - fh) // 2
+
+    # Only the subject (clipped to the shape), the border and the branding can cover the underlay
+    mask, mask_box = _shape_mask(target_size, shape)
+    subject_box = _box_and((fx, fy, fx + fw, fy + fh), mask_box)
+    boxes = [subject_box] if subject_box[0] < subject_box[2] and subject_box[1] < subject_box[3] else []
+    border_patch = _border_patch(target_size, shape, border)
+    if border_patch:
+        boxes.append(border_patch[0])
+    brand_patch = _brand_patch(target_size, brand_text) if branding else None
+    if brand_patch:
+        boxes.append(brand_patch[0])
+    if not boxes:
+        return tile
+    ux, uy, ux1, uy1 = box = boxes[0]
+    for b in boxes[1:]:
+        ux, uy, ux1, uy1 = box = _box_or(box, b)
+
+    # Shaped content over the union box only
+    shaped = Image.new("RGBA", (ux1 - ux, uy1 - uy), (255,255,255,0))
+    if boxes[0] is subject_box:
+        sx, sy, sx1, sy1 = subject_box
+        # Fully transparent subject pixels may keep their color here (a transparent layer would make
+        # them white): they stay transparent through the steps below, so the tile is the same
+        shaped.paste(user_img.crop((sx - fx, sy - fy, sx1 - fx, sy1 - fy)), (sx - ux, sy - uy),
+                     mask=mask.crop(subject_box))  # Apply shape mask to content
+
+    # Add border if specified (opaque stroke replaces the content pixels under it)
+    if border_patch:
+        (bx, by, bx1, by1), stroke = border_patch
+        shaped.paste((0,0,0,230), (bx - ux, by - uy, bx1 - ux, by1 - uy), mask=stroke)
+
+    # Add branding (icon and/or text) where it lands
+    if brand_patch:
+        (bx, by, _, _), brand = brand_patch
+        shaped.alpha_composite(brand, dest=(bx - ux, by - uy))
 
     # Combine underlay and shaped content
-    tile = Image.alpha_composite(tile, shaped)
+    tile.alpha_composite(shaped, dest=(ux, uy))
     return tile
 
-# Create an A4 sheet with multiple stickers
-def make_a4_sheet(sticker_png_bytes: bytes, options: dict = None) -> bytes:
-    options = options or {}  # Default to empty dict if options is None
-    shape = options.get("shape", "circle")  # Sticker shape (circle or rounded rectangle)
-    border = options.get("border", "none")  # Border style
-    branding = bool(options.get("branding", False))  # Enable/disable branding
-    brand_text = options.get("brand_text", "")  # Brand text
-    theme = options.get("theme", "none")  # Theme for ring/glow
-    brand_color = options.get("brand_color", "#FF4081")  # Brand color
-
-    W, H = A4_PX  # A4 dimensions in pixels
-    base = Image.new("RGBA", (W, H), (255,255,255,255))  # Create white A4 canvas
-
-    # Calculate layout dimensions
+# Calculate the sheet layout in pixels for a cols x rows grid (shared by the PNG and PDF renderers)
+def _sheet_layout(cols=2, rows=2):
+    W, H = A4_PX
     margin = mm_to_px(MARGIN_MM)
     gutter = mm_to_px(GUTTER_MM)
-    cols = rows = 2  # 2x2 grid of stickers
-    cell_w = (W - margin*2 - gutter) // cols  # Width of each cell
-    cell_h = (H - margin*2 - gutter) // rows  # Height of each cell
+    cell_w = (W - margin*2 - gutter*(cols - 1)) // cols  # Width of each cell
+    cell_h = (H - margin*2 - gutter*(rows - 1)) // rows  # Height of each cell
     inner_pad = mm_to_px(3)  # Padding within each cell
-    tile_size = (cell_w - inner_pad*2, cell_h - inner_pad*2)  # Sticker size
-
-    # Create a single sticker tile
-    tile = _compose_sticker_tile(
-        sticker_png_bytes,
-        target_size=tile_size,
-        shape=shape,
-        border=border,
-        branding=branding,
-        brand_text=brand_text,
-        theme=theme,
-        brand_color=brand_color
-    )
-
-    # Define positions for stickers on A4 sheet
-    positions = [
-        (margin + inner_pad, margin + inner_pad),
-        (margin + cell_w + gutter + inner_pad, margin + inner_pad),
-        (margin + inner_pad, margin + cell_h + gutter + inner_pad),
-        (margin + cell_w + gutter + inner_pad, margin + cell_h + gutter + inner_pad),
-    ]
-    for (x, y) in positions:
-        base.alpha_composite(tile, dest=(x, y))  # Place sticker at each position
+    return {
+        "page_size": (W, H),
+        "margin": margin,
+        "tile_size": (cell_w - inner_pad*2, cell_h - inner_pad*2),  # Sticker size
+        # Positions for stickers on A4 sheet (row by row)
+        "positions": [
+            (margin + c*(cell_w + gutter) + inner_pad, margin + r*(cell_h + gutter) + inner_pad)
+            for r in range(rows) for c in range(cols)
+        ],
+        # Cutting guidelines run through the middle of each gutter
+        "cuts_x": [margin + (c + 1)*cell_w + c*gutter + gutter//2 for c in range(cols - 1)],
+        "cuts_y": [margin + (r + 1)*cell_h + r*gutter + gutter//2 for r in range(rows - 1)],
+    }
+
+# Place tiles (one per position, None = empty) on a white A4 page and draw the cutting guides
+def _compose_page(tiles, layout):
+    W, H = layout["page_size"]
+    base = Image.new("RGBA", (W, H), (255,255,255,255))  # Create white A4 canvas
+    margin = layout["margin"]
+    for tile, (x, y) in zip(tiles, layout["positions"]):
+        if tile is not None:
+            base.alpha_composite(tile, dest=(x, y))
 
     # Draw cutting guidelines
     draw = ImageDraw.Draw(base)
-    mid_x = margin + cell_w + gutter//2  # Vertical center line
-    mid_y = margin + cell_h + gutter//2  # Horizontal center line
-    _draw_dashed_line(draw, (mid_x, margin), (mid_x, H - margin), dash=26, gap=18, fill=(0,0,0,130), width=3)
-    _draw_dashed_line(draw, (margin, mid_y), (W - margin, mid_y), dash=26, gap=18, fill=(0,0,0,130), width=3)
+    for x in layout["cuts_x"]:
+        _draw_dashed_line(draw, (x, margin), (x, H - margin), dash=26, gap=18, fill=(0,0,0,130), width=3)
+    for y in layout["cuts_y"]:
+        _draw_dashed_line(draw, (margin, y), (W - margin, y), dash=26, gap=18, fill=(0,0,0,130), width=3)
     draw.rectangle([margin, margin, W - margin, H - margin], outline=(0,0,0,50), width=2)  # Draw sheet border
+    return base
+
+# Compose a tile, or reuse one already built for this image + options (memory tier)
+def _cached_tile(user_png_bytes, target_size, **opts):
+    key = ("tile", hashlib.sha256(user_png_bytes).hexdigest(), target_size, tuple(sorted(opts.items())))
+    tile = mem_get(key)
+    if tile is None:
+        with metrics.stage("tile"):
+            tile = _compose_sticker_tile(user_png_bytes, target_size, **opts)
+        mem_put(key, tile, tile.width * tile.height * 4)
+    return tile
 
-    # Save output as PNG
+# Option value if it is a string, else the default (client JSON may send lists, numbers, null)
+def _option_str(options, name, default):
+    value = options.get(name, default)
+    return value if isinstance(value, str) else default
+
+# Normalize sheet options (defaults applied); also the cache-key form for finished sheets.
+# Every value is a str/bool, so the options can be passed to the lru_cache'd layer helpers.
+def _sheet_options(options):
+    options = options if isinstance(options, dict) else {}  # Default to empty dict if options is None
+    return {
+        "shape": _option_str(options, "shape", "circle"),  # Sticker shape (circle or rounded rectangle)
+        "border": _option_str(options, "border", "none"),  # Border style
+        "branding": bool(options.get("branding", False)),  # Enable/disable branding
+        "brand_text": _option_str(options, "brand_text", ""),  # Brand text
+        "theme": _option_str(options, "theme", "none"),  # Theme for ring/glow
+        # Brand color as canonical "#RRGGBB" (unparsable values fall back to the default, as before)
+        "brand_color": "#%02X%02X%02X" % _parse_hex(options.get("brand_color", "#FF4081")),
+    }
+
+def _sheet_key(opts):
+    return json.dumps(opts, sort_keys=True)
+
+# Resolve the sheet output encoding from options["encoding"] over the env defaults
+def sheet_encoding(options: dict = None) -> dict:
+    enc = (options or {}).get("encoding") or {}
+    fmt = str(enc.get("format", SHEET_FORMAT)).lower()
+    fmt = "jpeg" if fmt == "jpg" else fmt
+    if fmt not in SHEET_MIMETYPES:
+        raise ValueError(f"unsupported sheet format: {fmt}")
+    return {
+        "format": fmt,
+        "compress_level": max(0, min(9, int(enc.get("compress_level", SHEET_PNG_COMPRESS_LEVEL)))),
+        "optimize": bool(enc.get("optimize", SHEET_PNG_OPTIMIZE)),
+        "quality": max(1, min(100, int(enc.get("quality", SHEET_QUALITY)))),
+    }
+
+# Describe an encoding for the X-Sheet-Encoding response header
+def describe_encoding(enc: dict) -> str:
+    if enc["format"] == "png":
+        return f"png; compress_level={enc['compress_level']}; optimize={str(enc['optimize']).lower()}"
+    return f"{enc['format']}; quality={enc['quality']}"
+
+# Encode the finished RGB sheet
+def _encode_sheet(rgb, enc):
     out = io.BytesIO()
-    base.convert("RGB").save(out, format="PNG", optimize=True)  # Convert to RGB and save
-    return out.getvalue()  # Return PNG bytes
\ No newline at end of file
+    if enc["format"] == "png":
+        rgb.save(out, format="PNG", compress_level=enc["compress_level"], optimize=enc["optimize"])
+    elif enc["format"] == "jpeg":
+        rgb.save(out, format="JPEG", quality=enc["quality"], subsampling=0, dpi=(DPI, DPI))
+    else:
+        rgb.save(out, format="WEBP", quality=enc["quality"], method=4)
+    return out.getvalue()
+
+# Create an A4 sheet with multiple stickers (finished sheets are cached by image + options + encoding)
+def make_a4_sheet(sticker_png_bytes: bytes, options: dict = None) -> bytes:
+    opts = _sheet_options(options)
+    enc = sheet_encoding(options)
+    sheet_key = _sheet_key(opts)
+    enc_key = describe_encoding(enc)
+    cached = cache_get("sheet", sticker_png_bytes, sheet_key, enc_key, "v1")
+    if cached:
+        return cached
+
+    layout = _sheet_layout()
+
+    # Create a single sticker tile (reused across PNG/PDF requests for the same guest + options)
+    tile = _cached_tile(sticker_png_bytes, target_size=layout["tile_size"], **opts)
+
+    # Place sticker at each position on the A4 sheet, with cutting guidelines
+    base = _compose_page([tile] * len(layout["positions"]), layout)
+
+    # Encode output (PNG by default; see sheet_encoding)
+    with metrics.stage("sheet_encode"):
+        out = _encode_sheet(base.convert("RGB"), enc)  # Convert to RGB and save
+    cache_set("sheet", sticker_png_bytes, out, sheet_key, enc_key, "v1")
+    return out  # Return encoded sheet bytes
\ No newline at end of file
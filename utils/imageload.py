@@ -0,0 +1,128 @@
+import io
+import os
+import threading
+from contextlib import contextmanager
+from PIL import Image, ImageOps
+from dotenv import load_dotenv
+from . import metrics, procpool
+load_dotenv()
+
+# ---- Bounded image decoding (uploads and stickers) ----
+# MAX_CONTENT_LENGTH caps compressed bytes, not pixels: a 12 MB file can decode to hundreds of
+# megapixels. Every decode here reads the size from the header first, rejects images over the
+# pixel budget, decodes JPEG at a reduced scale (draft) when a smaller result will do, and waits
+# for room under a budget of decoded bytes so concurrent requests queue, not OOM. The budget is for
+# the whole host: the web process and each pool worker (PROC_WORKERS) hold an equal share of it.
+MAX_PIXELS         = int(os.getenv("IMAGE_MAX_PIXELS", str(50_000_000)))    # per image (header w*h); more is rejected
+REQUEST_MAX_PIXELS = int(os.getenv("IMAGE_REQUEST_MAX_PIXELS", str(400_000_000)))  # all images of one request (batch PDF)
+DECODE_BUDGET      = int(os.getenv("IMAGE_DECODE_BUDGET_MB", "512")) * 1024 * 1024  # decoded bytes in flight, all processes
+STICKER_MAX_SIDE   = int(os.getenv("IMAGE_STICKER_MAX_SIDE", "2048"))       # stickers are reduced to about this size
+PROCESS_BUDGET     = DECODE_BUDGET // (max(0, procpool.PROC_WORKERS) + 1)     # this process's share
+
+_BANDS = {"1": 1, "L": 1, "P": 1, "LA": 2, "RGB": 3, "YCbCr": 3, "RGBA": 4, "CMYK": 4, "I;16": 2}
+
+
+class ImageTooLarge(ValueError):
+    """The image's header declares more than IMAGE_MAX_PIXELS pixels."""
+
+
+class _ByteBudget:
+    """Counting semaphore over bytes; a request larger than the whole budget runs alone."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.used = 0
+        self.waiting = 0
+        self.cond = threading.Condition()
+
+    def acquire(self, n: int) -> int:
+        n = min(n, self.capacity)
+        with self.cond:
+            self.waiting += 1
+            self.cond.wait_for(lambda: self.used + n <= self.capacity)
+            self.waiting -= 1
+            self.used += n
+        return n
+
+    def release(self, n: int) -> None:
+        with self.cond:
+            self.used -= n
+            self.cond.notify_all()
+
+
+_budget = _ByteBudget(PROCESS_BUDGET)
+
+
+@contextmanager
+def decoding(nbytes: int):
+    """Hold nbytes of the decode budget for the block (waits while other decodes use it up)."""
+    if PROCESS_BUDGET <= 0:
+        yield
+        return
+    with metrics.stage("decode_wait"):
+        n = _budget.acquire(nbytes)
+    try:
+        yield
+    finally:
+        _budget.release(n)
+
+
+def probe(data: bytes):
+    """(width, height, format) from the header alone; raises ImageTooLarge past the pixel budget."""
+    try:
+        im = Image.open(io.BytesIO(data))
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e)) from None
+    w, h = im.size
+    if MAX_PIXELS > 0 and w * h > MAX_PIXELS:
+        raise ImageTooLarge(f"image is {w}x{h} ({w * h / 1e6:.0f} MP); the limit is {MAX_PIXELS / 1e6:.0f} MP")
+    return w, h, im.format
+
+
+def check_request(images) -> int:
+    """Header check of every image of one request: total pixels (unreadable images count 0)."""
+    total = 0
+    for data in images:
+        try:
+            w, h, _ = probe(data)
+        except ImageTooLarge:
+            raise
+        except Exception:
+            continue  # not an image PIL can read; the decode step reports it
+        total += w * h
+    if REQUEST_MAX_PIXELS > 0 and total > REQUEST_MAX_PIXELS:
+        raise ImageTooLarge(f"images total {total / 1e6:.0f} MP; the per-request limit is {REQUEST_MAX_PIXELS / 1e6:.0f} MP")
+    return total
+
+
+def open_image(data: bytes, mode: str = "RGB", max_side: int = None, orient: bool = False):
+    """
+    Decode to a PIL image in mode, within the pixel and decode budgets.
+    max_side: the caller needs no more than this (longest side): JPEG decodes at the smallest
+    draft scale that still covers it, other formats are reduced by an integer factor after decoding.
+    orient: apply the EXIF orientation (what cv2.imdecode does by default).
+    """
+    probe(data)
+    im = Image.open(io.BytesIO(data))
+    if max_side and im.format == "JPEG" and max(im.size) > max_side:
+        scale = max_side / max(im.size)
+        im.draft("RGB" if mode != "L" else "L", (round(im.width * scale), round(im.height * scale)))
+    # Peak while converting: the decoded image plus its copy in the target mode
+    nbytes = im.width * im.height * (_BANDS.get(im.mode, 4) + _BANDS.get(mode, 4))
+    with decoding(nbytes):
+        im.load()
+        if max_side and max(im.size) >= 2 * max_side:
+            im = im.reduce(max(im.size) // max_side)
+        if orient:
+            im = ImageOps.exif_transpose(im)
+        return im.convert(mode)
+
+
+def stats() -> dict:
+    """This process's share of the decode budget, the part in use and callers waiting for it."""
+    with _budget.cond:
+        return {"budget_bytes": _budget.capacity, "used_bytes": _budget.used, "waiting": _budget.waiting}
+
+
+metrics.describe("booth_decode_bytes", "Decoded image bytes in flight in the web process (its share of IMAGE_DECODE_BUDGET_MB).")
+metrics.describe("booth_decode_waiting", "Decodes waiting for room under the decode budget.")
@@ -0,0 +1,182 @@
+import os
+import time
+import uuid
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from dotenv import load_dotenv
+from . import metrics
+load_dotenv()
+
+# ---- Background job pool (env-driven) ----
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))            # concurrent upstream calls
+JOB_MAX_QUEUE = int(os.getenv("JOB_MAX_QUEUE", "0"))        # 0 = unbounded
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "900"))  # finished jobs are kept this long for polling
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+_jobs = {}
+_lock = threading.Lock()
+_finished = threading.Condition(_lock)  # notified whenever a job finishes (long-poll / SSE waiters)
+_waiters = {}  # job id -> [(loop, asyncio.Event)] of wait_async() callers
+_latencies = []  # total seconds (submit -> finish) of recent jobs
+_LATENCY_WINDOW = 200
+
+
+class QueueFull(RuntimeError):
+    """Raised by submit() when JOB_MAX_QUEUE jobs are already waiting."""
+
+
+def _start(job_id: str) -> dict:
+    with _lock:
+        job = _jobs[job_id]
+        job["state"] = "running"
+        job["started"] = time.time()
+    job["timings"] = metrics.begin()  # stage breakdown, replayed as Server-Timing on the result
+    return job
+
+
+def _finish(job: dict, result, error) -> None:
+    with _lock:
+        job["state"] = "failed" if error is not None else "done"
+        job["result"] = result
+        job["error"] = error
+        job["finished"] = time.time()
+        _latencies.append(job["finished"] - job["created"])
+        del _latencies[:-_LATENCY_WINDOW]
+        _finished.notify_all()
+        waiters = _waiters.pop(job["id"], [])
+    for loop, event in waiters:
+        loop.call_soon_threadsafe(event.set)
+
+
+def _run(job_id: str, fn, args, kwargs) -> None:
+    job = _start(job_id)
+    try:
+        result, error = fn(*args, **kwargs), None
+    except Exception as e:
+        result, error = None, str(e)
+    _finish(job, result, error)
+
+
+async def _run_async(job_id: str, coro_fn, args, kwargs) -> None:
+    job = _start(job_id)
+    try:
+        result, error = await coro_fn(*args, **kwargs), None
+    except Exception as e:
+        result, error = None, str(e)
+    _finish(job, result, error)
+
+
+def _prune(now: float) -> None:
+    """Forget finished jobs nobody polled within JOB_TTL_SECONDS (caller holds _lock)."""
+    stale = [jid for jid, j in _jobs.items() if j["finished"] and now - j["finished"] > JOB_TTL_SECONDS]
+    for jid in stale:
+        del _jobs[jid]
+
+
+def _create() -> str:
+    now = time.time()
+    job_id = uuid.uuid4().hex
+    with _lock:
+        _prune(now)
+        queued = sum(1 for j in _jobs.values() if j["state"] == "queued")
+        if JOB_MAX_QUEUE > 0 and queued >= JOB_MAX_QUEUE:
+            raise QueueFull(f"{queued} jobs already queued")
+        _jobs[job_id] = {"id": job_id, "state": "queued", "created": now, "started": None,
+                         "finished": None, "result": None, "error": None, "timings": {}}
+    return job_id
+
+
+def submit(fn, *args, **kwargs) -> str:
+    """Queue fn(*args, **kwargs) on the worker pool and return a job id for status()."""
+    job_id = _create()
+    _executor.submit(_run, job_id, fn, args, kwargs)
+    return job_id
+
+
+_tasks = set()  # running async jobs (the loop only keeps weak references to tasks)
+
+
+def submit_async(coro_fn, *args, **kwargs) -> str:
+    """
+    Run await coro_fn(*args, **kwargs) as a task on the running event loop (ASGI mode) and return
+    a job id for status(). Async jobs don't take a worker thread, so they start right away.
+    """
+    job_id = _create()
+    task = asyncio.get_running_loop().create_task(_run_async(job_id, coro_fn, args, kwargs))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return job_id
+
+
+def status(job_id: str) -> Optional[dict]:
+    """
+    Snapshot of a job: state is queued | running | done | failed.
+    'result' holds fn's return value once done; timings are in seconds.
+    """
+    now = time.time()
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        ahead = sum(1 for j in _jobs.values() if j["state"] == "queued" and j["created"] < job["created"])
+        started = job["started"] or now
+        return {
+            "id": job_id,
+            "state": job["state"],
+            "result": job["result"],
+            "error": job["error"],
+            "queue_position": ahead if job["state"] == "queued" else 0,
+            "queued_s": round(started - job["created"], 3),
+            "run_s": round((job["finished"] or now) - started, 3) if job["started"] else 0.0,
+            "timings": dict(job["timings"]) if job["finished"] else {},
+        }
+
+
+def wait(job_id: str, timeout: float) -> Optional[dict]:
+    """status() as soon as the job has finished, or after timeout seconds if it is still going."""
+    with _finished:
+        _finished.wait_for(lambda: job_id not in _jobs or _jobs[job_id]["finished"], timeout)
+    return status(job_id)
+
+
+async def wait_async(job_id: str, timeout: float) -> Optional[dict]:
+    """wait() for the event loop (ASGI mode): the caller awaits an asyncio.Event, no thread is held."""
+    loop = asyncio.get_running_loop()
+    event = asyncio.Event()
+    with _lock:
+        job = _jobs.get(job_id)
+        pending = job is not None and not job["finished"]
+        if pending:
+            _waiters.setdefault(job_id, []).append((loop, event))
+    if pending:
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with _lock:
+                waiters = _waiters.get(job_id, [])
+                if (loop, event) in waiters:
+                    waiters.remove((loop, event))
+                if not waiters:
+                    _waiters.pop(job_id, None)
+    return status(job_id)
+
+
+def stats() -> dict:
+    """Queue depth and recent per-job latency (submit -> finish)."""
+    with _lock:
+        states = [j["state"] for j in _jobs.values()]
+        lat = sorted(_latencies)
+    pct = lambda q: round(lat[min(len(lat) - 1, int(q * len(lat)))], 3) if lat else None
+    return {
+        "workers": JOB_WORKERS,
+        "queued": states.count("queued"),
+        "running": states.count("running"),
+        "done": states.count("done"),
+        "failed": states.count("failed"),
+        "latency_p50_s": pct(0.50),
+        "latency_p95_s": pct(0.95),
+    }
@@ -0,0 +1,109 @@
+import os
+import time
+import numpy as np, cv2
+from .segment import subject_mask, subject_box
+from .imageload import ImageTooLarge, open_image
+
+# ---- Local cartoon filter (used when the Images API is unavailable) ----
+# All work happens at a capped working resolution; the output stays at that size, which is
+# already larger than a sticker tile on the 300-DPI sheet.
+WORK_MAX_SIDE = int(os.getenv("CARTOON_FALLBACK_MAX_SIDE", "1024"))
+BUDGET_MS     = float(os.getenv("CARTOON_FALLBACK_BUDGET_MS", "250"))  # optional passes stop here
+COLORS        = int(os.getenv("CARTOON_FALLBACK_COLORS", "8"))         # k-means palette size
+
+SMOOTH_PASSES = 4         # 5-px bilateral passes at half working size (more = flatter regions)
+KMEANS_SAMPLE = 4096      # pixels sampled to fit the palette
+EDGE_BLOCK    = 9         # adaptive-threshold neighbourhood (px, odd)
+EDGE_C        = 5         # higher = fewer, bolder lines
+LUT_LEVELS    = 6         # per-channel levels when the budget rules out k-means
+
+
+def _working_copy(bgr, max_side):
+    h, w = bgr.shape[:2]
+    scale = max_side / max(h, w)
+    if scale >= 1:
+        return bgr
+    return cv2.resize(bgr, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+
+
+def _smooth(bgr, deadline):
+    """Edge-preserving smoothing: bilateral passes on a half-size copy, scaled back up."""
+    h, w = bgr.shape[:2]
+    small = cv2.pyrDown(bgr) if min(h, w) >= 64 else bgr
+    for i in range(SMOOTH_PASSES):
+        if i and time.perf_counter() > deadline:
+            break
+        small = cv2.bilateralFilter(small, 5, 40, 5)  # d=5 has a fast path in OpenCV
+    return cv2.resize(small, (w, h), interpolation=cv2.INTER_LINEAR) if small is not bgr else small
+
+
+def _lut_quantize(bgr):
+    step = 256 // LUT_LEVELS
+    lut = np.clip((np.arange(256) // step) * step + step // 2, 0, 255).astype(np.uint8)
+    return cv2.LUT(bgr, lut)
+
+
+def _kmeans_quantize(bgr):
+    """
+    Fit a COLORS-entry palette on a pixel sample, then map every pixel to its nearest entry
+    through a 32x32x32 lookup table (nearest entry per 8-level color cell).
+    """
+    px = bgr.reshape(-1, 3)
+    rng = np.random.default_rng(0)  # deterministic output for the same photo
+    sample = px[rng.integers(0, len(px), min(KMEANS_SAMPLE, len(px)))].astype(np.float32)
+    k = min(COLORS, len(sample))
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
+    cv2.setRNGSeed(0)
+    _, _, centers = cv2.kmeans(sample, k, None, criteria, 1, cv2.KMEANS_PP_CENTERS)
+
+    # Nearest centroid for every cell center via ||c||^2 - 2 p.c (||p||^2 is the same for all c)
+    cells = (np.stack(np.meshgrid(*[np.arange(32)] * 3, indexing="ij"), -1).reshape(-1, 3) * 8 + 4).astype(np.float32)
+    dist = (centers * centers).sum(axis=1) - 2.0 * cells @ centers.T
+    table = centers.round().astype(np.uint8)[dist.argmin(axis=1)]
+    idx = ((px[:, 0] >> 3).astype(np.intp) << 10) | ((px[:, 1] >> 3).astype(np.intp) << 5) | (px[:, 2] >> 3)
+    return table[idx].reshape(bgr.shape)
+
+
+def _edges(bgr):
+    """Dark line art: adaptive threshold of a median-filtered grayscale (255 = no line)."""
+    gray = cv2.medianBlur(cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY), 5)
+    return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, EDGE_BLOCK, EDGE_C)
+
+
+def cartoonize_local(photo_bytes: bytes, remove_bg: bool = False, max_side: int = None) -> bytes:
+    """
+    Cartoon-style PNG (RGBA) from a photo using OpenCV only.
+    remove_bg: make the background transparent (GrabCut) and crop to the subject; the result
+    stays opaque if segmentation fails.
+    max_side: working (and output) size cap, default WORK_MAX_SIDE; smaller is faster (previews).
+    Optional passes (extra smoothing, k-means) are skipped once BUDGET_MS is spent.
+    """
+    t0 = time.perf_counter()
+    deadline = t0 + BUDGET_MS / 1000.0
+    max_side = max_side or WORK_MAX_SIDE
+    try:
+        # JPEG decodes at the draft scale nearest the working size, not in full
+        rgb = open_image(photo_bytes, "RGB", max_side=max_side, orient=True)
+    except ImageTooLarge:
+        raise
+    except Exception:
+        raise ValueError("Could not decode photo") from None
+    bgr = _working_copy(np.ascontiguousarray(np.asarray(rgb)[:, :, ::-1]), max_side)
+    alpha = subject_mask(bgr) if remove_bg else None
+
+    flat = _smooth(bgr, deadline)
+    # k-means costs roughly as much as the smoothing did; fall back to a fixed LUT if that won't fit
+    spent = time.perf_counter() - t0
+    flat = _kmeans_quantize(flat) if time.perf_counter() + spent / 2 < deadline else _lut_quantize(flat)
+    line = _edges(bgr)
+    out = cv2.bitwise_and(flat, flat, mask=line)
+
+    if alpha is None:
+        rgba = cv2.cvtColor(out, cv2.COLOR_BGR2BGRA)
+    else:
+        x0, y0, x1, y1 = subject_box(alpha)
+        rgba = np.dstack([out, alpha])[y0:y1, x0:x1]
+    ok, buf = cv2.imencode(".png", rgba, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+    if not ok:
+        raise ValueError("Could not encode cartoon")
+    return buf.tobytes()
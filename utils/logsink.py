@@ -0,0 +1,115 @@
+import os
+import queue
+import atexit
+import threading
+from dotenv import load_dotenv
+from . import metrics
+load_dotenv()
+
+# ---- Client log sink: bounded queue + one writer thread (batched writes, size rotation) ----
+LOG_DIR          = os.getenv("LOG_DIR", "logs")
+LOG_FILE         = os.getenv("LOG_FILE", "app.log")
+LOG_QUEUE_MAX    = int(os.getenv("LOG_QUEUE_MAX", "10000"))          # lines waiting; more are dropped
+LOG_BATCH_LINES  = int(os.getenv("LOG_BATCH_LINES", "256"))          # write once this many are pending...
+LOG_FLUSH_S      = float(os.getenv("LOG_FLUSH_S", "1.0"))            # ...or this long after the first one
+LOG_MAX_BYTES    = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))  # rotate app.log -> app.log.1 (0 = never)
+LOG_BACKUPS      = int(os.getenv("LOG_BACKUPS", "5"))
+LOG_MAX_EVENTS   = int(os.getenv("LOG_MAX_EVENTS", "500"))          # per /api/log request
+
+_queue = queue.Queue(maxsize=LOG_QUEUE_MAX)
+_writer = None
+_writer_lock = threading.Lock()
+_counts_lock = threading.Lock()
+_counts = {"written": 0, "dropped": 0, "rotations": 0}
+_STOP = object()
+
+
+def _path() -> str:
+    return os.path.join(LOG_DIR, LOG_FILE)
+
+
+def _rotate(f):
+    """Close the current file, shift app.log.N -> app.log.N+1 (oldest dropped), start a new one."""
+    f.close()
+    base = _path()
+    if LOG_BACKUPS > 0:
+        for i in range(LOG_BACKUPS - 1, 0, -1):
+            if os.path.exists(f"{base}.{i}"):
+                os.replace(f"{base}.{i}", f"{base}.{i + 1}")
+        os.replace(base, f"{base}.1")
+    else:
+        os.remove(base)
+    _counts["rotations"] += 1
+    return open(base, "a", encoding="utf-8")
+
+
+def _run() -> None:
+    os.makedirs(LOG_DIR, exist_ok=True)
+    f = open(_path(), "a", encoding="utf-8")
+    size = f.tell()
+    stopping = False
+    while not stopping:
+        line = _queue.get()
+        if line is _STOP:
+            break
+        batch = [line]
+        # Collect more lines until the batch is full or LOG_FLUSH_S has passed
+        try:
+            while len(batch) < LOG_BATCH_LINES:
+                line = _queue.get(timeout=LOG_FLUSH_S)
+                if line is _STOP:
+                    stopping = True
+                    break
+                batch.append(line)
+        except queue.Empty:
+            pass
+        data = "".join(batch)
+        if LOG_MAX_BYTES > 0 and size > 0 and size + len(data) > LOG_MAX_BYTES:
+            f = _rotate(f)
+            size = 0
+        f.write(data)
+        f.flush()
+        size += len(data)
+        _counts["written"] += len(batch)
+    f.close()
+
+
+def _start() -> None:
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_run, name="log-writer", daemon=True)
+            _writer.start()
+            atexit.register(close)
+
+
+def write(line: str) -> bool:
+    """Queue one line (newline included) without blocking; False if it was dropped (queue full)."""
+    if _writer is None:
+        _start()
+    try:
+        _queue.put_nowait(line)
+        return True
+    except queue.Full:
+        with _counts_lock:
+            _counts["dropped"] += 1
+        metrics.count("booth_log_dropped_total")
+        return False
+
+
+def close(timeout: float = 5.0) -> None:
+    """Write out what is queued and stop the writer (at exit)."""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        _queue.put(_STOP)
+        writer.join(timeout)
+
+
+def stats() -> dict:
+    """Lines waiting, written, dropped (queue full) and rotations since start."""
+    return {"queued": _queue.qsize(), "max_queue": LOG_QUEUE_MAX, **_counts}
+
+
+metrics.describe("booth_log_dropped_total", "Client log lines dropped because the log queue was full.")
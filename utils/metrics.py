@@ -0,0 +1,159 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# ---- In-process latency summaries and counters (exported as Prometheus text on /api/metrics) ----
+QUANTILES = (0.5, 0.95, 0.99)
+_WINDOW = 1024  # recent samples per series used for the quantiles
+
+_lock = threading.Lock()
+_summaries = {}  # (name, labels) -> {"window": [...], "sum": float, "count": int}
+_counters = {}   # (name, labels) -> int
+_help = {}
+
+# Stage timings of the request (or job) being handled: stage -> seconds, in first-seen order
+_current = contextvars.ContextVar("stage_timings", default=None)
+
+
+def describe(name: str, text: str) -> None:
+    """HELP line for a metric family."""
+    _help[name] = text
+
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def observe(name: str, seconds: float, **labels) -> None:
+    with _lock:
+        s = _summaries.setdefault((name, _labels(labels)), {"window": [], "sum": 0.0, "count": 0})
+        s["window"].append(seconds)
+        del s["window"][:-_WINDOW]
+        s["sum"] += seconds
+        s["count"] += 1
+
+
+def count(name: str, n: int = 1, **labels) -> None:
+    with _lock:
+        key = (name, _labels(labels))
+        _counters[key] = _counters.get(key, 0) + n
+
+
+def begin() -> dict:
+    """Start collecting stage timings for the current request/job (see server_timing)."""
+    timings = {}
+    _current.set(timings)
+    return timings
+
+
+def record(stage_name: str, seconds: float, timings: dict = None) -> None:
+    """One stage sample: into the stage summary and the request's Server-Timing breakdown."""
+    observe("booth_stage_seconds", seconds, stage=stage_name)
+    timings = _current.get() if timings is None else timings
+    if timings is not None:
+        timings[stage_name] = timings.get(stage_name, 0.0) + seconds
+
+
+@contextmanager
+def stage(stage_name: str):
+    """Time a block as one stage (also when it raises)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage_name, time.perf_counter() - t0)
+
+
+@contextmanager
+def collect():
+    """Capture the stage samples of a block without recording them (for replay in another process)."""
+    token = _current.set({})
+    samples = []
+    try:
+        yield samples
+    finally:
+        samples.extend(_current.get().items())
+        _current.reset(token)
+
+
+def replay(samples, timings: dict = None) -> None:
+    for stage_name, seconds in samples:
+        record(stage_name, seconds, timings)
+
+
+def current():
+    return _current.get()
+
+
+def merge(timings: dict) -> None:
+    """Add another breakdown (e.g. a finished job's) to the current request's Server-Timing."""
+    mine = _current.get()
+    if mine is not None and timings:
+        for stage_name, seconds in timings.items():
+            mine[stage_name] = mine.get(stage_name, 0.0) + seconds
+
+
+def server_timing(total_s: float = None) -> str:
+    """Server-Timing header value: "quality;dur=12.3, upstream;dur=8012.0, total;dur=8031.2"."""
+    timings = _current.get() or {}
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    if total_s is not None:
+        parts.append(f"total;dur={total_s * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def _fmt_labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+def _quantile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else float("nan")
+
+
+def prometheus(gauges=(), counters=()) -> str:
+    """
+    Text exposition format: summaries (p50/p95/p99 over recent samples) and counters, plus
+    values owned elsewhere, given as (name, {labels}, value) triples.
+    """
+    with _lock:
+        summaries = {k: (list(v["window"]), v["sum"], v["count"]) for k, v in _summaries.items()}
+        series = dict(_counters)
+    kinds = {}
+
+    lines = []
+    def family(name, kind):
+        if name in _help:
+            lines.append(f"# HELP {name} {_help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    seen = set()
+    for (name, labels), (window, total, n) in sorted(summaries.items()):
+        if name not in seen:
+            family(name, "summary")
+            seen.add(name)
+        for q in QUANTILES:
+            lines.append(f"{name}{_fmt_labels(labels, (('quantile', str(q)),))} {_quantile(window, q):.6f}")
+        lines.append(f"{name}_sum{_fmt_labels(labels)} {total:.6f}")
+        lines.append(f"{name}_count{_fmt_labels(labels)} {n}")
+    for kind, triples in (("counter", counters), ("gauge", gauges)):
+        for name, labels, value in triples:
+            series[(name, _labels(labels))] = value
+            kinds[name] = kind
+    for (name, labels), value in sorted(series.items()):
+        if name not in seen:
+            family(name, kinds.get(name, "counter"))
+            seen.add(name)
+        lines.append(f"{name}{_fmt_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+describe("booth_stage_seconds", "Time spent per processing stage.")
+describe("booth_request_seconds", "Request latency per endpoint.")
+describe("booth_cartoon_results_total", "Cartoons served, by source (upstream, cache, similar, fallback).")
+describe("booth_upstream_responses_total", "Image API attempts, by HTTP status (error = no response).")
+describe("booth_cartoon_cache_lookups_total", "Cartoon cache lookups, by result (cache, similar, miss).")
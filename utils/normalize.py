@@ -0,0 +1,58 @@
+import io
+import os
+import hashlib
+from PIL import Image, ImageOps
+from .imageload import probe, decoding
+
+# ---- Upload normalization (decode once, orient, downsize, compact re-encode) ----
+UPLOAD_FORMAT  = os.getenv("GPT_UPLOAD_FORMAT", "webp").lower()   # webp | png | jpeg
+UPLOAD_QUALITY = int(os.getenv("GPT_UPLOAD_QUALITY", "92"))        # webp/jpeg only
+
+_UPLOAD_MIMETYPES = {"webp": "image/webp", "png": "image/png", "jpeg": "image/jpeg"}
+
+
+def size_box(size: str):
+    """'1536x1536' -> (1536, 1536); None for 'auto' or anything unparsable."""
+    try:
+        w, h = (int(v) for v in size.lower().split("x"))
+        return w, h
+    except (ValueError, AttributeError):
+        return None
+
+
+def normalize_photo(photo_bytes: bytes, box=None):
+    """
+    Decode once, apply EXIF orientation and fit inside box (w, h) without upscaling.
+    Returns (RGB image, key) where key hashes the exact normalized pixels: a lossless re-encode
+    (PNG level, lossless WebP) or a metadata-only change of the same capture maps to the same cache
+    entry, a lossy re-save (JPEG at another quality) changes pixels and so does not.
+    Raises imageload.ImageTooLarge past the pixel budget (header check, before decoding).
+    """
+    w, h, _ = probe(photo_bytes)
+    im = Image.open(io.BytesIO(photo_bytes))
+    # Budgeted at the header size: an upper bound when thumbnail() decodes at a draft scale
+    with decoding(w * h * 4):
+        if box:
+            # Orientation may swap the sides, so fit the long side into the box's long side first;
+            # thumbnail() lets JPEG decode at a reduced scale (draft mode)
+            side = max(box)
+            im.thumbnail((side, side), Image.LANCZOS)
+        im = ImageOps.exif_transpose(im)
+        if box:
+            im.thumbnail(box, Image.LANCZOS)
+        im = im.convert("RGB")
+
+    m = hashlib.sha256(f"{im.width}x{im.height}".encode("ascii"))
+    m.update(im.tobytes())
+    return im, m.digest()
+
+
+def encode_upload(im):
+    """Compact encoding of a normalized photo for the upload: (bytes, mimetype, filename)."""
+    fmt = UPLOAD_FORMAT if UPLOAD_FORMAT in _UPLOAD_MIMETYPES else "png"
+    buf = io.BytesIO()
+    if fmt == "png":
+        im.save(buf, format="PNG", compress_level=6)
+    else:
+        im.save(buf, format=fmt.upper(), quality=UPLOAD_QUALITY)
+    return buf.getvalue(), _UPLOAD_MIMETYPES[fmt], "input." + ("jpg" if fmt == "jpeg" else fmt)
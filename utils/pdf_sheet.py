@@ -0,0 +1,179 @@
+# Vector A4 PDF renderer: same layout as make_a4_sheet, but rings, borders and cut lines are
+# PDF paths and each image (sticker, glow, branding) is embedded once and placed on every tile.
+from reportlab import rl_config
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader
+import io
+import math
+from .cache import load_rgba, get as cache_get, set as cache_set
+from . import metrics
+from .image_sheet import (
+    DPI, BORDER_MAP, SAFE_PAD_MM, BLEED_MM, mm_to_px,
+    _sheet_layout, _sheet_options, _sheet_key, _theme_style, _theme_glow, _ring_geometry, _border_bbox, _brand_layer,
+)
+
+PT_PER_PX = 72.0 / DPI  # Sheet metrics are in 300-DPI pixels; PDF user space is in points
+rl_config.useA85 = 0  # Binary image streams: ASCII85 is pure Python here and adds 25% to the file
+GLOW_REDUCE = 4  # The glow is a wide blur, so it embeds at 1/4 resolution without visible loss
+
+# Convert pixels to points
+def _pt(px):
+    return px * PT_PER_PX
+
+# Map a box in tile pixels (top-left origin) to a PDF rect (x, y, w, h) in points
+def _rect(origin, box):
+    page_h = A4[1]
+    x, y = origin
+    x0, y0, x1, y1 = box
+    return _pt(x + x0), page_h - _pt(y + y1), _pt(x1 - x0), _pt(y1 - y0)
+
+# Inset a box by half a stroke, since PIL draws outlines inside the box and PDF centers them
+def _stroke_box(box, width_px):
+    half = width_px / 2.0
+    return [box[0] + half, box[1] + half, box[2] - half, box[3] - half]
+
+# Set stroke color (RGB or RGBA, 0-255) and width in pixels
+def _set_stroke(c, color, width_px):
+    r, g, b = color[:3]
+    c.setStrokeColorRGB(r / 255.0, g / 255.0, b / 255.0)
+    c.setStrokeAlpha((color[3] if len(color) == 4 else 255) / 255.0)
+    c.setLineWidth(_pt(width_px))
+
+# Stroke an ellipse or rounded rectangle outline that PIL would draw in box
+def _outline(c, origin, box, shape, width_px, radius_px=0):
+    x, y, w, h = _rect(origin, _stroke_box(box, width_px))
+    if shape == "circle":
+        c.ellipse(x, y, x + w, y + h, stroke=1, fill=0)
+    else:
+        c.roundRect(x, y, w, h, _pt(max(0, radius_px - width_px / 2.0)), stroke=1, fill=0)
+
+# Approximate ellipse perimeter (Ramanujan) in points
+def _ellipse_perimeter(w, h):
+    a, b = w / 2.0, h / 2.0
+    return math.pi * (3 * (a + b) - math.sqrt((3 * a + b) * (a + 3 * b)))
+
+# Size of the sticker after ImageOps.contain into box (same rounding)
+def _contain_size(size, box):
+    iw, ih = size
+    bw, bh = box
+    if iw / ih > bw / bh:
+        return bw, max(1, round(ih / iw * bw))
+    if iw / ih < bw / bh:
+        return max(1, round(iw / ih * bh)), bh
+    return bw, bh
+
+# Draw one sticker tile at origin (tile pixels, top-left)
+def _draw_tile(c, origin, tile_size, opts, user_reader, content_box, glow_reader, brand):
+    w, h = tile_size
+    shape = opts["shape"]
+
+    # Themed ring (vector) with its glow (shared low-res image) over it
+    style = _theme_style(opts["theme"], opts["brand_color"])
+    if style is not None:
+        c.saveState()
+        bbox, ring_width, radius = _ring_geometry(tile_size)
+        _set_stroke(c, style[0], ring_width)
+        _outline(c, origin, bbox, shape, ring_width, radius)
+        c.restoreState()
+        c.drawImage(glow_reader, *_rect(origin, [0, 0, w, h]), mask="auto")
+
+    # Sticker clipped to the tile shape (shared image)
+    c.saveState()
+    path = c.beginPath()
+    if shape == "circle":
+        r = min(w, h) // 2
+        cx, cy, _, _ = _rect(origin, [w // 2, h // 2, w // 2, h // 2])
+        path.circle(cx, cy, _pt(r))
+    else:
+        path.roundRect(*_rect(origin, [0, 0, w, h]), _pt(max(8, min(w, h) // 20)))
+    c.clipPath(path, stroke=0, fill=0)
+    c.drawImage(user_reader, *_rect(origin, content_box), mask="auto")
+    c.restoreState()
+
+    # Border (vector; dotted borders use a dash pattern)
+    border = opts["border"]
+    border_px = BORDER_MAP.get(border, 0)
+    if border_px > 0 or border == "dotted":
+        c.saveState()
+        bbox = _border_bbox(tile_size)
+        _set_stroke(c, (0, 0, 0, 230), border_px)
+        if border == "dotted" and shape == "circle":
+            _, _, bw, bh = _rect(origin, _stroke_box(bbox, border_px))
+            arc = _ellipse_perimeter(bw, bh) / 60.0  # 6 degree dots, 6 degree gaps
+            c.setDash([arc, arc])
+        elif border == "dotted":
+            c.setDash([_pt(16), _pt(10)])
+        # The raster renderer's dotted rectangle has square corners
+        radius = 0 if border == "dotted" else max(8, min(w, h) // 20)
+        _outline(c, origin, bbox, shape, border_px, radius)
+        c.restoreState()
+
+    # Branding strip (shared image, cropped to where it lands)
+    if brand is not None:
+        brand_reader, brand_box = brand
+        c.drawImage(brand_reader, *_rect(origin, brand_box), mask="auto")
+
+# Draw a dashed cut line between two points (pixels). Opaque black: the PNG sheet draws its
+# guides with alpha straight onto the canvas and then drops alpha, so they print solid.
+def _dashed_line(c, p1, p2, dash=26, gap=18, color=(0, 0, 0), width=3):
+    page_h = A4[1]
+    c.saveState()
+    _set_stroke(c, color, width)
+    c.setDash([_pt(dash), _pt(gap)])
+    c.line(_pt(p1[0]), page_h - _pt(p1[1]), _pt(p2[0]), page_h - _pt(p2[1]))
+    c.restoreState()
+
+# Create an A4 PDF with the same 2x2 sticker layout as make_a4_sheet (cached by image + options)
+def make_a4_pdf(sticker_png_bytes: bytes, options: dict = None) -> bytes:
+    opts = _sheet_options(options)
+    sheet_key = _sheet_key(opts)
+    cached = cache_get("sheet_pdf", sticker_png_bytes, sheet_key, "v1")
+    if cached:
+        return cached
+
+    layout = _sheet_layout()
+    tile_size = layout["tile_size"]
+    w, h = tile_size
+
+    # Images are embedded once (reportlab dedupes by content) and referenced by every tile
+    user_img = load_rgba(sticker_png_bytes)
+    inset = mm_to_px(BLEED_MM) + mm_to_px(SAFE_PAD_MM)
+    fw, fh = _contain_size(user_img.size, (w - 2 * inset, h - 2 * inset))
+    fx, fy = (w - fw) // 2, (h - fh) // 2
+    content_box = [fx, fy, fx + fw, fy + fh]
+    user_reader = ImageReader(user_img)
+
+    glow = _theme_glow(tile_size, opts["shape"], opts["theme"], opts["brand_color"])
+    glow_reader = ImageReader(glow.reduce(GLOW_REDUCE)) if glow is not None else None
+
+    brand = None
+    if opts["branding"]:
+        layer = _brand_layer(tile_size, opts["brand_text"])
+        box = layer.getbbox()
+        if box:
+            brand = (ImageReader(layer.crop(box)), list(box))
+
+    # Lay out the page
+    out = io.BytesIO()
+    c = canvas.Canvas(out, pagesize=A4)
+    for origin in layout["positions"]:
+        _draw_tile(c, origin, tile_size, opts, user_reader, content_box, glow_reader, brand)
+
+    # Cutting guidelines and sheet border
+    W, H = layout["page_size"]
+    margin = layout["margin"]
+    for x in layout["cuts_x"]:
+        _dashed_line(c, (x, margin), (x, H - margin))
+    for y in layout["cuts_y"]:
+        _dashed_line(c, (margin, y), (W - margin, y))
+    c.saveState()
+    _set_stroke(c, (0, 0, 0), 2)
+    c.rect(*_rect((0, 0), _stroke_box([margin, margin, W - margin, H - margin], 2)), stroke=1, fill=0)
+    c.restoreState()
+
+    with metrics.stage("pdf_encode"):  # images are compressed when the page is written
+        c.showPage()
+        c.save()
+    cache_set("sheet_pdf", sticker_png_bytes, out.getvalue(), sheet_key, "v1")
+    return out.getvalue()
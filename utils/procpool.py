@@ -0,0 +1,243 @@
+import os
+import time
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dotenv import load_dotenv
+from . import metrics
+load_dotenv()
+
+# ---- Process pool for CPU-bound image work (sheets, PDFs, quality gate, local fallback) ----
+PROC_WORKERS  = int(os.getenv("PROC_WORKERS", str(os.cpu_count() or 2)))  # 0 = run inline in the caller
+PROC_WARM     = os.getenv("PROC_WARM", "true").lower() == "true"          # prebuild underlays/fonts per worker
+PROC_RETRIES  = int(os.getenv("PROC_RETRIES", "1"))                       # re-runs of a task lost with a dead worker
+PROC_MEM_MAX_BYTES = int(os.getenv("PROC_MEM_MAX_BYTES", str(32 * 1024 * 1024)))  # memory tier per worker (0 = off)
+SHM_MIN_BYTES = 64 * 1024  # smaller payloads are cheaper to pickle than to map
+
+_executor = None
+_executor_lock = threading.Lock()
+_lock = threading.Lock()
+_in_flight = 0
+_restarts = 0
+_timings = {}  # fn name -> recent (queued_s, run_s)
+_TIMING_WINDOW = 200
+
+
+def _exit_with_parent() -> None:
+    """Worker thread: exit when the web process is gone (killed without shutting the pool down)."""
+    multiprocessing.parent_process().join()
+    os._exit(0)
+
+
+def _warm() -> None:
+    """Worker initializer: import the heavy modules and build the default sheet assets."""
+    from . import warmup, cache
+    threading.Thread(target=_exit_with_parent, name="parent-watch", daemon=True).start()
+    # Each worker would otherwise get a full CACHE_MEM_MAX_BYTES tier of its own. Tasks land on any
+    # worker, so a big per-worker tier mostly holds copies; keep room for one task's sticker and tiles.
+    cache.mem_limit(PROC_MEM_MAX_BYTES)
+    warmup.preload_modules()  # import cost paid here, not on the first task
+    if PROC_WARM:
+        warmup.preload_sheet()
+
+
+def _noop() -> None:
+    pass
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: the web server is threaded, and forking a threaded process can deadlock
+            _executor = ProcessPoolExecutor(max_workers=PROC_WORKERS, initializer=_warm,
+                                            mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def _discard(broken: ProcessPoolExecutor) -> None:
+    """
+    Drop a pool whose worker died (OOM kill, segfault): it fails every later submit with
+    BrokenProcessPool, so the next _pool() call starts a fresh one.
+    """
+    global _executor, _restarts
+    with _executor_lock:
+        if _executor is not broken:
+            return  # another task already replaced it
+        _executor = None
+        _restarts += 1
+    broken.shutdown(wait=False, cancel_futures=True)
+    print(f"[procpool] a worker died; restarting the pool (restart #{_restarts})")
+
+
+def _submit_call(*call):
+    """Submit to the current pool, replacing it once if it is broken already: (pool, future)."""
+    pool = _pool()
+    try:
+        return pool, pool.submit(*call)
+    except BrokenProcessPool:
+        _discard(pool)
+        pool = _pool()
+        return pool, pool.submit(*call)
+
+
+def _lost(fut) -> bool:
+    """The task never finished because its pool broke (it failed or was cancelled with it)."""
+    return fut.cancelled() or isinstance(fut.exception(), BrokenProcessPool)
+
+
+def start() -> None:
+    """Spawn (and warm) every worker now rather than on the first tasks (startup warm-up)."""
+    if PROC_WORKERS <= 0:
+        return
+    # One task per worker: the executor spawns another process while none is idle
+    for _, fut in [_submit_call(_noop) for _ in range(PROC_WORKERS)]:
+        fut.result()
+
+
+def _to_shm(data: bytes):
+    """Copy bytes into a new shared memory block: ("shm", name, size); small payloads pass as-is."""
+    if not isinstance(data, (bytes, bytearray)) or len(data) < SHM_MIN_BYTES:
+        return ("raw", data)
+    shm = shared_memory.SharedMemory(create=True, size=len(data))
+    shm.buf[:len(data)] = data
+    name = shm.name
+    shm.close()
+    return ("shm", name, len(data))
+
+
+def _from_shm(ref, unlink: bool) -> bytes:
+    if ref[0] == "raw":
+        return ref[1]
+    shm = shared_memory.SharedMemory(name=ref[1])
+    try:
+        return bytes(shm.buf[:ref[2]])
+    finally:
+        shm.close()
+        if unlink:
+            shm.unlink()
+
+
+def _pack(value):
+    """Bytes (and bytes inside a top-level tuple/list) go through shared memory."""
+    if isinstance(value, (tuple, list)):
+        return type(value)(_to_shm(v) if isinstance(v, bytes) else ("raw", v) for v in value), True
+    return _to_shm(value), False
+
+
+def _unpack(packed, is_seq: bool, unlink: bool):
+    if is_seq:
+        return type(packed)(_from_shm(ref, unlink) for ref in packed)
+    return _from_shm(packed, unlink)
+
+
+def _call(fn, data_ref, data_is_seq, args, kwargs):
+    """Runs in the worker: map the input, call fn, hand the result (and its stage timings) back."""
+    started = time.time()
+    # The parent unlinks the input blocks once the task is done
+    with metrics.collect() as samples:
+        result = fn(_unpack(data_ref, data_is_seq, unlink=False), *args, **kwargs)
+    packed, is_seq = _pack(result)
+    return packed, is_seq, started, time.time(), samples
+
+
+def submit(fn, data, *args, **kwargs) -> Future:
+    """
+    Schedule fn(data, *args, **kwargs) on a warm worker process; data is bytes or a list/tuple
+    of bytes. fn must be a module-level function. Returns a Future for fn's result.
+    """
+    out = Future()
+    if PROC_WORKERS <= 0:
+        try:
+            out.set_result(fn(data, *args, **kwargs))
+        except Exception as e:
+            out.set_exception(e)
+        return out
+
+    global _in_flight
+    submitted = time.time()
+    timings = metrics.current()  # the submitting request's Server-Timing breakdown
+    data_ref, data_is_seq = _pack(data)
+    with _lock:
+        _in_flight += 1
+
+    def done(fut, pool, retries_left):
+        global _in_flight
+        if _lost(fut):
+            # Every task of the broken pool fails this way; re-run each on a fresh pool. The task that
+            # killed the worker fails again and gets the error once its retries are used up.
+            _discard(pool)
+            if retries_left > 0:
+                dispatch(retries_left - 1)
+                return
+        with _lock:
+            _in_flight -= 1
+        _release(data_ref, data_is_seq)
+        try:
+            packed, is_seq, started, finished, samples = fut.result()
+            result = _unpack(packed, is_seq, unlink=True)
+        except BaseException as e:  # includes CancelledError
+            out.set_exception(e)
+            return
+        metrics.record("pool_queue", started - submitted, timings)
+        metrics.replay(samples, timings)
+        with _lock:
+            window = _timings.setdefault(fn.__name__, [])
+            window.append((started - submitted, finished - started))
+            del window[:-_TIMING_WINDOW]
+        out.set_result(result)
+
+    def dispatch(retries_left):
+        try:
+            pool, fut = _submit_call(_call, fn, data_ref, data_is_seq, args, kwargs)
+        except Exception as e:  # the pool could not start at all
+            pool, fut = None, Future()
+            fut.set_exception(e)
+        fut.add_done_callback(lambda f: done(f, pool, retries_left))
+
+    dispatch(PROC_RETRIES)
+    return out
+
+
+def run(fn, data, *args, **kwargs):
+    """submit() and wait: blocks the calling thread (not the GIL) until the worker is done."""
+    return submit(fn, data, *args, **kwargs).result()
+
+
+def _release(ref, is_seq: bool) -> None:
+    for r in (ref if is_seq else [ref]):
+        if r[0] == "shm":
+            try:
+                shm = shared_memory.SharedMemory(name=r[1])
+                shm.close()
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def stats() -> dict:
+    """Pool size, tasks in flight / waiting for a worker, and recent timings per function."""
+    def pct(values, q):
+        values = sorted(values)
+        return round(values[min(len(values) - 1, int(q * len(values)))], 4) if values else None
+
+    with _lock:
+        in_flight = _in_flight
+        timings = {name: list(w) for name, w in _timings.items()}
+    return {
+        "workers": PROC_WORKERS,
+        "restarts": _restarts,
+        "in_flight": in_flight,
+        "queued": max(0, in_flight - PROC_WORKERS),
+        "tasks": {
+            name: {
+                "samples": len(w),
+                "queued_p50_s": pct([q for q, _ in w], 0.50),
+                "run_p50_s": pct([r for _, r in w], 0.50),
+                "run_p95_s": pct([r for _, r in w], 0.95),
+            }
+            for name, w in timings.items()
+        },
+    }
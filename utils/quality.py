@@ -1,18 +1,111 @@
+import os
+import time
 import numpy as np, cv2
+from .imageload import ImageTooLarge, probe, decoding
 
 BLUR_THRESHOLD = 110.0   # lower = blur
 DARK_THRESHOLD = 60.0    # lower = dark
 
-def assess_quality(image_bytes: bytes) -> dict:
-    arr = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
-    if img is None:
-        return {"ok": False, "blur": 0.0, "brightness": 0.0, "reason": "decode_failed"}
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+# Reduced-resolution fast path: decode straight to grayscale at 1/2, 1/4 or 1/8 size.
+# Only JPEG decodes at that size natively (PNG is decoded in full and then resized, which
+# saves nothing), so "auto" uses it for JPEG only, at the largest scale that keeps the long
+# side >= QUALITY_MIN_SIDE. "1" always runs the full-resolution gate.
+QUALITY_SCALE = os.getenv("QUALITY_SCALE", "auto")
+QUALITY_MIN_SIDE = int(os.getenv("QUALITY_MIN_SIDE", "640"))
+
+_REDUCED_FLAGS = {
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+# Per-scale (lo, hi) bands for the reduced scores, from benchmarks/calibrate_quality.py
+# (1575 JPEG variants of 5 scenes at 1280-6000 px, each scored at the scale the gate picks).
+# Below lo the full-resolution gate would fail the check too, above hi it would pass;
+# inside the band the photo is re-scored at full resolution so verdicts stay the same.
+# On that corpus 86% / 65% / 46% of photos at 1/2 / 1/4 / 1/8 are decided without it.
+BLUR_BANDS = {2: (85.6, 337.3), 4: (26.9, 337.6), 8: (16.3, 409.8)}
+DARK_BANDS = {2: (59.90, 60.10), 4: (59.90, 60.10), 8: (59.85, 60.15)}
+
+
+def _metrics(gray):
     blur = cv2.Laplacian(gray, cv2.CV_64F).var()
-    brightness = float(gray.mean())
+    return float(blur), float(gray.mean())
+
+
+def _verdict(blur, brightness):
     if blur < BLUR_THRESHOLD:
-        return {"ok": False, "blur": float(blur), "brightness": brightness, "reason": "blurry"}
+        return "blurry"
     if brightness < DARK_THRESHOLD:
-        return {"ok": False, "blur": float(blur), "brightness": brightness, "reason": "dark"}
-    return {"ok": True, "blur": float(blur), "brightness": brightness, "reason": None}
+        return "dark"
+    return None
+
+
+def _banded_verdict(blur, brightness, scale):
+    """(decided, reason) from reduced-scale scores; decided=False means re-check at full resolution."""
+    b_lo, b_hi = BLUR_BANDS[scale]
+    if blur < b_lo:
+        return True, "blurry"
+    if blur <= b_hi:
+        return False, None
+    d_lo, d_hi = DARK_BANDS[scale]
+    if brightness < d_lo:
+        return True, "dark"
+    if brightness <= d_hi:
+        return False, None
+    return True, None
+
+
+def _pick_scale(size, fmt):
+    if QUALITY_SCALE != "auto":
+        return int(QUALITY_SCALE)
+    if fmt != "JPEG":
+        return 1
+    long_side = max(size)
+    for s in (8, 4, 2):
+        if long_side // s >= QUALITY_MIN_SIDE:
+            return s
+    return 1
+
+
+def _result(reason, blur, brightness, scale, t0):
+    return {"ok": reason is None, "blur": blur, "brightness": brightness, "reason": reason,
+            "scale": scale, "ms": round((time.perf_counter() - t0) * 1000, 2)}
+
+
+def _decode_failed(t0):
+    return {"ok": False, "blur": 0.0, "brightness": 0.0, "reason": "decode_failed",
+            "scale": 1, "ms": round((time.perf_counter() - t0) * 1000, 2)}
+
+
+def assess_quality(image_bytes: bytes) -> dict:
+    """Blur/brightness gate. Raises imageload.ImageTooLarge past the pixel budget (header check)."""
+    t0 = time.perf_counter()
+    arr = np.frombuffer(image_bytes, np.uint8)
+    try:
+        w, h, fmt = probe(image_bytes)  # header only, no pixel decode
+    except ImageTooLarge:
+        raise
+    except Exception:
+        return _decode_failed(t0)
+
+    # Fast path: reduced grayscale decode, decided when clearly outside the calibrated bands
+    scale = _pick_scale((w, h), fmt)
+    if scale in _REDUCED_FLAGS:
+        with decoding((w // scale) * (h // scale)):
+            gray = cv2.imdecode(arr, _REDUCED_FLAGS[scale])
+        if gray is not None:
+            blur, brightness = _metrics(gray)
+            decided, reason = _banded_verdict(blur, brightness, scale)
+            if decided:
+                return _result(reason, blur, brightness, scale, t0)
+
+    # Full resolution (reference gate)
+    with decoding(w * h * 4):  # BGR plus its grayscale copy
+        img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+        if img is None:
+            return _decode_failed(t0)
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        del img
+    blur, brightness = _metrics(gray)
+    return _result(_verdict(blur, brightness), blur, brightness, 1, t0)
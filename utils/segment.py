@@ -0,0 +1,101 @@
+import os
+import numpy as np, cv2
+
+# ---- Subject segmentation (GrabCut on a downscaled copy) ----
+SEG_MAX_SIDE   = int(os.getenv("SEGMENT_MAX_SIDE", "160"))      # GrabCut working size (long side, px)
+SEG_ITERS      = int(os.getenv("SEGMENT_ITERS", "3"))
+SEG_FEATHER    = float(os.getenv("SEGMENT_FEATHER_PX", "2.5"))   # edge softness at output size (sigma, px)
+SEG_MIN_AREA   = 0.04   # masks covering less of the frame than this are treated as failures
+CROP_PAD       = 0.08   # padding around the subject box, as a fraction of its size
+# Haar face cascade used to seed GrabCut; falls back to a centered box when the file is missing
+FACE_CASCADE   = os.getenv("SEGMENT_FACE_CASCADE") or os.path.join(
+    getattr(getattr(cv2, "data", None), "haarcascades", ""), "haarcascade_frontalface_default.xml")
+
+_face_detector = None
+
+
+def _faces(gray):
+    """Face boxes (x, y, w, h), largest first; empty when no cascade file ships with this OpenCV."""
+    global _face_detector
+    if _face_detector is None:
+        _face_detector = cv2.CascadeClassifier(FACE_CASCADE) if os.path.exists(FACE_CASCADE) else False
+    if not _face_detector:
+        return []
+    min_side = max(16, min(gray.shape) // 10)
+    found = _face_detector.detectMultiScale(gray, 1.15, 4, minSize=(min_side, min_side))
+    return sorted((tuple(int(v) for v in f) for f in found), key=lambda f: f[2] * f[3], reverse=True)
+
+
+def _seed_mask(shape, faces):
+    """
+    GrabCut seed: with a face, a head-and-shoulders box below it is probable foreground and the
+    face itself is definite foreground; without one, a centered portrait box.
+    """
+    h, w = shape
+    mask = np.full((h, w), cv2.GC_BGD, np.uint8)
+    if faces:
+        fx, fy, fw, fh = faces[0]
+        x0, x1 = max(0, fx - int(1.4 * fw)), min(w, fx + fw + int(1.4 * fw))
+        y0 = max(0, fy - int(0.6 * fh))
+        mask[y0:h, x0:x1] = cv2.GC_PR_FGD
+        mask[fy + fh // 5:fy + fh - fh // 5, fx + fw // 5:fx + fw - fw // 5] = cv2.GC_FGD
+    else:
+        mask[int(h * 0.06):h, int(w * 0.14):w - int(w * 0.14)] = cv2.GC_PR_FGD
+    return mask
+
+
+def _largest_component(fg):
+    n, labels, st, _ = cv2.connectedComponentsWithStats(fg, connectivity=8)
+    if n <= 2:
+        return fg
+    keep = 1 + int(np.argmax(st[1:, cv2.CC_STAT_AREA]))
+    return np.where(labels == keep, 255, 0).astype(np.uint8)
+
+
+def subject_mask(bgr):
+    """
+    Feathered uint8 alpha (same size as bgr, 255 = subject) or None if segmentation failed.
+    """
+    h, w = bgr.shape[:2]
+    scale = min(1.0, SEG_MAX_SIDE / max(h, w))
+    small = cv2.resize(bgr, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+
+    seed = _seed_mask(small.shape[:2], _faces(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)))
+    bgd, fgd = np.zeros((1, 65), np.float64), np.zeros((1, 65), np.float64)
+    try:
+        cv2.grabCut(small, seed, None, bgd, fgd, SEG_ITERS, cv2.GC_INIT_WITH_MASK)
+    except cv2.error:
+        return None
+    fg = np.where((seed == cv2.GC_FGD) | (seed == cv2.GC_PR_FGD), 255, 0).astype(np.uint8)
+    fg = _largest_component(cv2.morphologyEx(fg, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8)))
+    if cv2.countNonZero(fg) < SEG_MIN_AREA * fg.size:
+        return None
+
+    # Upsample, then feather so the die-cut edge is soft rather than stair-stepped
+    alpha = cv2.resize(fg, (w, h), interpolation=cv2.INTER_LINEAR)
+    if SEG_FEATHER > 0:
+        alpha = cv2.GaussianBlur(alpha, (0, 0), SEG_FEATHER)
+    return alpha
+
+
+def subject_box(alpha, pad=CROP_PAD):
+    """(x0, y0, x1, y1) around the mask, padded and clamped to the image."""
+    x, y, bw, bh = cv2.boundingRect(cv2.threshold(alpha, 127, 255, cv2.THRESH_BINARY)[1])
+    h, w = alpha.shape[:2]
+    px, py = int(bw * pad), int(bh * pad)
+    return max(0, x - px), max(0, y - py), min(w, x + bw + px), min(h, y + bh + py)
+
+
+def crop_box(bgr, min_gain: float = 0.1):
+    """
+    Padded subject box (x0, y0, x1, y1) for cropping a photo before upload, or None when
+    segmentation fails or the crop would remove less than min_gain of the area.
+    """
+    alpha = subject_mask(bgr)
+    if alpha is None:
+        return None
+    x0, y0, x1, y1 = subject_box(alpha)
+    h, w = bgr.shape[:2]
+    if (x1 - x0) * (y1 - y0) > (1 - min_gain) * w * h:
+        return None
+    return x0, y0, x1, y1
@@ -0,0 +1,160 @@
+import os
+import time
+import threading
+from typing import Optional
+import numpy as np, cv2
+from PIL import Image
+from dotenv import load_dotenv
+from .cache import _db, _lock as _db_lock, _rel, on_clear
+load_dotenv()
+
+# ---- Near-duplicate index for the cartoon cache (64-bit pHash, Hamming search) ----
+SIMILAR_INDEX        = os.getenv("SIMILAR_INDEX", "true").lower() == "true"   # record hashes of new results
+SIMILAR_MAX_DISTANCE = int(os.getenv("SIMILAR_MAX_DISTANCE", "6"))          # differing bits (of 64) still "the same"
+SIMILAR_MAX_AGE_S    = int(os.getenv("SIMILAR_MAX_AGE_S", "900"))           # only reuse recent results (0 = any age)
+SIMILAR_PRUNE_S      = int(os.getenv("SIMILAR_PRUNE_S", "300"))             # drop expired/evicted hashes this often
+
+# entry is the cached cartoon's index path: when the cache evicts or clears it, the trigger drops the hash
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS similar (
+    key     BLOB PRIMARY KEY,
+    phash   INTEGER NOT NULL,
+    created REAL NOT NULL,
+    entry   TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS similar_created ON similar(created);
+CREATE INDEX IF NOT EXISTS similar_entry ON similar(entry);
+
+CREATE TRIGGER IF NOT EXISTS similar_evicted AFTER DELETE ON entries BEGIN
+    DELETE FROM similar WHERE entry = OLD.path;
+END;
+"""
+_pruned = 0.0
+
+
+_POPCOUNT8 = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+
+def _popcount(x):
+    """Per-element bit count of a uint64 array (numpy < 2 has no bitwise_count)."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(x)
+    return _POPCOUNT8[x.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.uint8)
+
+
+def phash(im) -> int:
+    """64-bit perceptual hash: signs of the 8x8 low-frequency DCT of a 32x32 grayscale, vs. their median."""
+    small = np.asarray(im.convert("L").resize((32, 32), Image.BOX), dtype=np.float32)
+    low = cv2.dct(small)[:8, :8].ravel()
+    bits = low > np.median(low[1:])  # the DC term only tracks overall brightness
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+class _Index:
+    """Hashes in one growable uint64 array; search is a vectorized XOR + popcount."""
+
+    def __init__(self):
+        self.hashes = np.zeros(1024, np.uint64)
+        self.created = np.zeros(1024, np.float64)
+        self.keys = []
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def reset(self) -> None:
+        """Forget the in-memory hashes; the next search reloads them from the database."""
+        with self.lock:
+            self.hashes = np.zeros(1024, np.uint64)
+            self.created = np.zeros(1024, np.float64)
+            self.keys = []
+            self.loaded = False
+
+    def _append(self, h: int, key: bytes, created: float) -> None:
+        n = len(self.keys)
+        if n == len(self.hashes):
+            self.hashes = np.resize(self.hashes, 2 * n)
+            self.created = np.resize(self.created, 2 * n)
+        self.hashes[n] = h
+        self.created[n] = created
+        self.keys.append(key)
+
+    def load(self) -> None:
+        """Read the persisted hashes once per process (recent rows only when SIMILAR_MAX_AGE_S is set)."""
+        with self.lock:
+            if self.loaded:
+                return
+            since = time.time() - SIMILAR_MAX_AGE_S if SIMILAR_MAX_AGE_S > 0 else 0
+            with _db_lock:
+                db = _db()
+                if not any(col[1] == "entry" for col in db.execute("PRAGMA table_info(similar)")):
+                    db.execute("DROP TABLE IF EXISTS similar")  # pre-pruning schema: the hashes are only a hint
+                db.executescript(_SCHEMA)
+                rows = db.execute("SELECT key, phash, created FROM similar WHERE created >= ? ORDER BY created",
+                                  (since,)).fetchall()
+            for key, h, created in rows:
+                self._append(h & 0xFFFFFFFFFFFFFFFF, key, created)  # SQLite integers are signed
+            self.loaded = True
+
+    def nearest(self, h: int, max_distance: int, since: float):
+        with self.lock:
+            n = len(self.keys)
+            if n == 0:
+                return None
+            dist = _popcount(self.hashes[:n] ^ np.uint64(h))
+            dist[self.created[:n] < since] = 255
+            i = int(dist.argmin())
+            if dist[i] > max_distance:
+                return None
+            return self.keys[i], int(dist[i])
+
+    def add(self, h: int, key: bytes, created: float) -> None:
+        with self.lock:
+            self._append(h, key, created)
+
+
+_index = _Index()
+
+
+def add(h: int, key: bytes, path: str) -> None:
+    """Remember that the cartoon cached at path (cache.path_for) came from a photo with pHash h."""
+    if not SIMILAR_INDEX:
+        return
+    _index.load()
+    now = time.time()
+    with _db_lock:
+        _db().execute("INSERT OR REPLACE INTO similar (key, phash, created, entry) VALUES (?, ?, ?, ?)",
+                      (key, h - (1 << 64) if h >= 1 << 63 else h, now, _rel(path)))
+    _index.add(h, key, now)
+    if SIMILAR_PRUNE_S > 0 and now - _pruned > SIMILAR_PRUNE_S:
+        prune()
+
+
+def prune() -> int:
+    """
+    Drop hashes older than SIMILAR_MAX_AGE_S or whose cartoon is no longer cached (evicted by the
+    sweep, or lost with a rebuilt index), then reload the in-memory index. Returns rows removed.
+    """
+    global _pruned
+    _pruned = time.time()
+    _index.load()  # creates the table on first use
+    with _db_lock:
+        db = _db()
+        removed = db.execute("DELETE FROM similar WHERE entry NOT IN (SELECT path FROM entries)").rowcount
+        if SIMILAR_MAX_AGE_S > 0:
+            removed += db.execute("DELETE FROM similar WHERE created < ?",
+                                  (_pruned - SIMILAR_MAX_AGE_S,)).rowcount
+    _index.reset()
+    _index.load()
+    return removed
+
+
+def nearest(h: int, max_distance: int = None) -> Optional[tuple]:
+    """(cache key, Hamming distance) of the closest recent photo within max_distance bits, or None."""
+    if not SIMILAR_INDEX:
+        return None
+    _index.load()
+    since = time.time() - SIMILAR_MAX_AGE_S if SIMILAR_MAX_AGE_S > 0 else 0
+    return _index.nearest(h, SIMILAR_MAX_DISTANCE if max_distance is None else max_distance, since)
+
+
+# cache.clear() empties the table through the trigger; drop this process's copy with it
+on_clear(lambda prefix: _index.reset() if prefix in (None, "cartoon") else None)
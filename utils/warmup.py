@@ -0,0 +1,117 @@
+import os
+import time
+import threading
+import multiprocessing
+from dotenv import load_dotenv
+from . import metrics
+load_dotenv()
+
+# ---- Startup warm-up: pay import, asset and index costs once, off the request path ----
+# main.py imports only what the light endpoints need, so the server answers its first request
+# quickly; this thread then loads the rest while the kiosk is still showing the camera screen.
+# Started by the serving entry points (`python main.py`, asgi.py's lifespan); under another WSGI
+# server call warmup.start() from its startup hook. Importing main alone never starts it.
+WARMUP         = os.getenv("WARMUP", "true").lower() == "true"      # warm up in a background thread at startup
+WARMUP_AFTER_S = float(os.getenv("WARMUP_AFTER_S", "2.0"))          # start after the first response, or this long
+
+_loaded = time.time()  # fallback process start where /proc is not available
+_lock = threading.Lock()
+_thread = None
+_served = threading.Event()
+_state = {"state": "idle", "seconds": None, "steps": {}, "error": None, "first_response_s": None}
+
+
+def _process_started() -> float:
+    """Wall-clock start of this process (Linux /proc), else when this module was imported."""
+    try:
+        with open("/proc/self/stat") as f:
+            ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat") as f:
+            boot = next(int(line.split()[1]) for line in f if line.startswith("btime"))
+        return boot + ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, StopIteration):
+        return _loaded
+
+
+def preload_modules() -> None:
+    """Import the heavy libraries behind the image endpoints (OpenCV, NumPy, requests, ReportLab)."""
+    import cv2  # noqa: F401
+    import numpy  # noqa: F401
+    import requests  # noqa: F401
+    from . import quality, local_cartoon, segment, similar, pdf_sheet  # noqa: F401
+
+
+def preload_sheet() -> None:
+    """Build the memoized sheet assets for the default layout: brand icon/font, masks, underlays."""
+    from . import image_sheet
+    image_sheet._load_brand_icon()
+    image_sheet._brand_font()
+    tile_size = image_sheet._sheet_layout()["tile_size"]
+    image_sheet._brand_patch(tile_size, "")
+    for shape in ("circle", "rounded"):
+        image_sheet._shape_mask(tile_size, shape)
+        for border in image_sheet.BORDER_MAP:
+            image_sheet._border_patch(tile_size, shape, border)
+        for theme in ("gold", "neon", "brand"):
+            image_sheet._theme_underlay(tile_size, shape, theme)
+
+
+def run() -> dict:
+    """
+    Warm this process: validate the cache index, import the heavy modules, prune and load the pHash index,
+    then either start the process pool (its workers build the sheet assets) or build them here.
+    """
+    _served.wait(WARMUP_AFTER_S)  # don't compete with the first request for the CPU
+    from . import cache, procpool, similar  # similar imports NumPy and OpenCV
+    steps = {"cache_index": cache.check_index, "imports": preload_modules, "similar_index": similar.prune}
+    if procpool.PROC_WORKERS > 0:
+        steps["pool"] = procpool.start
+    else:
+        steps["sheet_assets"] = preload_sheet
+
+    t0 = time.perf_counter()
+    _state["state"] = "running"
+    try:
+        for name, fn in steps.items():
+            t = time.perf_counter()
+            result = fn()
+            _state["steps"][name] = round(time.perf_counter() - t, 3)
+            if name == "cache_index" and not result["ok"]:
+                print("[warmup] cache index was corrupt; rebuilt from the files on disk")
+        _state["state"] = "done"
+    except Exception as e:
+        _state["state"] = "failed"
+        _state["error"] = str(e)
+    _state["seconds"] = round(time.perf_counter() - t0, 3)
+    print(f"[warmup] {_state['state']} in {_state['seconds']:.2f}s {_state['steps']}")
+    return status()
+
+
+def start() -> None:
+    """Run the warm-up once, in a daemon thread (no-op with WARMUP=false and in pool workers)."""
+    global _thread
+    if not WARMUP or multiprocessing.parent_process() is not None:
+        return
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=run, name="warmup", daemon=True)
+            _thread.start()
+
+
+def note_response() -> None:
+    """Record the time from process start to the first response sent (once)."""
+    if _state["first_response_s"] is None:
+        with _lock:
+            if _state["first_response_s"] is None:
+                _state["first_response_s"] = round(time.time() - _process_started(), 3)
+                print(f"[startup] first response {_state['first_response_s']:.2f}s after process start")
+        _served.set()
+
+
+def status() -> dict:
+    """Warm-up state (idle | running | done | failed), per-step seconds and the first-response time."""
+    return {**_state, "steps": dict(_state["steps"])}
+
+
+metrics.describe("booth_first_response_seconds", "Process start to the first response sent.")
+metrics.describe("booth_warmup_seconds", "Startup warm-up duration, by step (see utils/warmup.py).")